@@ -0,0 +1,147 @@
+# ============================================
+# Auto Replies - ردود سريعة (تطابق كامل / بداية / كلمة داخل الرسالة)
+#
+# شكل ملف autoreplies.txt (الفاصل | أو =):
+#   سلام|وعليكم السلام          -> الرسالة كلها "سلام"
+#   صباح*|صباح النور            -> الرسالة تبدأ بـ "صباح"
+#   *شكرا*|العفو                -> "شكرا" ككلمة داخل الرسالة
+#
+# التطابق الكامل يدخل جدول الـ router (بحث dict واحد). البداية والاحتواء
+# في Aho-Corasick واحد على المفاتيح بعد normalize_text، فكلفة البحث خطية
+# في طول الرسالة مهما زاد عدد الردود.
+# ============================================
+
+from collections import deque
+from typing import Callable, Dict, List, NamedTuple, Optional
+import os
+
+EXACT = 0
+CONTAINS = 1
+PREFIX = 2
+
+# الأولوية: البداية أقوى من الاحتواء، ثم المفتاح الأطول، ثم السطر الأحدث في الملف
+KIND_PRIORITY = {PREFIX: 2, CONTAINS: 1, EXACT: 0}
+
+
+class Rule(NamedTuple):
+    trigger: str
+    reply: str
+    kind: int
+    rank: tuple
+
+
+def parse_line(line: str):
+    """
+    يرجع (المفتاح، الرد، النوع) أو None. الفاصل هو أول | أو = في السطر.
+    """
+    line = line.strip()
+    if not line or line.startswith("#"):
+        return None
+    positions = [i for i in (line.find("|"), line.find("=")) if i > 0]
+    if not positions:
+        return None
+    sep = min(positions)
+    key, reply = line[:sep].strip(), line[sep + 1:].strip()
+    if not reply:
+        return None
+    if len(key) > 2 and key.startswith("*") and key.endswith("*"):
+        return key[1:-1], reply, CONTAINS
+    if len(key) > 1 and key.endswith("*"):
+        return key[:-1], reply, PREFIX
+    return key, reply, EXACT
+
+
+def load_rules(filename: str, normalize: Callable[[str], str]) -> List[Rule]:
+    if not os.path.exists(filename):
+        return []
+    rules = []
+    with open(filename, "r", encoding="utf-8") as f:
+        for line_no, line in enumerate(f):
+            parsed = parse_line(line)
+            if parsed is None:
+                continue
+            key, reply, kind = parsed
+            trigger = normalize(key)
+            if trigger:
+                rules.append(Rule(trigger, reply, kind, (KIND_PRIORITY[kind], len(trigger), line_no)))
+    return rules
+
+
+def _is_word_boundary(text: str, start: int, end: int) -> bool:
+    return (start == 0 or not text[start - 1].isalnum()) and (end == len(text) or not text[end].isalnum())
+
+
+class AutoReplyEngine:
+    """
+    exact: dict للتطابق الكامل (يُمرَّر لـ MessageRouter.set_replies).
+    match(normalized): أفضل رد بداية/احتواء أو None.
+    """
+
+    def __init__(self, rules: List[Rule]):
+        self.exact: Dict[str, str] = {}
+        self._goto: List[Dict[str, int]] = [{}]
+        self._fail: List[int] = [0]
+        self._out: List[List[Rule]] = [[]]
+        self._link: List[int] = [0]  # أقرب node (عبر fail) له مفاتيح تنتهي عنده
+        self.patterns = 0
+
+        for rule in rules:
+            if rule.kind == EXACT:
+                self.exact[rule.trigger] = rule.reply
+            else:
+                self._insert(rule)
+        self._build()
+
+    def __len__(self) -> int:
+        return len(self.exact) + self.patterns
+
+    def _insert(self, rule: Rule) -> None:
+        node = 0
+        for ch in rule.trigger:
+            nxt = self._goto[node].get(ch)
+            if nxt is None:
+                nxt = len(self._goto)
+                self._goto[node][ch] = nxt
+                self._goto.append({})
+                self._fail.append(0)
+                self._out.append([])
+                self._link.append(0)
+            node = nxt
+        self._out[node].append(rule)
+        self.patterns += 1
+
+    def _build(self) -> None:
+        goto, fail, out, link = self._goto, self._fail, self._out, self._link
+        queue = deque(goto[0].values())
+        while queue:
+            node = queue.popleft()
+            for ch, child in goto[node].items():
+                queue.append(child)
+                f = fail[node]
+                while f and ch not in goto[f]:
+                    f = fail[f]
+                fail[child] = goto[f].get(ch, 0) if goto[f].get(ch, 0) != child else 0
+                link[child] = fail[child] if out[fail[child]] else link[fail[child]]
+
+    def match(self, text: str) -> Optional[str]:
+        if not self.patterns:
+            return None
+        goto, fail, out, link = self._goto, self._fail, self._out, self._link
+        best: Optional[Rule] = None
+        node = 0
+        for end, ch in enumerate(text, 1):
+            while node and ch not in goto[node]:
+                node = fail[node]
+            node = goto[node].get(ch, 0)
+            hit = node if out[node] else link[node]
+            while hit:
+                for rule in out[hit]:
+                    start = end - len(rule.trigger)
+                    if rule.kind == PREFIX:
+                        ok = start == 0
+                    else:
+                        ok = _is_word_boundary(text, start, end)
+                    if ok and (best is None or rule.rank > best.rank):
+                        best = rule
+                hit = link[hit]
+        return best.reply if best else None
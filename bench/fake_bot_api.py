@@ -0,0 +1,152 @@
+# ============================================
+# Fake Bot API - بديل محلي لـ api.telegram.org للقياس
+#
+# تطبيق ASGI صغير يرد على /bot<token>/<method> بنتيجة ثابتة بعد
+# latency ثانية (زمن الشبكة + Telegram)، ويسجل كل طلب في calls.
+#
+#   api = FakeBotAPI(latency=0.02)
+#   base_url = api.serve(port=8999)   # يشتغل في thread
+#   bot = Bot(token, base_url=base_url)
+#
+# - fail(chat_id, "429" | "403"): أخطاء تيليجرام لمحادثة معينة (429 مرة واحدة،
+#   403 دائماً كأن البوت مطرود).
+# - push_updates(...): تحديثات يستلمها البوت عبر getUpdates (long polling).
+# ============================================
+
+from collections import Counter, deque
+from typing import Deque, Dict, Iterable, List, Tuple
+from urllib.parse import parse_qs
+import asyncio
+import json
+import threading
+import time
+
+import uvicorn
+from uvicorn.protocols.http.h11_impl import H11Protocol
+
+
+class FakeBotAPI:
+    def __init__(self, latency: float = 0.02):
+        self.latency = latency
+        self.calls: List[Tuple[str, dict]] = []
+        self.methods: Counter = Counter()
+        self.errors: Counter = Counter()  # الأخطاء التي أُرجعت حسب الرمز
+        self.connections = 0  # اتصالات TCP المفتوحة منذ البداية
+        self.record_calls = True
+        self._message_id = 0
+        self._failures: Dict[int, Tuple[int, int]] = {}  # chat_id -> (الرمز، retry_after)
+        self._updates: Deque[dict] = deque()
+
+    # ---------- تحكم من الاختبار ----------
+    def fail(self, chat_id: int, kind: str, retry_after: int = 1) -> None:
+        self._failures[chat_id] = (int(kind), retry_after)
+
+    def push_updates(self, updates: Iterable[dict]) -> None:
+        self._updates.extend(updates)
+
+    @property
+    def pending_updates(self) -> int:
+        return len(self._updates)
+
+    def _error(self, chat_id: int):
+        failure = self._failures.get(chat_id)
+        if failure is None:
+            return None
+        code, retry_after = failure
+        self.errors[code] += 1
+        if code == 429:
+            del self._failures[chat_id]
+            return {
+                "ok": False,
+                "error_code": 429,
+                "description": f"Too Many Requests: retry after {retry_after}",
+                "parameters": {"retry_after": retry_after},
+            }
+        return {"ok": False, "error_code": 403, "description": "Forbidden: bot was kicked from the group chat"}
+
+    async def _get_updates(self, params: dict) -> list:
+        deadline = time.monotonic() + float(params.get("timeout", 0) or 0)
+        limit = int(params.get("limit", 100) or 100)
+        while not self._updates and time.monotonic() < deadline:
+            await asyncio.sleep(0.005)
+        out = []
+        while self._updates and len(out) < limit:
+            out.append(self._updates.popleft())
+        return out
+
+    def result(self, method: str, params: dict):
+        if method == "getMe":
+            return {"id": 1, "is_bot": True, "first_name": "bench", "username": "bench_bot"}
+        if method in ("sendMessage", "editMessageText"):
+            self._message_id += 1
+            chat_id = int(params.get("chat_id", 1))
+            return {
+                "message_id": self._message_id,
+                "date": int(time.time()),
+                "chat": {"id": chat_id, "type": "group" if chat_id < 0 else "private"},
+                "text": params.get("text", ""),
+            }
+        if method == "getWebhookInfo":
+            return {"url": "", "has_custom_certificate": False, "pending_update_count": 0}
+        return True
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] == "lifespan":
+            while True:
+                message = await receive()
+                if message["type"] == "lifespan.startup":
+                    await send({"type": "lifespan.startup.complete"})
+                else:
+                    await send({"type": "lifespan.shutdown.complete"})
+                    return
+        body = b""
+        while True:
+            message = await receive()
+            body += message.get("body", b"")
+            if not message.get("more_body"):
+                break
+
+        method = scope["path"].rsplit("/", 1)[-1]
+        if body.startswith(b"{"):
+            params = json.loads(body)
+        else:
+            params = {k: v[0] for k, v in parse_qs(body.decode()).items()}
+        self.methods[method] += 1
+        if self.record_calls:
+            self.calls.append((method, params))
+
+        if method == "getUpdates":
+            response = {"ok": True, "result": await self._get_updates(params)}
+        else:
+            if self.latency:
+                await asyncio.sleep(self.latency)
+            response = None
+            if "chat_id" in params and method.startswith(("send", "edit")):
+                response = self._error(int(params["chat_id"]))
+            if response is None:
+                response = {"ok": True, "result": self.result(method, params)}
+        out = json.dumps(response).encode()
+        await send({
+            "type": "http.response.start",
+            "status": 200 if response["ok"] else response["error_code"],
+            "headers": [(b"content-type", b"application/json"), (b"content-length", str(len(out)).encode())],
+        })
+        await send({"type": "http.response.body", "body": out})
+
+    def serve(self, host: str = "127.0.0.1", port: int = 8999) -> str:
+        """
+        يشغّل السيرفر في thread ويرجع base_url المناسب لـ Bot(base_url=...).
+        """
+        api = self
+
+        class _Protocol(H11Protocol):
+            def connection_made(self, transport):
+                api.connections += 1
+                super().connection_made(transport)
+
+        config = uvicorn.Config(self, host=host, port=port, http=_Protocol, log_level="warning")
+        server = uvicorn.Server(config)
+        threading.Thread(target=server.run, daemon=True).start()
+        while not server.started:
+            time.sleep(0.01)
+        return f"http://{host}:{port}/bot"
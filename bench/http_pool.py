@@ -0,0 +1,118 @@
+# ============================================
+# HTTP pool benchmark - مقارنة إعدادات pool الاتصالات مع Fake Bot API
+#
+#   python bench/http_pool.py [--messages 2000] [--concurrency 64] [--latency 0.02]
+#
+# لكل إعداد: عدد الرسائل في الثانية، p95 لانتظار الـ pool و p95 للطلب،
+# وعدد اتصالات TCP التي فتحها (keep-alive يعيد استخدامها).
+# ثم زمن ردود المستخدمين أثناء إذاعة: pool مشتركة مقابل pools منفصلة.
+# ============================================
+
+import argparse
+import asyncio
+import statistics
+import os
+import sys
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from telegram import Bot  # noqa: E402
+from telegram.request import HTTPXRequest  # noqa: E402
+
+from bot_http import POOL_METRICS, build_request  # noqa: E402
+from fake_bot_api import FakeBotAPI  # noqa: E402
+
+TOKEN = "1:bench"
+
+
+def configs(concurrency: int):
+    return [
+        ("ptb default", lambda: HTTPXRequest(connect_timeout=30.0, read_timeout=30.0)),
+        ("pool=8", lambda: build_request("pool=8", pool_size=8)),
+        ("pool=64 no keep-alive", lambda: build_request("pool=64 no keep-alive", pool_size=64, keepalive=0)),
+        ("pool=64", lambda: build_request("pool=64", pool_size=64)),
+        (f"pool={concurrency * 2}", lambda: build_request(f"pool={concurrency * 2}", pool_size=concurrency * 2)),
+    ]
+
+
+async def run(name, make_request, api, base_url, messages, concurrency):
+    bot = Bot(TOKEN, base_url=base_url, request=make_request())
+    await bot.initialize()
+    sem = asyncio.Semaphore(concurrency)
+    connections = api.connections
+
+    async def one(i):
+        async with sem:
+            await bot.send_message(chat_id=-1000 - i % 500, text="bench")
+
+    started = time.perf_counter()
+    await asyncio.gather(*(one(i) for i in range(messages)))
+    elapsed = time.perf_counter() - started
+    await bot.shutdown()
+
+    metrics = POOL_METRICS.get(name)
+    wait = f"{metrics.pool_wait.quantile(0.95) * 1000:10.0f}" if metrics else f"{'-':>10}"
+    latency = f"{metrics.latency.quantile(0.95) * 1000:10.0f}" if metrics else f"{'-':>10}"
+    print(f"{name:<24}{messages / elapsed:10.0f}{wait}{latency}{api.connections - connections:8d}")
+
+
+async def mixed(base_url, pool_size, messages, concurrency, separate):
+    """
+    إذاعة بـ concurrency طلب متزامن على pool أصغر منها، ومعها 50 رداً
+    متتالياً لمستخدمين.
+    يرجع (p50, max) لزمن الرد بالملي ثانية.
+    """
+    bulk = Bot(TOKEN, base_url=base_url, request=build_request("mixed bulk", pool_size=pool_size))
+    interactive = bulk
+    if separate:
+        interactive = Bot(TOKEN, base_url=base_url, request=build_request("mixed interactive", pool_size=pool_size))
+    for bot in {bulk, interactive}:
+        await bot.initialize()
+
+    sem = asyncio.Semaphore(concurrency)
+
+    async def broadcast(i):
+        async with sem:
+            await bulk.send_message(chat_id=-1000 - i, text="podcast")
+
+    async def replies():
+        times = []
+        await asyncio.sleep(0.2)
+        for i in range(50):
+            started = time.perf_counter()
+            await interactive.send_message(chat_id=i + 1, text="reply")
+            times.append((time.perf_counter() - started) * 1000)
+            await asyncio.sleep(0.02)
+        return times
+
+    *_, times = await asyncio.gather(*(broadcast(i) for i in range(messages)), replies())
+    for bot in {bulk, interactive}:
+        await bot.shutdown()
+    return statistics.median(times), max(times)
+
+
+async def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--messages", type=int, default=2000)
+    parser.add_argument("--concurrency", type=int, default=64)
+    parser.add_argument("--latency", type=float, default=0.02)
+    parser.add_argument("--port", type=int, default=8999)
+    args = parser.parse_args()
+
+    api = FakeBotAPI(latency=args.latency)
+    base_url = api.serve(port=args.port)
+    print(f"{args.messages} sendMessage, concurrency {args.concurrency}, API latency {args.latency * 1000:.0f} ms")
+    print(f"{'config':<24}{'msg/s':>10}{'wait p95':>10}{'req p95':>10}{'conns':>8}")
+    for name, make_request in configs(args.concurrency):
+        await run(name, make_request, api, base_url, args.messages, args.concurrency)
+
+    print()
+    print(f"user replies during a {args.messages} message broadcast (ms)")
+    for separate in (False, True):
+        p50, worst = await mixed(base_url, args.concurrency // 2, args.messages, args.concurrency, separate)
+        print(f"{'separate pools' if separate else 'shared pool':<24}{'p50':>6}{p50:8.0f}{'max':>6}{worst:8.0f}")
+
+
+if __name__ == "__main__":
+    asyncio.run(main())
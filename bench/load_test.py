@@ -0,0 +1,279 @@
+# ============================================
+# Load Test - تشغيل main.py تحت ضغط مع Fake Bot API محلي
+#
+#   python bench/load_test.py                      # polling ثم webhook
+#   python bench/load_test.py --mode webhook --rounds 10 --updates 5000
+#   python bench/load_test.py --unlimited          # بدون حدود السبام والإرسال
+#
+# كل وضع يعمل في عملية منفصلة (main.py يُحمَّل مرة واحدة لكل عملية) وفي
+# مجلد مؤقت فيه نسخة من ملفات الأسئلة، فلا تتغير ملفات المشروع.
+#
+# لكل جولة: عدد التحديثات في الثانية، p50/p99 لزمن المعالجة (من دخول
+# التحديث للمعالج حتى انتهائه، شاملاً انتظار تحديثات نفس المحادثة)، و RSS.
+# بعد الجولات: زمن حفظ الإحصائيات (save_stats)، ثم /podcast لكل القروبات
+# مع قروبات تُرجع 403 و 429، ثم أبطأ الـ handlers وتأخر event loop (metrics).
+# ============================================
+
+import argparse
+import asyncio
+import contextlib
+import glob
+import os
+import shutil
+import subprocess
+import sys
+import tempfile
+import time
+
+BENCH_DIR = os.path.dirname(os.path.abspath(__file__))
+REPO_DIR = os.path.dirname(BENCH_DIR)
+sys.path.insert(0, REPO_DIR)
+sys.path.insert(0, BENCH_DIR)
+
+from fake_bot_api import FakeBotAPI  # noqa: E402
+from updates import UpdateFactory  # noqa: E402
+
+OUT = sys.stdout
+
+
+def report(*args) -> None:
+    print(*args, file=OUT, flush=True)
+
+
+def rss_mb() -> float:
+    with open("/proc/self/statm") as f:
+        pages = int(f.read().split()[1])
+    return pages * os.sysconf("SC_PAGE_SIZE") / (1024 * 1024)
+
+
+def percentile(values, q: float) -> float:
+    if not values:
+        return 0.0
+    ordered = sorted(values)
+    return ordered[min(len(ordered) - 1, int(q * len(ordered)))]
+
+
+def prepare_workdir() -> str:
+    """
+    مجلد مؤقت فيه ملفات المحتوى فقط (بدون used_*.txt وبدون أي حالة سابقة).
+    """
+    workdir = tempfile.mkdtemp(prefix="bot-load-")
+    for path in glob.glob(os.path.join(REPO_DIR, "*.txt")):
+        name = os.path.basename(path)
+        if not name.startswith("used_"):
+            shutil.copy(path, workdir)
+    return workdir
+
+
+class Recorder:
+    """
+    يقيس زمن كل تحديث داخل update_processor الخاص بالبوت.
+    """
+
+    def __init__(self, processor_cls):
+        self.latencies = []
+        self.processed = 0
+        original = processor_cls.process_update
+        recorder = self
+
+        async def timed(processor, update, coroutine):
+            started = time.perf_counter()
+            try:
+                await original(processor, update, coroutine)
+            finally:
+                recorder.latencies.append(time.perf_counter() - started)
+                recorder.processed += 1
+
+        processor_cls.process_update = timed
+
+    async def wait_for(self, total: int, timeout: float = 300) -> None:
+        deadline = time.monotonic() + timeout
+        while self.processed < total:
+            if time.monotonic() > deadline:
+                raise TimeoutError(f"processed {self.processed}/{total}")
+            await asyncio.sleep(0.01)
+
+
+# =============================
+# تشغيل وضع واحد (داخل عملية فرعية)
+# =============================
+async def drive(args, main, api: FakeBotAPI, recorder: Recorder, deliver) -> None:
+    factory = UpdateFactory(groups=args.groups, users=args.users)
+    dead = factory.groups[:: max(1, int(1 / args.dead_ratio))] if args.dead_ratio else []
+    for chat_id in dead:
+        api.fail(chat_id, "403")
+
+    report(f"{'round':>5}{'updates':>9}{'upd/s':>8}{'p50 ms':>8}{'p99 ms':>8}{'rss MB':>8}{'outbox':>8}")
+    rss_start = rss_mb()
+    total = 0
+    for n in range(1, args.rounds + 1):
+        batch = list(factory.mix(args.updates))
+        for chat_id in factory.rng.sample(factory.groups, args.storms):
+            batch.extend(factory.truth_dare_storm(chat_id, players=args.players))
+        recorder.latencies = []
+        total += len(batch)
+        started = time.perf_counter()
+        await deliver(batch)
+        await recorder.wait_for(total)
+        elapsed = time.perf_counter() - started
+        lat = recorder.latencies
+        report(
+            f"{n:>5}{len(batch):>9}{len(batch) / elapsed:>8.0f}"
+            f"{percentile(lat, 0.5) * 1000:>8.1f}{percentile(lat, 0.99) * 1000:>8.1f}"
+            f"{rss_mb():>8.1f}{main.OUTBOX.pending:>8}"
+        )
+    report(f"memory growth: {rss_mb() - rss_start:+.1f} MB over {total} updates")
+
+    # ---------- save_stats ----------
+    started = time.perf_counter()
+    main.STATS_SAVER.flush()
+    report(
+        f"save_stats flush: {(time.perf_counter() - started) * 1000:.1f} ms "
+        f"({len(main.UNIQUE_GROUPS)} groups, {len(main.UNIQUE_USERS)} users)"
+    )
+
+    # ---------- /podcast ----------
+    for chat_id in factory.rng.sample(factory.groups, 3):
+        api.fail(chat_id, "429")
+    developer = {"id": 1, "is_bot": False, "first_name": "dev", "username": main.DEVELOPER_USERNAME_RAW}
+    api.errors.clear()
+    sent_before = api.methods["sendMessage"]
+    started = time.perf_counter()
+    await deliver([factory.message(1, 1, "/podcast رسالة تجريبية", user=developer)])
+    await recorder.wait_for(total + 1)
+    while main.BROADCASTS.task is None:
+        await asyncio.sleep(0.01)
+    await main.BROADCASTS.task
+    progress = main.BROADCASTS.progress
+    report(
+        f"podcast: {len(main.BROADCASTS.job['chat_ids'])} groups in {time.perf_counter() - started:.1f} s, "
+        f"sent {progress.sent}, pruned {progress.pruned}, "
+        f"429 {api.errors[429]}, 403 {api.errors[403]}, API sends {api.methods['sendMessage'] - sent_before}"
+    )
+    report(
+        f"outbox: sent {main.OUTBOX.sent}, failed {main.OUTBOX.failed}, retried {main.OUTBOX.retried}; "
+        f"flood shed: chat {main.FLOOD_SHED['chat']}, user {main.FLOOD_SHED['user']}"
+    )
+
+    # ---------- metrics (نفس أرقام /metrics) ----------
+    from metrics import HANDLER_LATENCY, LOOP_LAG
+
+    slowest = sorted(HANDLER_LATENCY.items(), key=lambda kv: kv[1].quantile(0.95), reverse=True)
+    report("handler p95: " + ", ".join(
+        f"{name} {h.quantile(0.95) * 1000:.0f} ms ({h.count})" for name, h in slowest[:5] if h.count
+    ))
+    report(f"event loop lag: p95 {LOOP_LAG.quantile(0.95) * 1000:.0f} ms, max {LOOP_LAG.max * 1000:.0f} ms")
+
+
+async def run_polling(args, main, api, recorder) -> None:
+    app = main.app
+
+    async def deliver(batch):
+        api.push_updates(batch)
+
+    await app.initialize()
+    await main.start_services(app)
+    await app.updater.start_polling(poll_interval=0.0, timeout=1)
+    await app.start()
+    try:
+        await drive(args, main, api, recorder, deliver)
+    finally:
+        await app.updater.stop()
+        await app.stop()
+        await main.stop_services(app)
+        await app.shutdown()
+
+
+async def run_webhook(args, main, api, recorder) -> None:
+    import httpx
+    import uvicorn
+
+    config = uvicorn.Config(main.asgi_app, host="127.0.0.1", port=args.port + 1, log_level="warning")
+    server = uvicorn.Server(config)
+    serving = asyncio.create_task(server.serve())
+    while not server.started:
+        await asyncio.sleep(0.01)
+
+    url = f"http://127.0.0.1:{args.port + 1}{main.WEBHOOK_PATH}"
+    async with httpx.AsyncClient(limits=httpx.Limits(max_connections=16)) as client:
+        sem = asyncio.Semaphore(16)
+
+        async def post(update):
+            async with sem:
+                await client.post(url, json=update)
+
+        async def deliver(batch):
+            await asyncio.gather(*(post(u) for u in batch))
+
+        try:
+            await drive(args, main, api, recorder, deliver)
+        finally:
+            server.should_exit = True
+            await serving
+
+
+def run_mode(args) -> None:
+    api = FakeBotAPI(latency=args.latency)
+    api.record_calls = False
+    base_url = api.serve(port=args.port)
+
+    os.chdir(prepare_workdir())
+    os.environ.update({
+        "TELEGRAM_BOT_TOKEN": "1:bench",
+        "BOT_API_URL": base_url,
+        "RUN_MODE": args.mode,
+        "CONTENT_RELOAD_INTERVAL": "0",
+    })
+    if args.unlimited:
+        os.environ.update({
+            "FLOOD_CHAT_RATE": "1e9", "FLOOD_CHAT_BURST": "1e9",
+            "FLOOD_USER_RATE": "1e9", "FLOOD_USER_BURST": "1e9",
+            "OUTBOX_RATE": "1e9", "OUTBOX_GROUP_PER_MIN": "1e9",
+        })
+
+    # مخرجات البوت (⚠️ ... وأخطاء الـ handlers) تذهب لملف حتى يبقى التقرير مقروءاً
+    log_path = os.path.abspath("bot.log")
+    with open(log_path, "w", encoding="utf-8") as log, \
+            contextlib.redirect_stdout(log), contextlib.redirect_stderr(log):
+        import main
+        from webhook_server import ChatOrderedUpdateProcessor
+
+        recorder = Recorder(ChatOrderedUpdateProcessor)
+        report(
+            f"== {args.mode}: {args.rounds} rounds x ({args.updates} updates + {args.storms} truth/dare storms), "
+            f"{args.groups} groups, API latency {args.latency * 1000:.0f} ms =="
+        )
+        runner = run_polling if args.mode == "polling" else run_webhook
+        asyncio.run(runner(args, main, api, recorder))
+    with open(log_path, encoding="utf-8") as f:
+        lines = f.readlines()
+    warnings = sum(1 for line in lines if line.startswith("⚠️"))
+    errors = sum(1 for line in lines if line.startswith("Traceback"))
+    report(f"bot warnings: {warnings}, handler errors: {errors} (see {log_path})")
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--mode", choices=("polling", "webhook", "both"), default="both")
+    parser.add_argument("--rounds", type=int, default=5)
+    parser.add_argument("--updates", type=int, default=2000, help="تحديثات عادية في كل جولة")
+    parser.add_argument("--storms", type=int, default=2, help="ألعاب تحدي/صراحة في كل جولة")
+    parser.add_argument("--players", type=int, default=50)
+    parser.add_argument("--groups", type=int, default=200)
+    parser.add_argument("--users", type=int, default=2000)
+    parser.add_argument("--dead-ratio", type=float, default=0.05, help="نسبة القروبات التي ترجع 403")
+    parser.add_argument("--latency", type=float, default=0.02)
+    parser.add_argument("--port", type=int, default=8990)
+    parser.add_argument("--unlimited", action="store_true")
+    args = parser.parse_args()
+
+    if args.mode != "both":
+        run_mode(args)
+        return
+    for mode in ("polling", "webhook"):
+        argv = [a for a in sys.argv[1:]]
+        subprocess.run([sys.executable, os.path.abspath(__file__), *argv, "--mode", mode], check=True)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,119 @@
+# ============================================
+# Synthetic Updates - تحديثات تيليجرام مصطنعة للقياس
+#
+# UpdateFactory يولّد dicts بصيغة Bot API (كما تصل من getUpdates أو الـ webhook):
+# - chatter: كلام عادي في القروبات (لا يطابق أي لعبة، يمر على الإحصائيات فقط).
+# - trigger: كلمات الألعاب والردود السريعة.
+# - private: رسائل خاصة.
+# - truth_dare_storm: بدء تحدي/صراحة ثم عشرات الضغطات على الأزرار معاً.
+# ============================================
+
+from typing import Iterator, List
+import random
+import time
+
+CHATTER = (
+    "هلا والله", "شلونكم", "صباح الخير", "ههههههه", "تمام الحمد لله",
+    "وين الناس", "مساء النور يا جماعة", "أحد صاحي؟", "ok", "😂😂",
+)
+TRIGGERS = (
+    "كتت", "لو", "من", "حقائق", "عام", "اجابه", "جريمة", "حل", "العاب",
+    "سلام", "كـتـت", "حَقائق",
+)
+
+
+class UpdateFactory:
+    def __init__(self, groups: int = 200, users: int = 2000, seed: int = 1):
+        self.rng = random.Random(seed)
+        self.groups = [-1001000000000 - i for i in range(groups)]
+        self.users = list(range(100000, 100000 + users))
+        self._update_id = 0
+        self._message_id = 0
+
+    def _next_ids(self):
+        self._update_id += 1
+        self._message_id += 1
+        return self._update_id, self._message_id
+
+    @staticmethod
+    def _user(user_id: int) -> dict:
+        return {"id": user_id, "is_bot": False, "first_name": f"user{user_id}", "username": f"u{user_id}"}
+
+    @staticmethod
+    def _chat(chat_id: int) -> dict:
+        if chat_id > 0:
+            return {"id": chat_id, "type": "private", "first_name": f"user{chat_id}"}
+        return {"id": chat_id, "type": "supergroup", "title": f"group {chat_id}"}
+
+    # ---------- تحديث واحد ----------
+    def message(self, chat_id: int, user_id: int, text: str, user: dict = None) -> dict:
+        update_id, message_id = self._next_ids()
+        message = {
+            "message_id": message_id,
+            "date": int(time.time()),
+            "chat": self._chat(chat_id),
+            "from": user or self._user(user_id),
+            "text": text,
+        }
+        if text.startswith("/"):
+            command = text.split()[0]
+            message["entities"] = [{"type": "bot_command", "offset": 0, "length": len(command)}]
+        return {"update_id": update_id, "message": message}
+
+    def callback(self, chat_id: int, user_id: int, data: str, message_id: int = 1) -> dict:
+        update_id, _ = self._next_ids()
+        return {
+            "update_id": update_id,
+            "callback_query": {
+                "id": str(update_id),
+                "chat_instance": str(chat_id),
+                "data": data,
+                "from": self._user(user_id),
+                "message": {
+                    "message_id": message_id,
+                    "date": int(time.time()),
+                    "chat": self._chat(chat_id),
+                    "text": "…",
+                },
+            },
+        }
+
+    def chatter(self) -> dict:
+        return self.message(self.rng.choice(self.groups), self.rng.choice(self.users), self.rng.choice(CHATTER))
+
+    def trigger(self) -> dict:
+        return self.message(self.rng.choice(self.groups), self.rng.choice(self.users), self.rng.choice(TRIGGERS))
+
+    def private(self) -> dict:
+        user_id = self.rng.choice(self.users)
+        return self.message(user_id, user_id, self.rng.choice(CHATTER + TRIGGERS))
+
+    # ---------- سيناريوهات ----------
+    def mix(self, n: int, chatter: float = 0.8, triggers: float = 0.15) -> Iterator[dict]:
+        """
+        n تحديث: chatter من كلام القروبات، triggers ألعاب، والباقي رسائل خاصة.
+        """
+        for _ in range(n):
+            r = self.rng.random()
+            if r < chatter:
+                yield self.chatter()
+            elif r < chatter + triggers:
+                yield self.trigger()
+            else:
+                yield self.private()
+
+    def truth_dare_storm(self, chat_id: int, players: int = 50, presses: int = 200) -> List[dict]:
+        """
+        بدء لعبة، انضمام players لاعب، بدء اللعب، ثم presses ضغطة عشوائية على
+        أزرار الدور (أغلبها من غير صاحب الدور، كما يحدث في القروبات الكبيرة).
+        """
+        people = self.rng.sample(self.users, players)
+        out = [self.message(chat_id, people[0], "تحدي")]
+        out.extend(self.callback(chat_id, user_id, "td_join") for user_id in people)
+        out.append(self.callback(chat_id, people[0], "td_start"))
+        buttons = ("td_choose:dare", "td_choose:truth", "td_switch:truth", "td_switch:dare", "td_next")
+        out.extend(
+            self.callback(chat_id, self.rng.choice(people), self.rng.choice(buttons))
+            for _ in range(presses)
+        )
+        return out
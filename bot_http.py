@@ -0,0 +1,177 @@
+# ============================================
+# Bot HTTP - اتصالات Telegram Bot API (pools منفصلة + قياسات)
+#
+# ثلاث pools مستقلة حتى لا ينتظر نوع من الطلبات خلف آخر:
+# - interactive: ردود المستخدمين (Outbox) وباقي الطلبات العادية.
+# - get_updates: long polling (اتصال واحد يبقى مفتوحاً).
+# - bulk: إرسال /podcast (عبر Bot منفصل).
+#
+# لكل pool: زمن انتظار اتصال من الـ pool (pool wait) وزمن الطلب حتى
+# وصول الرد (latency)، عبر event hooks و trace الخاصة بـ httpx/httpcore.
+# ولكل method في Bot API (sendMessage, editMessageText, ...): زمن الطلب
+# وعدد الردود لكل status.
+# ============================================
+
+from bisect import bisect_left
+from collections import Counter
+from typing import Dict, Optional
+import importlib.util
+import time
+
+import httpx
+from telegram.request import HTTPXRequest
+
+# حدود الـ histogram بالثواني
+LATENCY_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0)
+
+HTTP2_AVAILABLE = importlib.util.find_spec("h2") is not None
+_http2_warned = False
+
+
+class Histogram:
+    __slots__ = ("bounds", "counts", "count", "total", "max")
+
+    def __init__(self, bounds=LATENCY_BUCKETS):
+        self.bounds = bounds
+        self.counts = [0] * (len(bounds) + 1)  # الأخير: أكبر من كل الحدود
+        self.count = 0
+        self.total = 0.0
+        self.max = 0.0
+
+    def observe(self, value: float) -> None:
+        self.counts[bisect_left(self.bounds, value)] += 1
+        self.count += 1
+        self.total += value
+        if value > self.max:
+            self.max = value
+
+    def quantile(self, q: float) -> float:
+        """
+        تقدير من الـ buckets (الحد الأعلى للـ bucket الذي يصل له q).
+        """
+        if not self.count:
+            return 0.0
+        target = q * self.count
+        seen = 0
+        for bound, n in zip(self.bounds, self.counts):
+            seen += n
+            if seen >= target:
+                return bound
+        return self.max
+
+    def summary(self) -> dict:
+        return {
+            "count": self.count,
+            "avg": self.total / self.count if self.count else 0.0,
+            "p50": self.quantile(0.5),
+            "p95": self.quantile(0.95),
+            "max": self.max,
+        }
+
+
+class PoolMetrics:
+    __slots__ = ("name", "pool_wait", "latency", "errors")
+
+    def __init__(self, name: str):
+        self.name = name
+        self.pool_wait = Histogram()
+        self.latency = Histogram()
+        self.errors = 0
+
+    def summary(self) -> dict:
+        return {
+            "pool_wait": self.pool_wait.summary(),
+            "latency": self.latency.summary(),
+            "errors": self.errors,
+        }
+
+
+# كل الـ pools المسجلة (للداشبورد و /metrics)
+POOL_METRICS: Dict[str, PoolMetrics] = {}
+
+# زمن كل method في Bot API (من كل الـ pools)، وعدد الردود لكل (method، status)
+METHOD_LATENCY: Dict[str, Histogram] = {}
+METHOD_STATUS: Counter = Counter()
+
+
+def _method_of(request: httpx.Request) -> str:
+    # .../bot<token>/sendMessage
+    return request.url.path.rsplit("/", 1)[-1]
+
+
+def _hooks(metrics: PoolMetrics) -> dict:
+    async def on_request(request: httpx.Request) -> None:
+        started = time.perf_counter()
+        waiting = True
+
+        async def trace(event: str, info: dict) -> None:
+            nonlocal waiting
+            # أول حدث بعد الحصول على مكان في الـ pool: فتح اتصال جديد أو إرسال على اتصال موجود
+            if waiting and (event.startswith("connection.connect_tcp") or event.endswith("send_request_headers.started")):
+                waiting = False
+                metrics.pool_wait.observe(time.perf_counter() - started)
+            elif event.endswith(".failed"):
+                metrics.errors += 1
+
+        request.extensions["trace"] = trace
+        request.extensions["bot_started"] = started
+
+    async def on_response(response: httpx.Response) -> None:
+        elapsed = time.perf_counter() - response.request.extensions["bot_started"]
+        metrics.latency.observe(elapsed)
+        method = _method_of(response.request)
+        histogram = METHOD_LATENCY.get(method)
+        if histogram is None:
+            histogram = METHOD_LATENCY[method] = Histogram()
+        histogram.observe(elapsed)
+        METHOD_STATUS[method, response.status_code] += 1
+
+    return {"request": [on_request], "response": [on_response]}
+
+
+def _warn_no_http2() -> None:
+    global _http2_warned
+    if _http2_warned:
+        return
+    _http2_warned = True
+    print("⚠️ HTTP2=1 لكن مكتبة h2 غير مثبتة (pip install \"httpx[http2]\")، سيُستخدم HTTP/1.1")
+
+
+def build_request(
+    name: str,
+    pool_size: int,
+    keepalive: Optional[int] = None,
+    keepalive_expiry: float = 60.0,
+    connect_timeout: float = 10.0,
+    read_timeout: float = 15.0,
+    write_timeout: float = 15.0,
+    pool_timeout: float = 10.0,
+    http2: bool = True,
+) -> HTTPXRequest:
+    """
+    HTTPXRequest مع pool بحجم pool_size، اتصالات keep-alive تبقى مفتوحة
+    keepalive_expiry ثانية، و HTTP/2 إن كانت مكتبة h2 مثبتة.
+    """
+    metrics = POOL_METRICS[name] = PoolMetrics(name)
+    if http2 and not HTTP2_AVAILABLE:
+        _warn_no_http2()
+    return HTTPXRequest(
+        connection_pool_size=pool_size,
+        connect_timeout=connect_timeout,
+        read_timeout=read_timeout,
+        write_timeout=write_timeout,
+        pool_timeout=pool_timeout,
+        http_version="2" if http2 and HTTP2_AVAILABLE else "1.1",
+        httpx_kwargs={
+            "limits": httpx.Limits(
+                max_connections=pool_size,
+                max_keepalive_connections=keepalive if keepalive is not None else pool_size,
+                keepalive_expiry=keepalive_expiry,
+            ),
+            "event_hooks": _hooks(metrics),
+        },
+    )
+
+
+def metrics_summary() -> Dict[str, dict]:
+    return {name: m.summary() for name, m in POOL_METRICS.items()}
@@ -0,0 +1,424 @@
+# ============================================
+# Broadcast Engine - إرسال /podcast لكل الجروبات في الخلفية
+# ============================================
+
+from typing import Callable, Dict, Iterable, Optional
+import asyncio
+import json
+import os
+import time
+
+from telegram.error import (
+    BadRequest,
+    ChatMigrated,
+    Forbidden,
+    NetworkError,
+    RetryAfter,
+    TelegramError,
+    TimedOut,
+)
+
+from outbox import BACKGROUND
+from ratelimit import KeyedRateLimiter, TokenBucket, retry_after_seconds
+from stats_store import atomic_write_json
+
+
+# =============================
+# تصنيف أخطاء الإرسال
+# =============================
+# أخطاء دائمة: البوت لن يستطيع الإرسال لهذا الجروب أبداً، فيُحذف من القائمة
+DEAD_CHAT_ERRORS = ("forbidden", "chat_not_found")
+
+ERROR_LABELS = {
+    "forbidden": "البوت مطرود أو محظور",
+    "chat_not_found": "الجروب غير موجود",
+    "no_rights": "لا توجد صلاحية للإرسال",
+    "bad_request": "رفض تيليجرام الرسالة",
+    "transient": "أخطاء مؤقتة (شبكة/ضغط)",
+    "timed_out": "انتهت المهلة (ربما وصلت الرسالة)",
+    "flood": "تجاوز حد تيليجرام رغم إعادة المحاولة",
+    "other": "أخطاء أخرى",
+}
+
+
+def classify_error(error: Exception) -> str:
+    # الترتيب مهم: BadRequest فرع من NetworkError في مكتبة PTB
+    if isinstance(error, Forbidden):
+        return "forbidden"
+    if isinstance(error, BadRequest):
+        message = error.message.lower()
+        if "chat not found" in message:
+            return "chat_not_found"
+        if "rights" in message or "not enough" in message:
+            return "no_rights"
+        return "bad_request"
+    if isinstance(error, TimedOut):
+        # TimedOut فرع من NetworkError، لكن الرسالة غالباً وصلت قبل انتهاء
+        # المهلة: إعادة المحاولة قد ترسلها للجروب مرتين، فلا تُعاد
+        return "timed_out"
+    if isinstance(error, NetworkError):
+        return "transient"
+    return "other"
+
+
+class BroadcastProgress:
+    """
+    التقدم بشكل مضغوط يصلح للاستئناف: كل المؤشرات قبل next_index انتهت،
+    و done_above هي ما انتهى بعده (لا يزيد عن عدد العمّال المتوازيين).
+    retry: مؤشرات فشلت بخطأ مؤقت وتنتظر إعادة المحاولة في آخر الإرسال.
+    retrying: دفعة جولة إعادة المحاولة الحالية؛ المؤشر يخرج منها فقط بعد
+    تسجيل نتيجته، فما لم يُرسل بعد يُحفظ مع retry ولا يضيع عند الإيقاف.
+    """
+
+    def __init__(
+        self,
+        next_index: int = 0,
+        done_above: Iterable[int] = (),
+        sent: int = 0,
+        errors: Optional[Dict[str, int]] = None,
+        retry: Iterable[int] = (),
+        pruned: int = 0,
+    ):
+        self.next_index = next_index
+        self.done_above = set(done_above)
+        self.sent = sent
+        self.errors: Dict[str, int] = dict(errors or {})
+        self.retry = list(retry)
+        self.retrying: set = set()
+        self.pruned = pruned
+
+    @property
+    def done(self) -> int:
+        return self.next_index + len(self.done_above)
+
+    @property
+    def failed(self) -> int:
+        return sum(self.errors.values())
+
+    @property
+    def pending_retry(self) -> int:
+        return len(self.retry) + len(self.retrying)
+
+    def add_error(self, kind: str) -> None:
+        self.errors[kind] = self.errors.get(kind, 0) + 1
+
+    def mark_done(self, index: int) -> None:
+        self.done_above.add(index)
+        while self.next_index in self.done_above:
+            self.done_above.discard(self.next_index)
+            self.next_index += 1
+
+    def to_dict(self) -> dict:
+        return {
+            "next_index": self.next_index,
+            "done_above": sorted(self.done_above),
+            "sent": self.sent,
+            "errors": self.errors,
+            "retry": sorted(self.retrying) + self.retry,
+            "pruned": self.pruned,
+        }
+
+    @classmethod
+    def from_dict(cls, data: dict) -> "BroadcastProgress":
+        return cls(
+            data.get("next_index", 0),
+            data.get("done_above", []),
+            data.get("sent", 0),
+            data.get("errors", {}),
+            data.get("retry", []),
+            data.get("pruned", 0),
+        )
+
+
+class BroadcastEngine:
+    """
+    يرسل رسالة واحدة لقائمة محادثات:
+    - concurrency عامل متوازي.
+    - حد عام (global_rate رسالة/ثانية) وحد لكل محادثة (per_chat_rate).
+    - عند RetryAfter يتوقف الجميع المدة المطلوبة ثم يعيد المحاولة.
+    - مع outbox: الحدود و RetryAfter مسؤولية الطابور وحده (global_rate و
+      per_chat_rate لا تُستخدم)، و RetryAfter بعد محاولاته خطأ نهائي (flood).
+    - الأخطاء المؤقتة تُؤجَّل لجولات إعادة محاولة في آخر الإرسال (retry_delays).
+    - الجروبات الميتة (مطرود/غير موجود) تُبلَّغ عبر on_dead_chat لحذفها،
+      والجروبات المُرقّاة إلى supergroup عبر on_migrated.
+    - التقدم يُحفظ على القرص كل progress_interval ثانية، فلو أُعيد تشغيل
+      البوت يكمل من حيث توقف (resume).
+    - رسالة حالة واحدة تُعدَّل بالتقدم بدل إرسال رسائل جديدة.
+    """
+
+    def __init__(
+        self,
+        job_file: str,
+        progress_file: str,
+        concurrency: int = 10,
+        global_rate: float = 25.0,
+        per_chat_rate: float = 20 / 60,
+        progress_interval: float = 5.0,
+        max_attempts: int = 5,
+        retry_delays: Iterable[float] = (5, 30, 120),
+        on_dead_chat: Optional[Callable[[int, str], None]] = None,
+        on_migrated: Optional[Callable[[int, int], None]] = None,
+        outbox=None,
+    ):
+        self.job_file = job_file
+        self.progress_file = progress_file
+        self.concurrency = concurrency
+        self.global_bucket = TokenBucket(global_rate, capacity=global_rate)
+        self.chat_limiter = KeyedRateLimiter(per_chat_rate, capacity=1)
+        self.progress_interval = progress_interval
+        self.max_attempts = max_attempts
+        self.retry_delays = tuple(retry_delays)
+        self.on_dead_chat = on_dead_chat
+        self.on_migrated = on_migrated
+        # إن وُجد: الإرسال عبر طابور البوت العام بأولوية منخفضة (بعد ردود المستخدمين)،
+        # وهو الذي يطبّق الحدود ويعيد المحاولة عند RetryAfter
+        self.outbox = outbox
+
+        self.task: Optional[asyncio.Task] = None
+        self.job: Optional[dict] = None
+        self.progress: Optional[BroadcastProgress] = None
+        self._cancelled = False
+
+    @property
+    def running(self) -> bool:
+        return self.task is not None and not self.task.done()
+
+    # ---------- ملفات الحالة ----------
+    def pending_job(self) -> Optional[dict]:
+        """
+        مهمة لم تكتمل من تشغيل سابق (أو من worker آخر على نفس الجهاز).
+        """
+        if not os.path.exists(self.job_file):
+            return None
+        try:
+            with open(self.job_file, "r", encoding="utf-8") as f:
+                return json.load(f)
+        except Exception:
+            return None
+
+    def _load_progress(self) -> BroadcastProgress:
+        try:
+            with open(self.progress_file, "r", encoding="utf-8") as f:
+                return BroadcastProgress.from_dict(json.load(f))
+        except Exception:
+            return BroadcastProgress()
+
+    async def _save_progress(self) -> None:
+        try:
+            await asyncio.to_thread(atomic_write_json, self.progress_file, self.progress.to_dict())
+        except Exception:
+            pass
+
+    def _remove_files(self) -> None:
+        for path in (self.job_file, self.progress_file):
+            try:
+                os.unlink(path)
+            except FileNotFoundError:
+                pass
+
+    # ---------- التحكم ----------
+    def start(
+        self,
+        bot,
+        create_task: Callable,
+        text: str,
+        chat_ids: list,
+        status_chat_id: int,
+        status_message_id: int,
+    ) -> bool:
+        """
+        يبدأ مهمة جديدة في الخلفية. يرجع False لو كانت هناك مهمة جارية.
+        """
+        if self.running or self.pending_job():
+            return False
+        job = {
+            "text": text,
+            "chat_ids": list(chat_ids),
+            "status_chat_id": status_chat_id,
+            "status_message_id": status_message_id,
+            "created": time.time(),
+        }
+        atomic_write_json(self.job_file, job)
+        atomic_write_json(self.progress_file, BroadcastProgress().to_dict())
+        self._launch(bot, create_task, job, BroadcastProgress())
+        return True
+
+    def resume(self, bot, create_task) -> bool:
+        """
+        يكمل مهمة غير منتهية بعد إعادة التشغيل.
+        """
+        if self.running:
+            return False
+        job = self.pending_job()
+        if not job:
+            return False
+        self._launch(bot, create_task, job, self._load_progress())
+        return True
+
+    def cancel(self) -> bool:
+        if not self.running:
+            if self.pending_job():
+                self._remove_files()
+                return True
+            return False
+        self._cancelled = True
+        return True
+
+    async def stop(self) -> None:
+        """
+        عند إيقاف البوت: يلغي المهمة الجارية بدون حذفها، فيُحفظ التقدم
+        (في finally الخاص بـ _run) وتُستأنف عند التشغيل القادم.
+        """
+        if self.running:
+            self.task.cancel()
+            await asyncio.gather(self.task, return_exceptions=True)
+
+    def _launch(self, bot, create_task, job: dict, progress: BroadcastProgress) -> None:
+        self.job = job
+        self.progress = progress
+        self._cancelled = False
+        self.task = create_task(self._run(bot))
+
+    # ---------- التنفيذ ----------
+    def status_text(self, finished: bool = False) -> str:
+        total = len(self.job["chat_ids"])
+        p = self.progress
+        if self._cancelled:
+            head = "⛔ تم إيقاف الإرسال."
+        elif finished:
+            head = "✅ انتهى الإرسال."
+        elif p.done >= total and p.pending_retry:
+            head = f"🔁 إعادة المحاولة لـ {p.pending_retry} جروب..."
+        else:
+            head = "📡 جاري الإرسال..."
+        lines = [
+            head,
+            f"التقدم: {p.done}/{total}",
+            f"✅ تم الإرسال إلى {p.sent} جروب.",
+            f"❌ فشل الإرسال إلى {p.failed}.",
+        ]
+        for kind, count in sorted(p.errors.items(), key=lambda kv: -kv[1]):
+            lines.append(f"   • {ERROR_LABELS.get(kind, kind)}: {count}")
+        if p.pruned:
+            lines.append(f"🧹 تم حذف {p.pruned} جروب ميت من القائمة.")
+        return "\n".join(lines)
+
+    async def _edit_status(self, bot, finished: bool = False) -> None:
+        try:
+            await bot.edit_message_text(
+                chat_id=self.job["status_chat_id"],
+                message_id=self.job["status_message_id"],
+                text=self.status_text(finished),
+            )
+        except Exception:
+            pass
+
+    async def _send_one(self, bot, chat_id: int, text: str) -> str:
+        """
+        يرجع "sent" أو نوع الخطأ (انظر classify_error).
+        """
+        for attempt in range(self.max_attempts):
+            if self.outbox is None:
+                await self.global_bucket.acquire()
+                wait = self.chat_limiter.reserve(chat_id)
+                if wait > 0:
+                    await asyncio.sleep(wait)
+            try:
+                await self._send(bot, chat_id, text)
+                return "sent"
+            except RetryAfter as e:
+                if self.outbox is not None:
+                    # الطابور أعاد المحاولة بنفسه (وأوقف مسار الإذاعة) ولم ينجح: لا نعيدها مرة أخرى
+                    return "flood"
+                # تيليجرام طلب التوقف: نوقف كل العمّال وليس هذا فقط
+                self.global_bucket.pause(retry_after_seconds(e) + 0.5)
+            except ChatMigrated as e:
+                # الجروب أصبح supergroup بمعرّف جديد
+                if self.on_migrated:
+                    self.on_migrated(chat_id, e.new_chat_id)
+                chat_id = e.new_chat_id
+            except TelegramError as e:
+                return classify_error(e)
+        return "transient"
+
+    def _send(self, bot, chat_id: int, text: str):
+        if self.outbox is None:
+            return bot.send_message(chat_id=chat_id, text=text)
+        return self.outbox.submit(
+            chat_id,
+            lambda: bot.send_message(chat_id=chat_id, text=text),
+            priority=BACKGROUND,
+        )
+
+    def _record(self, index: int, chat_id: int, outcome: str, last_round: bool) -> None:
+        progress = self.progress
+        if outcome == "sent":
+            progress.sent += 1
+        elif outcome == "transient" and not last_round:
+            progress.retry.append(index)
+        else:
+            progress.add_error(outcome)
+            if outcome in DEAD_CHAT_ERRORS and self.on_dead_chat:
+                self.on_dead_chat(chat_id, outcome)
+                progress.pruned += 1
+
+    async def _worker(self, bot, indices, last_round: bool, first_pass: bool) -> None:
+        chat_ids = self.job["chat_ids"]
+        text = self.job["text"]
+        for index in indices:
+            if self._cancelled:
+                return
+            chat_id = chat_ids[index]
+            outcome = await self._send_one(bot, chat_id, text)
+            self._record(index, chat_id, outcome, last_round)
+            if first_pass:
+                self.progress.mark_done(index)
+            else:
+                self.progress.retrying.discard(index)
+
+    async def _pass(self, bot, indices, count: int, last_round: bool, first_pass: bool) -> None:
+        await asyncio.gather(*(
+            self._worker(bot, indices, last_round, first_pass)
+            for _ in range(min(self.concurrency, max(count, 1)))
+        ))
+
+    async def _reporter(self, bot) -> None:
+        while True:
+            await asyncio.sleep(self.progress_interval)
+            await self._save_progress()
+            await self._edit_status(bot)
+
+    async def _run(self, bot) -> None:
+        progress = self.progress
+        total = len(self.job["chat_ids"])
+        # مولّد واحد مشترك بين العمّال: كل مؤشر يأخذه عامل واحد فقط
+        indices = (
+            i for i in range(progress.next_index, total)
+            if i not in progress.done_above
+        )
+        reporter = asyncio.ensure_future(self._reporter(bot))
+        try:
+            await self._pass(bot, indices, total - progress.done, not self.retry_delays, True)
+
+            # جولات إعادة المحاولة للأخطاء المؤقتة
+            for n, delay in enumerate(self.retry_delays):
+                if self._cancelled or not progress.retry:
+                    break
+                await asyncio.sleep(delay)
+                batch, progress.retry = progress.retry, []
+                progress.retrying.update(batch)
+                last_round = n == len(self.retry_delays) - 1
+                await self._pass(bot, iter(batch), len(batch), last_round, False)
+        finally:
+            reporter.cancel()
+            # ما لم يُسجَّل من الدفعة (لم يُؤخذ بعد أو كان قيد الإرسال) ما زال في
+            # retrying، فلا تُعتبر المهمة منتهية إلا إن فرغت هي و retry
+            if self._cancelled or (progress.done >= total and not progress.pending_retry):
+                self._remove_files()
+                await self._edit_status(bot, finished=True)
+            else:
+                # البوت توقف أثناء الإرسال: نحفظ التقدم ليُستأنف عند التشغيل القادم
+                try:
+                    atomic_write_json(self.progress_file, progress.to_dict())
+                except Exception:
+                    pass
@@ -0,0 +1,247 @@
+# ============================================
+# Cardinality - عدّ المستخدمين بذاكرة ثابتة
+#
+# STATS_CARDINALITY=exact (الافتراضي): مجموعات عادية (IdSet) بكل المعرّفات.
+# STATS_CARDINALITY=hll: المستخدمون والمحادثات الخاصة HyperLogLog (16KB لكل
+# عدّاد، خطأ ~0.8%) مهما كان عددهم. الجروبات تبقى دقيقة لأن /podcast يحتاج
+# معرّفاتها، لكن في IntSet (array مرتب، 8 بايت لكل جروب بدل ~70 في set).
+#
+# النشطون يومياً/شهرياً (DAU/MAU) في الوضعين: sketch لكل يوم، والشهر =
+# دمج آخر 30 يوماً.
+#
+# add_new(x) في كل الأنواع ترجع True إن تغيّر العدّاد (أي يجب حفظ x في
+# سجل الإحصائيات). في HyperLogLog إعادة تطبيق هذه المعرّفات فقط تعطي نفس
+# الـ registers بالضبط، فالسجل لا يكبر مع تكرار نفس المستخدمين.
+# ============================================
+
+from array import array
+from bisect import bisect_left
+from typing import Dict, Iterable, Iterator
+import base64
+import math
+import zlib
+
+EXACT = "exact"
+HLL = "hll"
+
+# 2^p registers: 14 -> 16KB وخطأ ~0.8%، و 12 -> 4KB وخطأ ~1.6% (لكل يوم)
+UNIQUE_PRECISION = 14
+ACTIVE_PRECISION = 12
+# MAU = آخر هذا العدد من الأيام
+ACTIVE_DAYS = 30
+
+_MASK64 = (1 << 64) - 1
+_POW2 = [2.0 ** -r for r in range(65)]
+
+
+def _hash64(x: int) -> int:
+    """
+    splitmix64: المعرّفات المتتالية تتوزع على كل الـ registers.
+    """
+    x = (x + 0x9E3779B97F4A7C15) & _MASK64
+    x = ((x ^ (x >> 30)) * 0xBF58476D1CE4E5B9) & _MASK64
+    x = ((x ^ (x >> 27)) * 0x94D049BB133111EB) & _MASK64
+    return x ^ (x >> 31)
+
+
+class HyperLogLog:
+    __slots__ = ("p", "registers")
+
+    def __init__(self, p: int = UNIQUE_PRECISION):
+        self.p = p
+        self.registers = bytearray(1 << p)
+
+    def add_new(self, x: int) -> bool:
+        h = _hash64(x)
+        bits = 64 - self.p
+        idx = h >> bits
+        rank = bits - (h & ((1 << bits) - 1)).bit_length() + 1
+        if rank > self.registers[idx]:
+            self.registers[idx] = rank
+            return True
+        return False
+
+    add = add_new
+
+    def update(self, items: Iterable[int]) -> None:
+        for x in items:
+            self.add_new(x)
+
+    def merge(self, other: "HyperLogLog") -> None:
+        if other.p != self.p:
+            raise ValueError("HyperLogLog precision mismatch")
+        self.registers = bytearray(map(max, self.registers, other.registers))
+
+    def count(self) -> int:
+        m = len(self.registers)
+        alpha = 0.7213 / (1 + 1.079 / m)
+        estimate = alpha * m * m / sum(map(_POW2.__getitem__, self.registers))
+        zeros = self.registers.count(0)
+        if zeros and estimate <= 2.5 * m:
+            # عدد صغير: linear counting أدق
+            estimate = m * math.log(m / zeros)
+        return int(round(estimate))
+
+    def __len__(self) -> int:
+        return self.count()
+
+    # ---------- الحفظ ----------
+    def to_bytes(self) -> bytes:
+        return bytes([self.p]) + zlib.compress(bytes(self.registers), 6)
+
+    @classmethod
+    def from_bytes(cls, blob: bytes) -> "HyperLogLog":
+        sketch = cls(blob[0])
+        registers = zlib.decompress(blob[1:])
+        if len(registers) != len(sketch.registers):
+            raise ValueError("corrupt HyperLogLog")
+        sketch.registers = bytearray(registers)
+        return sketch
+
+    def to_text(self) -> str:
+        return base64.b64encode(self.to_bytes()).decode("ascii")
+
+    @classmethod
+    def from_text(cls, text: str) -> "HyperLogLog":
+        return cls.from_bytes(base64.b64decode(text))
+
+
+class IdSet(set):
+    """
+    set عادي مع add_new (الوضع الدقيق).
+    """
+
+    def add_new(self, x: int) -> bool:
+        if x in self:
+            return False
+        self.add(x)
+        return True
+
+
+class IntSet:
+    """
+    مجموعة أعداد دقيقة في array مرتب: البحث bisect، والإضافة/الحذف memmove.
+    مناسبة لما يُقرأ كثيراً ويتغير قليلاً (معرّفات الجروبات).
+    """
+
+    __slots__ = ("_items",)
+
+    def __init__(self, items: Iterable[int] = ()):
+        self._items = array("q", sorted(set(items)))
+
+    def __contains__(self, x: int) -> bool:
+        items = self._items
+        i = bisect_left(items, x)
+        return i < len(items) and items[i] == x
+
+    def add_new(self, x: int) -> bool:
+        items = self._items
+        i = bisect_left(items, x)
+        if i < len(items) and items[i] == x:
+            return False
+        items.insert(i, x)
+        return True
+
+    def add(self, x: int) -> None:
+        self.add_new(x)
+
+    def discard(self, x: int) -> None:
+        items = self._items
+        i = bisect_left(items, x)
+        if i < len(items) and items[i] == x:
+            del items[i]
+
+    def update(self, items: Iterable[int]) -> None:
+        self._items = array("q", sorted(set(self._items).union(items)))
+
+    def __len__(self) -> int:
+        return len(self._items)
+
+    def __iter__(self) -> Iterator[int]:
+        return iter(self._items)
+
+
+def new_unique(mode: str, kind: str):
+    """
+    العدّاد المناسب لكل نوع: "users" / "private_chats" / "groups".
+    """
+    if mode != HLL:
+        return IdSet()
+    if kind == "groups":
+        return IntSet()
+    return HyperLogLog()
+
+
+def dump_unique(value):
+    """
+    للـ JSON: قائمة معرّفات (دقيق) أو sketch بـ base64.
+    """
+    if isinstance(value, HyperLogLog):
+        return value.to_text()
+    return list(value)
+
+
+def load_unique(target, raw) -> None:
+    """
+    يضيف المحفوظ (قائمة أو sketch) إلى target. القائمة تُضاف لأي نوع
+    (الانتقال من exact إلى hll)، أما الـ sketch فلا يمكن تحويله لمعرّفات.
+    """
+    if isinstance(raw, str):
+        if isinstance(target, HyperLogLog):
+            target.merge(HyperLogLog.from_text(raw))
+        return
+    target.update(raw)
+
+
+# =============================
+# DAU / MAU
+# =============================
+class ActiveUsers:
+    """
+    sketch لكل يوم (رقم اليوم = الساعة // 24، UTC) لآخر days يوم.
+    """
+
+    def __init__(self, days: int = ACTIVE_DAYS, p: int = ACTIVE_PRECISION):
+        self.days = days
+        self.p = p
+        self.sketches: Dict[int, HyperLogLog] = {}
+        self.newest = -1
+
+    def _sketch(self, day: int):
+        sketch = self.sketches.get(day)
+        if sketch is None:
+            if day <= self.newest - self.days:
+                return None  # أقدم من النافذة
+            sketch = self.sketches[day] = HyperLogLog(self.p)
+            if day > self.newest:
+                self.newest = day
+                for old in [d for d in self.sketches if d <= day - self.days]:
+                    del self.sketches[old]
+        return sketch
+
+    def add_new(self, day: int, user_id: int) -> bool:
+        sketch = self._sketch(day)
+        return sketch is not None and sketch.add_new(user_id)
+
+    def merge_day(self, day: int, sketch: HyperLogLog) -> None:
+        mine = self._sketch(day)
+        if mine is not None:
+            mine.merge(sketch)
+
+    def dau(self, day: int) -> int:
+        sketch = self.sketches.get(day)
+        return sketch.count() if sketch else 0
+
+    def mau(self, day: int) -> int:
+        merged = HyperLogLog(self.p)
+        for d, sketch in self.sketches.items():
+            if day - self.days < d <= day:
+                merged.merge(sketch)
+        return merged.count()
+
+    def to_dict(self) -> dict:
+        return {str(day): sketch.to_text() for day, sketch in self.sketches.items()}
+
+    def load_dict(self, data: dict) -> None:
+        for day, text in sorted(data.items(), key=lambda kv: int(kv[0])):
+            self.merge_day(int(day), HyperLogLog.from_text(text))
@@ -0,0 +1,158 @@
+# ============================================
+# Chat State - حفظ chat_data / user_data (PTB persistence) بشكل مضغوط
+#
+# dumps/loads: pickle، ويُضغط بـ zlib إن كبر (لعبة بعشرات اللاعبين تصغر
+# إلى ~ربع حجمها). البيانات القديمة (pickle بدون ضغط) تُقرأ كما هي.
+#
+# KVLog: مخزن الـ file backend. سجل إضافات ثنائي، كل سجل:
+#   <ns:1 byte><key:8 bytes><len:4 bytes><blob>     (len = DELETED يعني حذف)
+# كل حفظ يضيف المحادثات التي تغيّرت فقط. عند التحميل يُعاد تشغيل السجل،
+# وعندما يصبح أكبر من ضعف البيانات الحية يُعاد كتابته (compaction).
+# ============================================
+
+from typing import Dict, Optional, Tuple
+import os
+import pickle
+import struct
+import tempfile
+import zlib
+
+# البيانات الأكبر من هذا تُضغط
+COMPRESS_MIN_BYTES = 256
+_ZLIB_TAG = b"Z"
+
+
+def dumps(data) -> bytes:
+    blob = pickle.dumps(data, protocol=pickle.HIGHEST_PROTOCOL)
+    if len(blob) >= COMPRESS_MIN_BYTES:
+        return _ZLIB_TAG + zlib.compress(blob, 6)
+    return blob
+
+
+def loads(blob: bytes):
+    if blob[:1] == _ZLIB_TAG:
+        blob = zlib.decompress(blob[1:])
+    return pickle.loads(blob)
+
+
+# =============================
+# KVLog (الـ file backend)
+# =============================
+RECORD = struct.Struct("<BqI")
+DELETED = 0xFFFFFFFF
+NAMESPACES = {"chat_data": 0, "user_data": 1, "bot_data": 2}
+
+
+class KVLog:
+    """
+    نفس واجهة kv_* في SQLiteStateBackend، لعملية واحدة.
+    الكتابة تمر بـ flush (تنجو من انهيار العملية)، و fsync عند sync() فقط.
+    """
+
+    def __init__(self, path: str, compact_min_bytes: int = 1024 * 1024):
+        self.path = path
+        self.compact_min_bytes = compact_min_bytes
+        self._data: Dict[Tuple[int, int], bytes] = {}
+        self.live_bytes = 0
+        self.size = 0
+        self._load()
+        self._file = open(self.path, "ab")
+
+    # ---------- تحميل ----------
+    def _load(self) -> None:
+        if not os.path.exists(self.path):
+            return
+        with open(self.path, "rb") as f:
+            raw = f.read()
+        pos = 0
+        end = len(raw)
+        while pos + RECORD.size <= end:
+            ns, key, length = RECORD.unpack_from(raw, pos)
+            body = pos + RECORD.size
+            if length == DELETED:
+                self._forget((ns, key))
+                pos = body
+                continue
+            if body + length > end:
+                break
+            self._remember((ns, key), raw[body:body + length])
+            pos = body + length
+        self.size = pos
+        if pos != end:
+            # سجل ناقص في آخر الملف (انقطاع أثناء الكتابة)
+            with open(self.path, "r+b") as f:
+                f.truncate(pos)
+
+    def _remember(self, k: Tuple[int, int], blob: bytes) -> None:
+        self._forget(k)
+        self._data[k] = blob
+        self.live_bytes += RECORD.size + len(blob)
+
+    def _forget(self, k: Tuple[int, int]) -> bool:
+        old = self._data.pop(k, None)
+        if old is None:
+            return False
+        self.live_bytes -= RECORD.size + len(old)
+        return True
+
+    # ---------- الواجهة ----------
+    def kv_get_all(self, ns: str) -> Dict[str, bytes]:
+        code = NAMESPACES[ns]
+        return {str(key): blob for (n, key), blob in self._data.items() if n == code}
+
+    def kv_get(self, ns: str, key: str) -> Optional[bytes]:
+        return self._data.get((NAMESPACES[ns], int(key)))
+
+    def kv_set(self, ns: str, key: str, value: bytes) -> None:
+        k = (NAMESPACES[ns], int(key))
+        if self._data.get(k) == value:
+            return
+        self._remember(k, value)
+        self._append(RECORD.pack(k[0], k[1], len(value)) + value)
+
+    def kv_delete(self, ns: str, key: str) -> None:
+        k = (NAMESPACES[ns], int(key))
+        if self._forget(k):
+            self._append(RECORD.pack(k[0], k[1], DELETED))
+
+    def _append(self, record: bytes) -> None:
+        self._file.write(record)
+        self._file.flush()
+        self.size += len(record)
+        if self.size > max(self.compact_min_bytes, 2 * self.live_bytes):
+            self.compact()
+
+    def compact(self) -> None:
+        """
+        يكتب البيانات الحية فقط في ملف جديد ويستبدل السجل به.
+        """
+        directory = os.path.dirname(os.path.abspath(self.path))
+        fd, tmp_path = tempfile.mkstemp(prefix=".chat_state-", suffix=".tmp", dir=directory)
+        try:
+            with os.fdopen(fd, "wb") as f:
+                for (ns, key), blob in self._data.items():
+                    f.write(RECORD.pack(ns, key, len(blob)))
+                    f.write(blob)
+                f.flush()
+                os.fsync(f.fileno())
+            self._file.close()
+            os.replace(tmp_path, self.path)
+        except BaseException:
+            try:
+                os.unlink(tmp_path)
+            except OSError:
+                pass
+            raise
+        finally:
+            if self._file.closed:
+                self._file = open(self.path, "ab")
+        self.size = self.live_bytes
+
+    def sync(self) -> None:
+        self._file.flush()
+        os.fsync(self._file.fileno())
+
+    def close(self) -> None:
+        if not self._file.closed:
+            self.sync()
+            self._file.close()
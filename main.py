@@ -1,30 +1,60 @@
 # ============================================
 # Telegram Game Bot - Webhook + Dashboard + Broadcast + Truth/Dare Game
-# For Render (gunicorn main:web_app)
+# For Render (uvicorn main:asgi_app  أو  python main.py مع RUN_MODE=webhook)
 # ============================================
 
-from typing import Dict
+from typing import Dict, Optional
 from telegram import (
+    Bot,
     Update,
     InlineKeyboardButton,
     InlineKeyboardMarkup,
 )
 from telegram.ext import (
     ApplicationBuilder,
+    ApplicationHandlerStop,
     CommandHandler,
     MessageHandler,
     ContextTypes,
     CallbackQueryHandler,
     filters,
 )
-from telegram.request import HTTPXRequest
-from flask import Flask, request, render_template_string
-from datetime import datetime, timezone
-import random
+from telegram.error import TelegramError
+from flask import Flask, Response, request
+from asgiref.wsgi import WsgiToAsgi
 import os
 import time
 import asyncio
+import atexit
 import json
+import random
+import threading
+
+from autoreply import AutoReplyEngine, load_rules
+from bot_http import build_request, metrics_summary
+from broadcast import BroadcastEngine
+from cardinality import ActiveUsers, dump_unique, new_unique
+from normalize import may_shrink, normalize_text
+from metrics import TRIGGERS, gauge, prometheus_text, timed, watch_loop_lag
+from outbox import BACKGROUND, INTERACTIVE, Outbox
+from profiling import MemoryTracer, SamplingProfiler, TopCounter
+from question_bank import (
+    DEFAULT_BANKS_FILE,
+    DEFAULT_SOURCES,
+    KIND_PAIRS,
+    MmapBank,
+    index_mapping,
+    open_banks,
+    refresh_banks,
+    sources_signature,
+)
+from ratelimit import KeyedRateLimiter
+from router import PRIORITY_FIRST, MessageRouter
+from state_backend import create_backend
+from stats_store import SnapshotCache, StatsDelta, WriteBehindSaver
+from timeseries import ActivitySeries
+from truth_dare import COLLECTING, ENDED, RUNNING, WAITING_START, TruthDareGame
+from webhook_server import ChatOrderedUpdateProcessor, WebhookASGIApp
 # from dotenv import load_dotenv
 
 # =============================
@@ -44,7 +74,91 @@ if not BOT_TOKEN:
 # غيّر هذا الرابط لو تغيّر اسم الخدمة في Render
 WEBHOOK_URL = "https://telegram-rami-bot-1.onrender.com/webhook"
 
+WEBHOOK_PATH = "/webhook"
+PORT = int(os.getenv("PORT", "10000"))
+
+# عنوان Bot API (يُغيَّر لسيرفر Bot API محلي، أو لـ bench/fake_bot_api.py عند القياس)
+BOT_API_URL = os.getenv("BOT_API_URL", "https://api.telegram.org/bot")
+
+# أقصى عدد تحديثات تُعالج بالتوازي (تحديثات نفس المحادثة تبقى بالترتيب)
+MAX_CONCURRENT_UPDATES = int(os.getenv("MAX_CONCURRENT_UPDATES", "32"))
+
 STATS_FILE = "stats.json"
+STATS_JOURNAL_FILE = "stats.journal"
+# عند تجاوز السجل هذا الحجم يُدمج في stats.json ويبدأ سجل جديد
+STATS_JOURNAL_MAX_BYTES = int(os.getenv("STATS_JOURNAL_MAX_BYTES", str(4 * 1024 * 1024)))
+
+# مكان حفظ الحالة: file (الملفات الحالية، worker واحد)
+# أو sqlite (قاعدة مشتركة لعدة workers على نفس الجهاز)
+STATE_BACKEND = os.getenv("STATE_BACKEND", "file").lower()
+STATE_DB = os.getenv("STATE_DB", "state.db")
+# sqlite: أقصى انتظار (ثواني) لقفل الكتابة عند سحب سؤال، لأنه يعمل على event loop
+# مباشرة (باقي الكتابات في الخلفية وتنتظر حتى 30 ثانية)
+SQLITE_BUSY_TIMEOUT = float(os.getenv("SQLITE_BUSY_TIMEOUT", "2"))
+
+# عدّ المستخدمين: exact (كل المعرّفات في الذاكرة والملفات)
+# أو hll (عدد تقريبي ±1% بذاكرة ثابتة؛ الجروبات تبقى دقيقة لأجل /podcast).
+# الانتقال من exact إلى hll يحافظ على الأرقام، والعكس يبدأ العدّ من الصفر
+STATS_CARDINALITY = os.getenv("STATS_CARDINALITY", "exact").lower()
+
+# حفظ الإحصائيات في الخلفية: كل كم ثانية، أو بعد كم تحديث غير محفوظ
+# (أقصى ما يضيع عند الانهيار المفاجئ هو الأقل من الاثنين)
+STATS_FLUSH_INTERVAL = float(os.getenv("STATS_FLUSH_INTERVAL", "5"))
+STATS_FLUSH_EVERY = int(os.getenv("STATS_FLUSH_EVERY", "500"))
+
+# إرسال /podcast: عدد الإرسالات المتوازية (الحدود يطبّقها طابور الإرسال OUTBOX_*)
+BROADCAST_CONCURRENCY = int(os.getenv("BROADCAST_CONCURRENCY", "10"))
+BROADCAST_JOB_FILE = "broadcast_job.json"
+BROADCAST_PROGRESS_FILE = "broadcast_progress.json"
+
+# اتصالات Bot API: حجم الـ pool للطلبات العادية، مدة بقاء اتصالات keep-alive، و HTTP/2 إن توفر
+HTTP_POOL_SIZE = int(os.getenv("HTTP_POOL_SIZE", "64"))
+HTTP_KEEPALIVE_EXPIRY = float(os.getenv("HTTP_KEEPALIVE_EXPIRY", "60"))
+HTTP2 = os.getenv("HTTP2", "1") == "1"
+
+# طابور الإرسال المركزي: حد عام (رسالة/ثانية) وحد لكل قروب (رسالة/دقيقة)
+OUTBOX_RATE = float(os.getenv("OUTBOX_RATE", "30"))
+OUTBOX_GROUP_PER_MIN = float(os.getenv("OUTBOX_GROUP_PER_MIN", "20"))
+OUTBOX_WORKERS = int(os.getenv("OUTBOX_WORKERS", "8"))
+
+# دورة الأسئلة بدون تكرار: chat (لكل محادثة)، user (لكل مستخدم)، global (واحدة للجميع)
+QUESTION_ROTATION = os.getenv("QUESTION_ROTATION", "chat").lower()
+# حد المحادثات المحفوظة في الذاكرة، وحذف المحادثات الخاملة بعد عدد أيام
+ROTATION_MAX_ENTRIES = int(os.getenv("ROTATION_MAX_ENTRIES", "200000"))
+ROTATION_IDLE_DAYS = float(os.getenv("ROTATION_IDLE_DAYS", "30"))
+ROTATION_FLUSH_INTERVAL = float(os.getenv("ROTATION_FLUSH_INTERVAL", "60"))
+
+# فحص ملفات الأسئلة والردود كل عدد ثواني وإعادة تحميلها بدون إعادة تشغيل (0 = إيقاف)
+CONTENT_RELOAD_INTERVAL = float(os.getenv("CONTENT_RELOAD_INTERVAL", "30"))
+AUTOREPLIES_FILE = "autoreplies.txt"
+
+# حماية من السبام: حد ردود الألعاب والردود السريعة (token bucket)
+# لكل قروب: قريب من حد تيليجرام (20 رسالة/دقيقة للقروب) مع دفعة صغيرة
+FLOOD_CHAT_RATE = float(os.getenv("FLOOD_CHAT_RATE", str(20 / 60)))
+FLOOD_CHAT_BURST = float(os.getenv("FLOOD_CHAT_BURST", "5"))
+# لكل مستخدم
+FLOOD_USER_RATE = float(os.getenv("FLOOD_USER_RATE", "0.5"))
+FLOOD_USER_BURST = float(os.getenv("FLOOD_USER_BURST", "3"))
+
+# حالة الألعاب المحفوظة (chat_data/user_data): حذف لعبة تحدي/صراحة منتهية أو متروكة
+# بعد عدد ساعات، وإجابة آخر سؤال (عام/جريمة) بعد عدد ساعات، والفحص كل عدد ثواني
+TD_GAME_TTL_HOURS = float(os.getenv("TD_GAME_TTL_HOURS", "6"))
+# تعديل رسالة الانضمام (عدد اللاعبين) مرة واحدة على الأكثر كل عدد ثواني لكل لعبة
+# (5 ثواني = 12 تعديل في الدقيقة، ويبقى من حد القروب OUTBOX_GROUP_PER_MIN لردود اللعبة)
+TD_JOIN_EDIT_INTERVAL = float(os.getenv("TD_JOIN_EDIT_INTERVAL", "5"))
+USER_STATE_TTL_HOURS = float(os.getenv("USER_STATE_TTL_HOURS", "24"))
+CHAT_STATE_SWEEP_INTERVAL = float(os.getenv("CHAT_STATE_SWEEP_INTERVAL", "600"))
+
+# الداشبورد: لقطة الإحصائيات تُبنى مرة كل عدد ثواني على الأكثر،
+# والصفحة المفتوحة تطلب /api/stats كل عدد ثواني
+DASHBOARD_SNAPSHOT_TTL = float(os.getenv("DASHBOARD_SNAPSHOT_TTL", "5"))
+DASHBOARD_POLL_SECONDS = float(os.getenv("DASHBOARD_POLL_SECONDS", "10"))
+
+# أدوات التشخيص للمطور (/profile و /memdiff و /topchats و /debug/*):
+# الفاصل بين عينات الـ CPU profile، أقصى مدة له، وأقصى مدة لتتبع الذاكرة (tracemalloc مكلف)
+PROFILE_INTERVAL = float(os.getenv("PROFILE_INTERVAL", "0.01"))
+PROFILE_MAX_SECONDS = float(os.getenv("PROFILE_MAX_SECONDS", "120"))
+MEMTRACE_MAX_SECONDS = float(os.getenv("MEMTRACE_MAX_SECONDS", "1800"))
 
 # اسم المستخدم للمطور (بدون @)
 DEVELOPER_USERNAME_RAW = "R_q1j"
@@ -58,12 +172,19 @@ web_app = Flask(__name__)
 # Bot Statistics (globals)
 # =============================
 TOTAL_MESSAGES = 0
-UNIQUE_USERS: set[int] = set()
-UNIQUE_GROUPS: set[int] = set()
-UNIQUE_PRIVATE_CHATS: set[int] = set()
-ACTIVITY_BUCKETS: Dict[str, int] = {}
+# أنواعها حسب STATS_CARDINALITY (انظر cardinality.py)
+UNIQUE_USERS = new_unique(STATS_CARDINALITY, "users")
+UNIQUE_GROUPS = new_unique(STATS_CARDINALITY, "groups")
+UNIQUE_PRIVATE_CHATS = new_unique(STATS_CARDINALITY, "private_chats")
+# المستخدمون النشطون لكل يوم (DAU/MAU)
+ACTIVE_USERS = ActiveUsers()
+# الرسائل لكل ساعة/يوم/أسبوع (ring buffers بحجم ثابت)
+ACTIVITY = ActivitySeries()
 BOT_START_TIME = time.time()
 
+# يحمي الإحصائيات أثناء نسخها من خيط الحفظ الخلفي
+STATS_LOCK = threading.Lock()
+
 # =============================
 # Developer Info
 # =============================
@@ -115,19 +236,11 @@ HELP_TEXT = (
 # =============================
 # Helpers (text & developer)
 # =============================
-def normalize_text(t: str):
-    return (
-        t.strip()
-        .lower()
-        .replace("أ", "ا")
-        .replace("إ", "ا")
-        .replace("آ", "ا")
-        .replace("ة", "ه")
-    )
+ANSWER_WORDS = ("اجابه", "جواب", "الاجابه")
 
 
 def is_answer_word(t: str):
-    return normalize_text(t) in ["اجابه", "جواب", "الاجابه"]
+    return normalize_text(t) in ANSWER_WORDS
 
 
 def is_developer(update: Update) -> bool:
@@ -160,102 +273,217 @@ def load_general_questions(filename: str):
     return res
 
 
-def load_used(filename: str):
-    if not os.path.exists(filename):
-        return set()
-    with open(filename, "r", encoding="utf-8") as f:
-        return set(line.strip() for line in f)
-
-
-def save_used(filename: str, value: str):
-    with open(filename, "a", encoding="utf-8") as f:
-        f.write(value + "\n")
-
-
-def load_autoreplies(filename: str) -> Dict[str, str]:
+def load_autoreplies(filename: str) -> AutoReplyEngine:
     """
-    يحمّل ردود سريعة من ملف بالشكل:
-    كلمة=الرد الكامل
+    يحمّل ردود سريعة من ملف بالشكل (الفاصل | أو =):
+    كلمة|الرد الكامل      (تطابق كامل)
+    كلمة*|الرد            (الرسالة تبدأ بالكلمة)
+    *كلمة*|الرد           (الكلمة داخل الرسالة)
     ويتم تخزين المفتاح بعد normalize_text كي يكون التطابق أسهل.
     """
-    if not os.path.exists(filename):
-        return {}
+    return AutoReplyEngine(load_rules(filename, normalize_text))
 
-    data: Dict[str, str] = {}
-    with open(filename, "r", encoding="utf-8") as f:
-        for line in f:
-            line = line.strip()
-            if not line or line.startswith("#"):
-                continue
-            if "=" not in line:
-                continue
-            key, value = line.split("=", 1)
-            key_norm = normalize_text(key)
-            data[key_norm] = value.strip()
-    return data
+# =============================
+# State Backend
+# =============================
+STATE = create_backend(
+    STATE_BACKEND,
+    STATS_FILE,
+    STATS_JOURNAL_FILE,
+    STATS_JOURNAL_MAX_BYTES,
+    STATE_DB,
+    cardinality=STATS_CARDINALITY,
+    busy_timeout=SQLITE_BUSY_TIMEOUT,
+)
+atexit.register(STATE.close)
 
 # =============================
 # Load Game Files
 # =============================
-KT_QUESTIONS = load_list_file("questions.txt") or ["كم عمرك؟", "ما هوايتك؟"]
-GENERAL_RIDDLES = load_general_questions("general_riddles.txt") or [("ما عاصمة فرنسا؟", "باريس")]
-WOULD_YOU_RATHER = load_list_file("would_you_rather.txt") or ["لو خيروك تعيش غني أو فقير مع من تحب؟"]
-WHO_QUESTIONS = load_list_file("who.txt") or ["من أكثر شخص يعجبك بالقروب؟"]
-CRIMES = load_list_file("crimes.txt") or ["رجل مات في غرفة مغلقة | مات بسكتة قلبية"]
-FACTS = load_list_file("facts.txt") or ["الحقيقة ليست دائمًا ما نراه."]
-
-USED_KT = load_used("used_kt.txt")
-USED_GENERAL = load_used("used_general.txt")
-USED_WYR = load_used("used_wyr.txt")
-USED_WHO = load_used("used_who.txt")
-USED_CRIMES = load_used("used_crimes.txt")
-USED_FACTS = load_used("used_facts.txt")
-
-AUTOREPLIES = load_autoreplies("autoreplies.txt")
+# أسئلة افتراضية إن كان ملف اللعبة غير موجود أو فارغ
+DEFAULT_QUESTIONS = {
+    "kt": ["كم عمرك؟", "ما هوايتك؟"],
+    "general": [("ما عاصمة فرنسا؟", "باريس")],
+    "wyr": ["لو خيروك تعيش غني أو فقير مع من تحب؟"],
+    "who": ["من أكثر شخص يعجبك بالقروب؟"],
+    "crimes": ["رجل مات في غرفة مغلقة | مات بسكتة قلبية"],
+    "facts": ["الحقيقة ليست دائمًا ما نراه."],
+    # Truth/Dare (جديدة)
+    "truth": [
+        "ما هي أكثر صفة تحبها في نفسك؟",
+        "ما هو أكثر موقف مضحك حصل لك؟",
+        "لو تقدر ترجع بالزمن، أي سنة ترجع؟",
+    ],
+    "dare": [
+        "غيّر اسمك في القروب لاسم مضحك لمدة 10 دقائق.",
+        "ارسل آخر إيموجي استخدمته وقل لنا قصته 😹",
+        "اكتب رسالة مدح لآخر واحد كتب في القروب.",
+    ],
+}
+
+
+def load_banks():
+    """
+    يفتح banks.bin (mmap) ويعيد بناءه إن تغيّرت ملفات النص.
+    إن تعذّر ذلك (مثلاً نظام ملفات للقراءة فقط) نرجع للقراءة النصية القديمة.
+    يرجع (القوائم، هل أعادت هذه العملية بناء الملف).
+    """
+    try:
+        rebuilt = refresh_banks(DEFAULT_SOURCES, DEFAULT_BANKS_FILE)
+        banks = open_banks(DEFAULT_SOURCES, DEFAULT_BANKS_FILE, refresh=False)
+    except Exception as e:
+        print("⚠️ banks.bin unavailable, loading text files:", e)
+        rebuilt = True
+        banks = {
+            name: (load_general_questions if kind == KIND_PAIRS else load_list_file)(filename)
+            for name, (filename, kind) in DEFAULT_SOURCES.items()
+        }
+    return {name: banks[name] or DEFAULT_QUESTIONS[name] for name in DEFAULT_QUESTIONS}, rebuilt
+
+
+def question_texts(pool):
+    """
+    نص السؤال فقط لكل عنصر (بدون جواب الأسئلة العامة).
+    """
+    if isinstance(pool, MmapBank):
+        return pool.questions()
+    return [q[0] if isinstance(q, tuple) else q for q in pool]
+
+
+def content_signature() -> tuple:
+    return sources_signature(DEFAULT_SOURCES) + sources_signature({"autoreplies": (AUTOREPLIES_FILE, 0)})
+
+
+# القوائم تُستبدل كاملة عند إعادة التحميل، فكل قراءة لـ QUESTION_BANKS ترى نسخة متسقة
+CONTENT_SIGNATURE = content_signature()
+QUESTION_BANKS, _ = load_banks()
+AUTOREPLIES = load_autoreplies(AUTOREPLIES_FILE)
 
 # =============================
-# Truth/Dare Game Files (جديدة)
+# Question Rotation (بدون تكرار)
 # =============================
-TRUTH_QUESTIONS = load_list_file("truth.txt") or [
-    "ما هي أكثر صفة تحبها في نفسك؟",
-    "ما هو أكثر موقف مضحك حصل لك؟",
-    "لو تقدر ترجع بالزمن، أي سنة ترجع؟",
-]
+# يمنع السحب أثناء استبدال القوائم ونقل الـ decks (لحظات قليلة عند إعادة التحميل فقط)
+BANKS_LOCK = threading.Lock()
+RELOAD_LOCK = threading.Lock()
+
+# دورة واحدة للجميع (QUESTION_ROTATION=global)
+DECKS = {}
+if QUESTION_ROTATION == "global":
+    DECKS = {
+        name: STATE.deck(name, question_texts(pool))
+        for name, pool in QUESTION_BANKS.items()
+    }
+
+# دورة لكل محادثة/مستخدم: حالة صغيرة لكل (محادثة، لعبة) مع حذف الخامل
+ROTATIONS = STATE.rotation_store(
+    max_entries=ROTATION_MAX_ENTRIES,
+    idle_ttl=ROTATION_IDLE_DAYS * 86400,
+)
+ROTATION_SAVER = None
+if hasattr(ROTATIONS, "snapshot"):
+    ROTATION_SAVER = WriteBehindSaver(
+        ROTATIONS.snapshot,
+        ROTATIONS.save,
+        flush_interval=ROTATION_FLUSH_INTERVAL,
+        max_dirty=10 ** 9,
+        lock=ROTATIONS.lock,
+    )
+    ROTATION_SAVER.start()
+    atexit.register(ROTATION_SAVER.stop)
 
-DARE_QUESTIONS = load_list_file("dare.txt") or [
-    "غيّر اسمك في القروب لاسم مضحك لمدة 10 دقائق.",
-    "ارسل آخر إيموجي استخدمته وقل لنا قصته 😹",
-    "اكتب رسالة مدح لآخر واحد كتب في القروب.",
-]
 
-USED_TRUTH = load_used("used_truth.txt")
-USED_DARE = load_used("used_dare.txt")
+def rotation_scope(update: Update):
+    if QUESTION_ROTATION == "user":
+        return update.effective_user.id if update.effective_user else None
+    if QUESTION_ROTATION == "chat":
+        return update.effective_chat.id if update.effective_chat else None
+    return None
 
 
-def choose_unique_question(pool, used_set, filename: str) -> str:
+def choose_unique_question(game: str, update: Update):
     """
-    يختار سؤال بدون تكرار حتى تنتهي القائمة، بعدها يعيد ضبط الاستخدام.
+    يختار سؤال من QUESTION_BANKS[game] بدون تكرار حتى تنتهي القائمة
+    (لكل محادثة أو مستخدم حسب QUESTION_ROTATION)، بعدها تبدأ دورة جديدة.
+    كلفة السحب O(1) مهما كبرت القائمة، ولا يوجد أي كتابة على القرص لكل سؤال.
     """
-    if not pool:
-        return "لا توجد أسئلة حالياً."
+    scope_id = rotation_scope(update)
+    with BANKS_LOCK:
+        pool = QUESTION_BANKS[game]
+        if not pool:
+            return "لا توجد أسئلة حالياً."
 
-    available = [q for q in pool if q not in used_set]
-    if not available:
-        used_set.clear()
         try:
-            open(filename, "w", encoding="utf-8").close()
-        except Exception:
-            pass
-        available = pool
+            if scope_id is None:
+                deck = DECKS.get(game)
+                if deck is None:
+                    deck = DECKS[game] = STATE.deck(game, question_texts(pool))
+                return pool[deck.draw()]
+
+            index = ROTATIONS.draw(scope_id, game, len(pool))
+        except Exception as e:
+            # مثلاً قاعدة SQLite مقفلة عند worker آخر أكثر من SQLITE_BUSY_TIMEOUT:
+            # سؤال عشوائي أفضل من عدم الرد
+            print("⚠️ question draw failed:", e)
+            return random.choice(pool)
+    if ROTATION_SAVER is not None:
+        ROTATION_SAVER.mark_dirty()
+    return pool[index]
 
-    q = random.choice(available)
-    used_set.add(q)
-    try:
-        with open(filename, "a", encoding="utf-8") as f:
-            f.write(q + "\n")
-    except Exception:
-        pass
-    return q
+
+# =============================
+# Content Hot-Reload
+# =============================
+def reload_content(force: bool = False):
+    """
+    يعيد تحميل ملفات الأسئلة والردود إن تغيّرت (أو دائماً مع force).
+    القراءة وبناء banks.bin ومقارنة القوائم تتم خارج أي قفل (في thread)،
+    ثم الاستبدال ونقل حالة "بدون تكرار" للمؤشرات الجديدة تحت BANKS_LOCK.
+    يرجع أسماء القوائم التي تغيّرت، أو None إن لم يتغير شيء.
+    """
+    global CONTENT_SIGNATURE, QUESTION_BANKS, AUTOREPLIES
+    with RELOAD_LOCK:
+        signature = content_signature()
+        if signature == CONTENT_SIGNATURE and not force:
+            return None
+
+        banks, rebuilt = load_banks()
+        autoreplies = load_autoreplies(AUTOREPLIES_FILE)
+        old_banks = QUESTION_BANKS
+        mappings = {}
+        for game, pool in banks.items():
+            old = old_banks[game]
+            mapping = index_mapping(question_texts(old), question_texts(pool))
+            if mapping is not None or len(old) != len(pool):
+                mappings[game] = mapping
+
+        with BANKS_LOCK:
+            for game, mapping in mappings.items():
+                old_n = len(old_banks[game])
+                if mapping is None or mapping[:old_n] == list(range(old_n)):
+                    ROTATIONS.carry_over(game, old_n)
+                # الـ deck ملف/جدول مشترك: تنقله العملية التي أعادت بناء banks.bin فقط
+                if rebuilt and game in DECKS:
+                    DECKS[game].remap(len(banks[game]), mapping)
+            QUESTION_BANKS = banks
+            AUTOREPLIES = autoreplies
+            ROUTER.set_replies(autoreplies.exact)
+        CONTENT_SIGNATURE = signature
+        return sorted(mappings)
+
+
+def watch_content() -> None:
+    while True:
+        time.sleep(CONTENT_RELOAD_INTERVAL)
+        try:
+            changed = reload_content()
+            if changed:
+                print("🔄 reloaded:", ", ".join(changed))
+        except Exception as e:
+            print("⚠️ content reload failed:", e)
+
+
+if CONTENT_RELOAD_INTERVAL > 0:
+    threading.Thread(target=watch_content, name="content-reload", daemon=True).start()
 
 
 def display_name_from_user(user) -> str:
@@ -266,44 +494,136 @@ def display_name_from_user(user) -> str:
 # =============================
 # Stats Persistence
 # =============================
+# التغييرات منذ آخر حفظ (تُكتب في STATE في الخلفية)
+STATS_DELTA = StatsDelta()
+
+
 def load_stats():
-    global TOTAL_MESSAGES, UNIQUE_USERS, UNIQUE_GROUPS, UNIQUE_PRIVATE_CHATS, ACTIVITY_BUCKETS
-    if not os.path.exists(STATS_FILE):
-        return
+    global TOTAL_MESSAGES, UNIQUE_USERS, UNIQUE_GROUPS, UNIQUE_PRIVATE_CHATS, ACTIVITY, ACTIVE_USERS
     try:
-        with open(STATS_FILE, "r", encoding="utf-8") as f:
-            data = json.load(f)
-        TOTAL_MESSAGES = data.get("total_messages", 0)
-        UNIQUE_USERS = set(data.get("unique_users", []))
-        UNIQUE_GROUPS = set(data.get("unique_groups", []))
-        UNIQUE_PRIVATE_CHATS = set(data.get("unique_private_chats", []))
-        ACTIVITY_BUCKETS.update(data.get("activity_buckets", {}))
+        data = STATE.load_stats()
     except Exception:
-        pass
+        return
+    TOTAL_MESSAGES = data["total_messages"]
+    UNIQUE_USERS = data["unique_users"]
+    UNIQUE_GROUPS = data["unique_groups"]
+    UNIQUE_PRIVATE_CHATS = data["unique_private_chats"]
+    ACTIVITY = data["activity"]
+    ACTIVE_USERS = data["active_users"]
 
 
-def save_stats():
-    data = {
+def full_stats_snapshot():
+    return {
         "total_messages": TOTAL_MESSAGES,
-        "unique_users": list(UNIQUE_USERS),
-        "unique_groups": list(UNIQUE_GROUPS),
-        "unique_private_chats": list(UNIQUE_PRIVATE_CHATS),
-        "activity_buckets": ACTIVITY_BUCKETS,
+        "unique_users": dump_unique(UNIQUE_USERS),
+        "unique_groups": dump_unique(UNIQUE_GROUPS),
+        "unique_private_chats": dump_unique(UNIQUE_PRIVATE_CHATS),
+        "activity": ACTIVITY.to_dict(),
+        "active_users": ACTIVE_USERS.to_dict(),
     }
+
+
+@timed
+def stats_snapshot():
+    """
+    يأخذ التغييرات المعلّقة (تُستدعى و STATS_LOCK مأخوذ).
+    اللقطة الكاملة تُنسخ فقط عندما يحين وقت دمج السجل.
+    """
+    global STATS_DELTA
+    delta = STATS_DELTA
+    STATS_DELTA = StatsDelta()
+    full = full_stats_snapshot() if STATE.needs_compaction() else None
+    return delta, full
+
+
+@timed
+def write_stats(data):
+    delta, full = data
+    STATE.save_stats(delta, full)
+
+
+def save_stats():
+    """
+    يحفظ الإحصائيات فوراً (بدون انتظار الخيط الخلفي).
+    """
+    STATS_SAVER.mark_dirty()
     try:
-        with open(STATS_FILE, "w", encoding="utf-8") as f:
-            json.dump(data, f, ensure_ascii=False)
+        STATS_SAVER.flush()
     except Exception:
         pass
 
 
+STATS_SAVER = WriteBehindSaver(
+    stats_snapshot,
+    write_stats,
+    flush_interval=STATS_FLUSH_INTERVAL,
+    max_dirty=STATS_FLUSH_EVERY,
+    lock=STATS_LOCK,
+)
+
+
 load_stats()
+STATS_SAVER.start()
+atexit.register(STATS_SAVER.stop)
+
+# =============================
+# Outbox (كل رسائل البوت تمر من هنا)
+# =============================
+OUTBOX = Outbox(
+    rate=OUTBOX_RATE,
+    group_rate=OUTBOX_GROUP_PER_MIN / 60,
+    workers=OUTBOX_WORKERS,
+)
+
+
+def reply(message, text: str, **kwargs) -> asyncio.Future:
+    """
+    يضع الرد في الطابور ويرجع فوراً. await على النتيجة فقط عند الحاجة (message_id).
+    """
+    return OUTBOX.submit(message.chat_id, lambda: message.reply_text(text, **kwargs))
+
+
+def send(bot, chat_id: int, text: str, **kwargs) -> asyncio.Future:
+    return OUTBOX.submit(chat_id, lambda: bot.send_message(chat_id=chat_id, text=text, **kwargs))
+
+
+def edit(message, text: str, **kwargs) -> asyncio.Future:
+    return OUTBOX.submit(message.chat_id, lambda: message.edit_text(text, **kwargs))
+
+
+def edit_by_id(
+    bot,
+    chat_id: int,
+    message_id: int,
+    text: str,
+    priority: int = INTERACTIVE,
+    coalesce: bool = False,
+    **kwargs,
+) -> asyncio.Future:
+    """
+    coalesce: تعديل يكفي آخره (مثل عدد اللاعبين): لا ينتظر رسائل المحادثة،
+    والتعديل الأحدث لنفس الرسالة يحل محل ما لم يُرسل بعد.
+    """
+    return OUTBOX.submit(
+        chat_id,
+        lambda: bot.edit_message_text(text, chat_id=chat_id, message_id=message_id, **kwargs),
+        priority=priority,
+        key=("edit", message_id) if coalesce else None,
+    )
+
+
+def reply_document(message, data: bytes, filename: str, **kwargs) -> asyncio.Future:
+    return OUTBOX.submit(
+        message.chat_id,
+        lambda: message.reply_document(document=data, filename=filename, **kwargs),
+    )
 
 # =============================
 # Bot Commands
 # =============================
 async def start(update: Update, context: ContextTypes.DEFAULT_TYPE):
-    await update.message.reply_text(
+    reply(
+        update.message,
         "👋 أهلاً بك في بوت الألعاب.\n\n"
         "استخدم `/help` لعرض الشرح الكامل.\n"
         "واكتب `العاب` أو استخدم `/games` لعرض قائمة الألعاب."
@@ -311,28 +631,63 @@ async def start(update: Update, context: ContextTypes.DEFAULT_TYPE):
 
 
 async def help_cmd(update: Update, context: ContextTypes.DEFAULT_TYPE):
-    await update.message.reply_text(HELP_TEXT, parse_mode="Markdown")
+    reply(update.message, HELP_TEXT, parse_mode="Markdown")
 
 
 async def developer(update: Update, context: ContextTypes.DEFAULT_TYPE):
-    await update.message.reply_text(
+    reply(
+        update.message,
         f"👨‍💻 المطور:\n{DEVELOPER_NAME}\n{DEVELOPER_USERNAME}\n{DEVELOPER_LINK}"
     )
 
 
 async def games(update: Update, context: ContextTypes.DEFAULT_TYPE):
-    await update.message.reply_text(GAMES_HELP_TEXT, parse_mode="Markdown")
+    reply(update.message, GAMES_HELP_TEXT, parse_mode="Markdown")
 
 
 # ========= BroadCast (بودكاست) =========
+def forget_group(chat_id: int, reason: str = ""):
+    """
+    يحذف جروب ميت (البوت مطرود منه أو لم يعد موجوداً) من قائمة الإرسال.
+    لو رجع البوت للجروب لاحقاً يُضاف تلقائياً مع أول رسالة.
+    """
+    with STATS_LOCK:
+        UNIQUE_GROUPS.discard(chat_id)
+        STATS_DELTA.remove_group(chat_id)
+    STATS_SAVER.mark_dirty()
+
+
+def migrate_group(old_chat_id: int, new_chat_id: int):
+    """
+    الجروب تحوّل إلى supergroup بمعرّف جديد.
+    """
+    with STATS_LOCK:
+        UNIQUE_GROUPS.discard(old_chat_id)
+        STATS_DELTA.remove_group(old_chat_id)
+        if UNIQUE_GROUPS.add_new(new_chat_id):
+            STATS_DELTA.groups.append(new_chat_id)
+    STATS_SAVER.mark_dirty()
+
+
+BROADCASTS = BroadcastEngine(
+    BROADCAST_JOB_FILE,
+    BROADCAST_PROGRESS_FILE,
+    concurrency=BROADCAST_CONCURRENCY,
+    on_dead_chat=forget_group,
+    on_migrated=migrate_group,
+    outbox=OUTBOX,
+)
+
+
 async def podcast_broadcast(update: Update, context: ContextTypes.DEFAULT_TYPE):
     """
     هذا الأمر خاص بالمطور فقط.
     الفكرة: يكتب المطور /podcast نص الرسالة
     فيقوم البوت بإرسالها لكل الجروبات المسجلة في UNIQUE_GROUPS.
+    الإرسال يتم في الخلفية، ورسالة الحالة تُحدَّث بالتقدم.
     """
     if not is_developer(update):
-        await update.message.reply_text("هذه الميزة خاصة بالمطور فقط. 🚫")
+        reply(update.message, "هذه الميزة خاصة بالمطور فقط. 🚫")
         return
 
     # نص الرسالة بعد الأمر /podcast
@@ -344,7 +699,8 @@ async def podcast_broadcast(update: Update, context: ContextTypes.DEFAULT_TYPE):
             args_text = update.message.reply_to_message.text.strip()
 
     if not args_text:
-        await update.message.reply_text(
+        reply(
+            update.message,
             "اكتب الأمر بالشكل التالي:\n"
             "`/podcast نص الرسالة المراد إرسالها`\n"
             "أو رد /podcast على رسالة موجودة.",
@@ -352,66 +708,402 @@ async def podcast_broadcast(update: Update, context: ContextTypes.DEFAULT_TYPE):
         )
         return
 
-    if not UNIQUE_GROUPS:
-        await update.message.reply_text("لا توجد أي جروبات مسجلة حالياً لإرسال الرسالة لها.")
+    # في وضع عدة workers نأخذ الجروبات من الـ backend المشترك
+    group_ids = await asyncio.to_thread(STATE.group_ids)
+    if group_ids is None:
+        group_ids = list(UNIQUE_GROUPS)
+
+    if not group_ids:
+        reply(update.message, "لا توجد أي جروبات مسجلة حالياً لإرسال الرسالة لها.")
         return
 
-    sent = 0
-    failed = 0
+    if BROADCASTS.running or BROADCASTS.pending_job():
+        reply(
+            update.message,
+            "هناك إرسال جارٍ بالفعل ⏳\n"
+            "لإيقافه استخدم /podcast_stop"
+        )
+        return
 
-    for chat_id in list(UNIQUE_GROUPS):
-        try:
-            await context.bot.send_message(chat_id=chat_id, text=args_text)
-            sent += 1
-        except Exception:
-            failed += 1
-
-    await update.message.reply_text(
-        f"✅ تم إرسال الرسالة إلى {sent} جروب.\n"
-        f"❌ فشل الإرسال إلى {failed} (ربما البوت مطرود من بعضها)."
+    status = await reply(
+        update.message,
+        f"📡 جاري الإرسال إلى {len(group_ids)} جروب..."
+    )
+    # مهمة asyncio عادية (وليس application.create_task الذي ينتظره
+    # Application.stop حتى ينتهي الإرسال كله)؛ stop_services يوقفها
+    BROADCASTS.start(
+        BULK_BOT,
+        asyncio.create_task,
+        args_text,
+        group_ids,
+        status_chat_id=status.chat_id,
+        status_message_id=status.message_id,
     )
 
+
+async def podcast_stop(update: Update, context: ContextTypes.DEFAULT_TYPE):
+    if not is_developer(update):
+        reply(update.message, "هذه الميزة خاصة بالمطور فقط. 🚫")
+        return
+
+    if BROADCASTS.cancel():
+        reply(update.message, "⛔ تم إيقاف الإرسال.")
+    else:
+        reply(update.message, "لا يوجد إرسال جارٍ حالياً.")
+
+
+async def reload_cmd(update: Update, context: ContextTypes.DEFAULT_TYPE):
+    if not is_developer(update):
+        reply(update.message, "هذه الميزة خاصة بالمطور فقط. 🚫")
+        return
+
+    try:
+        changed = await asyncio.to_thread(reload_content, True)
+    except Exception as e:
+        reply(update.message, f"⚠️ فشل إعادة التحميل: {e}")
+        return
+    counts = "\n".join(f"{name}: {len(pool)}" for name, pool in QUESTION_BANKS.items())
+    reply(
+        update.message,
+        "🔄 تم إعادة تحميل الأسئلة والردود.\n"
+        f"تغيّرت: {', '.join(changed) if changed else 'لا شيء'}\n\n{counts}"
+    )
+
+
+# ========= التشخيص (للمطور فقط) =========
+PROFILER = SamplingProfiler(interval=PROFILE_INTERVAL, max_seconds=PROFILE_MAX_SECONDS)
+MEMORY_TRACER = MemoryTracer(max_seconds=MEMTRACE_MAX_SECONDS)
+# عدد التحديثات لكل محادثة (يُعدّ في ChatOrderedUpdateProcessor)
+CHAT_UPDATES = TopCounter()
+
+
+def profile_filename() -> str:
+    return time.strftime("profile-%Y%m%d-%H%M%S.folded", time.gmtime(PROFILER.started_at))
+
+
+def profile_caption() -> str:
+    top = "\n".join(f"{n} {name}" for name, n in PROFILER.top_functions(8))
+    caption = (
+        f"🔬 {PROFILER.samples} عينة خلال {PROFILER.seconds:.0f} ثانية "
+        f"(كل {PROFILER.interval * 1000:.0f}ms)\n"
+        f"الأكثر ظهوراً في أعلى الـ stack:\n{top}"
+    )
+    return caption[:1000]
+
+
+async def finish_profile(message):
+    await asyncio.to_thread(PROFILER.wait)
+    reply_document(
+        message,
+        PROFILER.collapsed().encode("utf-8"),
+        profile_filename(),
+        caption=profile_caption(),
+    )
+
+
+async def profile_cmd(update: Update, context: ContextTypes.DEFAULT_TYPE):
+    """
+    /profile [ثواني] : CPU profile للبوت وهو يعمل، والنتيجة ملف collapsed stacks
+    (flamegraph.pl أو speedscope.app). /profile stop يوقفه مبكراً.
+    """
+    if not is_developer(update):
+        reply(update.message, "هذه الميزة خاصة بالمطور فقط. 🚫")
+        return
+
+    arg = context.args[0] if context.args else ""
+    if arg == "stop":
+        PROFILER.stop()
+        return
+    try:
+        seconds = float(arg or 10)
+    except ValueError:
+        seconds = 10
+    if not PROFILER.start(seconds):
+        reply(update.message, "هناك profile يعمل بالفعل ⏳ (/profile stop لإيقافه)")
+        return
+    reply(update.message, f"🔬 جاري أخذ العينات لمدة {PROFILER.seconds:.0f} ثانية...")
+    # الانتظار في task منفصلة حتى لا تُحجز محادثة المطور (ولا يتأخر /profile stop)
+    track_service_task(asyncio.create_task(finish_profile(update.message)))
+
+
+async def memdiff_cmd(update: Update, context: ContextTypes.DEFAULT_TYPE):
+    """
+    /memdiff start : يبدأ tracemalloc (يتوقف تلقائياً بعد MEMTRACE_MAX_SECONDS).
+    /memdiff       : أكثر الأسطر زيادة في الذاكرة منذ اللقطة السابقة.
+    /memdiff stop  : يوقف التتبع.
+    """
+    if not is_developer(update):
+        reply(update.message, "هذه الميزة خاصة بالمطور فقط. 🚫")
+        return
+
+    arg = context.args[0] if context.args else ""
+    if arg == "start":
+        if MEMORY_TRACER.start():
+            reply(update.message, f"🧠 بدأ تتبع الذاكرة (يتوقف تلقائياً بعد {MEMTRACE_MAX_SECONDS / 60:.0f} دقيقة).")
+        else:
+            reply(update.message, "تتبع الذاكرة يعمل بالفعل.")
+        return
+    if arg == "stop":
+        MEMORY_TRACER.stop()
+        reply(update.message, "🧠 تم إيقاف تتبع الذاكرة.")
+        return
+    diff = await asyncio.to_thread(MEMORY_TRACER.diff)
+    if diff is None:
+        reply(update.message, "تتبع الذاكرة غير مفعّل. ابدأ بـ /memdiff start")
+        return
+    reply(update.message, f"🧠 الذاكرة منذ آخر لقطة:\n{diff}")
+
+
+def top_chats_text(n: int) -> str:
+    elapsed = max(1.0, time.time() - CHAT_UPDATES.since)
+    lines = [f"📊 أكثر المحادثات تحديثات خلال {elapsed / 60:.0f} دقيقة ({CHAT_UPDATES.total} تحديث):"]
+    for chat_id, count in CHAT_UPDATES.top(n):
+        lines.append(f"{chat_id}: {count} ({count * 60 / elapsed:.1f}/دقيقة)")
+    return "\n".join(lines)
+
+
+async def topchats_cmd(update: Update, context: ContextTypes.DEFAULT_TYPE):
+    """
+    /topchats [عدد] : المحادثات الأكثر تحديثات منذ التشغيل أو آخر /topchats reset.
+    """
+    if not is_developer(update):
+        reply(update.message, "هذه الميزة خاصة بالمطور فقط. 🚫")
+        return
+
+    arg = context.args[0] if context.args else ""
+    if arg == "reset":
+        CHAT_UPDATES.reset()
+        reply(update.message, "📊 تم تصفير العدّاد.")
+        return
+    n = int(arg) if arg.isdigit() else 20
+    reply(update.message, top_chats_text(min(n, 100)))
+
+
+# مهام الخلفية التي تعمل مع البوت (تُلغى عند الإيقاف)
+SERVICE_TASKS = []
+
+
+def track_service_task(task: asyncio.Task) -> None:
+    """
+    لمهام قصيرة (مثل /profile): تُلغى عند الإيقاف، وتخرج من القائمة عند انتهائها.
+    """
+    SERVICE_TASKS.append(task)
+    task.add_done_callback(forget_service_task)
+
+
+def forget_service_task(task: asyncio.Task) -> None:
+    # stop_services يفرغ القائمة بعد الإلغاء
+    if task in SERVICE_TASKS:
+        SERVICE_TASKS.remove(task)
+
+
+async def start_services(application):
+    await BULK_BOT.initialize()
+    await resume_broadcast(application)
+    restored = restore_join_timers(application)
+    if restored:
+        print(f"⏱ restored {restored} truth/dare join timers")
+    SERVICE_TASKS.append(asyncio.create_task(sweep_chat_state(application)))
+    SERVICE_TASKS.append(asyncio.create_task(watch_loop_lag()))
+
+
+async def stop_services(application=None):
+    for task in SERVICE_TASKS + list(JOIN_TIMERS.values()) + list(JOIN_EDITS.values()):
+        task.cancel()
+    SERVICE_TASKS.clear()
+    JOIN_TIMERS.clear()
+    JOIN_EDITS.clear()
+    # قبل إيقاف الطابور: الإذاعة تُلغى وتحفظ تقدمها لتُستأنف لاحقاً
+    await BROADCASTS.stop()
+    await OUTBOX.stop()
+    await BULK_BOT.shutdown()
+
+
+async def resume_broadcast(application):
+    """
+    يكمل إرسال /podcast لم ينتهِ قبل إعادة التشغيل (worker واحد فقط).
+    """
+    if BROADCASTS.pending_job() and await asyncio.to_thread(STATE.acquire_lease, "broadcast_resume", 60):
+        BROADCASTS.resume(BULK_BOT, asyncio.create_task)
+
 # =============================
 # Truth/Dare Game Logic (جديد)
 # =============================
-async def td_start_new_turn(chat_id: int, context: ContextTypes.DEFAULT_TYPE):
+TD_JOIN_SECONDS = 60
+TD_JOIN_KEYBOARD = InlineKeyboardMarkup([
+    [InlineKeyboardButton("✅ انضمام للعبة", callback_data="td_join")]
+])
+# مؤقتات إغلاق الانضمام (بدون JobQueue): chat_id -> task
+JOIN_TIMERS: Dict[int, asyncio.Task] = {}
+# تعديلات رسالة الانضمام المؤجلة، ووقت آخر تعديل لكل قروب
+JOIN_EDITS: Dict[int, asyncio.Task] = {}
+JOIN_EDITED_AT: Dict[int, float] = {}
+
+
+def peek_game(chat_data) -> Optional[TruthDareGame]:
+    game = chat_data.get("truth_dare_game")
+    if isinstance(game, dict):
+        # محفوظة بالصيغة القديمة (قبل TruthDareGame)
+        game = chat_data["truth_dare_game"] = TruthDareGame.from_legacy(game)
+    return game
+
+
+def td_game(chat_data) -> Optional[TruthDareGame]:
     """
-    يبدأ دور جديد: يختار لاعب عشوائي من المشاركين بدون تكرار
-    حتى يمر على الجميع، ثم يعيد الدورة.
+    لعبة المحادثة الحالية، مع تحديث وقت آخر نشاط (تُحذف بعد TD_GAME_TTL_HOURS بدون نشاط).
     """
-    chat_data = context.chat_data
-    game = chat_data.get("truth_dare_game")
-    if not game or game.get("status") != "running":
+    game = peek_game(chat_data)
+    return game.touch() if game is not None else None
+
+
+def schedule_join_close(application, chat_id: int, deadline: float) -> None:
+    cancel_join_close(chat_id)
+
+    async def close():
+        await asyncio.sleep(max(0.0, deadline - time.time()))
+        JOIN_TIMERS.pop(chat_id, None)
+        await td_close_join_phase(application, chat_id)
+
+    JOIN_TIMERS[chat_id] = asyncio.create_task(close())
+
+
+def cancel_join_close(chat_id: int) -> None:
+    task = JOIN_TIMERS.pop(chat_id, None)
+    if task is not None:
+        task.cancel()
+
+
+def join_text(count: int) -> str:
+    return (
+        f"🕹 *جولة جديدة: تحدي أو صراحة*\n"
+        f"عدد اللاعبين المنضمين حتى الآن: {count}\n"
+        "اضغط على الزر بالأسفل للانضمام خلال دقيقة واحدة ⏱"
+    )
+
+
+def schedule_join_edit(application, chat_id: int) -> None:
+    """
+    تحديث عدد اللاعبين في رسالة الانضمام: أول انضمام يُعدَّل فوراً، وما يأتي
+    خلال TD_JOIN_EDIT_INTERVAL يُجمع في تعديل واحد بآخر عدد وقت الإرسال.
+    """
+    if chat_id in JOIN_EDITS:
         return
+    delay = JOIN_EDITED_AT.get(chat_id, 0.0) + TD_JOIN_EDIT_INTERVAL - time.time()
+
+    async def run():
+        if delay > 0:
+            await asyncio.sleep(delay)
+        JOIN_EDITS.pop(chat_id, None)
+        game = peek_game(application.chat_data.get(chat_id) or {})
+        if not game or game.status != COLLECTING or game.join_message_id is None:
+            return
+        JOIN_EDITED_AT[chat_id] = time.time()
+        # مسار الإذاعة: ردود اللعبة في نفس القروب تُرسل قبله
+        edit_by_id(
+            application.bot,
+            chat_id,
+            game.join_message_id,
+            join_text(len(game.participants)),
+            priority=BACKGROUND,
+            coalesce=True,
+            reply_markup=TD_JOIN_KEYBOARD,
+            parse_mode="Markdown",
+        )
+
+    JOIN_EDITS[chat_id] = asyncio.create_task(run())
 
-    participants = list(game.get("participants", {}).keys())
-    if not participants:
-        await context.bot.send_message(chat_id=chat_id, text="لا يوجد لاعبين في اللعبة.")
-        game["status"] = "ended"
+
+def finish_join_message(application, chat_id: int, game: TruthDareGame) -> None:
+    """
+    التعديل الأخير لرسالة الانضمام عند إغلاقه: العدد النهائي وبدون زر.
+    """
+    task = JOIN_EDITS.pop(chat_id, None)
+    if task is not None:
+        task.cancel()
+    JOIN_EDITED_AT.pop(chat_id, None)
+    if game.join_message_id is None:
         return
+    # نفس طابور تعديلات العدد: يحل محل تعديل لم يُرسل بعد، ولا يسبقه تعديل قديم
+    edit_by_id(
+        application.bot,
+        chat_id,
+        game.join_message_id,
+        f"🕹 *جولة تحدي أو صراحة*\nانتهى الانضمام، عدد اللاعبين: {len(game.participants)}",
+        coalesce=True,
+        parse_mode="Markdown",
+    )
+
 
-    remaining = game.get("remaining_players")
-    if not remaining:
-        remaining = participants.copy()
+def restore_join_timers(application) -> int:
+    """
+    بعد إعادة التشغيل: الألعاب التي كانت في مرحلة الانضمام تُغلق في موعدها
+    الأصلي المحفوظ (أو فوراً إن كان قد فات).
+    """
+    restored = 0
+    for chat_id, chat_data in application.chat_data.items():
+        game = peek_game(chat_data)
+        if game and game.status == COLLECTING:
+            schedule_join_close(application, chat_id, game.join_deadline)
+            restored += 1
+    return restored
 
-    player_id = random.choice(remaining)
-    remaining.remove(player_id)
 
-    game["remaining_players"] = remaining
-    game["current_player_id"] = player_id
-    game["current_round"] = {
-        "player_id": player_id,
-        "final_choice": None,
-        "switched": False,
-    }
+def evict_chat_state(application) -> int:
+    """
+    يحذف ألعاب تحدي/صراحة المنتهية أو المتروكة وإجابات الأسئلة القديمة، ثم
+    المحادثات والمستخدمين الذين لم يبقَ لهم شيء (PTB ينشئ dict فارغاً لكل
+    محادثة يصلها تحديث، فبدون هذا تكبر الذاكرة مع عدد القروبات).
+    """
+    now = time.time()
+    dropped = 0
+    for chat_id, chat_data in list(application.chat_data.items()):
+        game = peek_game(chat_data)
+        if game is not None and (
+            game.status == ENDED or now - game.updated > TD_GAME_TTL_HOURS * 3600
+        ):
+            del chat_data["truth_dare_game"]
+            cancel_join_close(chat_id)
+            JOIN_EDITED_AT.pop(chat_id, None)
+            application.mark_data_for_update_persistence(chat_ids=chat_id)
+        if not chat_data:
+            application.drop_chat_data(chat_id)
+            dropped += 1
+    for user_id, user_data in list(application.user_data.items()):
+        if user_data and now - user_data.get("answer_at", 0) > USER_STATE_TTL_HOURS * 3600:
+            user_data.clear()
+        if not user_data:
+            application.drop_user_data(user_id)
+            dropped += 1
+    return dropped
+
+
+async def sweep_chat_state(application):
+    while True:
+        await asyncio.sleep(CHAT_STATE_SWEEP_INTERVAL)
+        try:
+            evict_chat_state(application)
+        except Exception as e:
+            print("⚠️ chat state sweep error:", e)
+
+
+async def td_start_new_turn(chat_id: int, context: ContextTypes.DEFAULT_TYPE):
+    """
+    يبدأ دور جديد: يختار لاعب عشوائي من المشاركين بدون تكرار
+    حتى يمر على الجميع، ثم يعيد الدورة.
+    """
+    chat_data = context.chat_data
+    game = td_game(chat_data)
+    if not game or game.status != RUNNING:
+        return
 
-    player_info = game["participants"].get(player_id)
-    mention = player_info.get("name") if player_info else str(player_id)
-    if player_info and player_info.get("username"):
-        mention = f"@{player_info['username']}"
+    player = game.next_player()
+    if player is None:
+        send(context.bot, chat_id, "لا يوجد لاعبين في اللعبة.")
+        game.status = ENDED
+        return
 
     text = (
-        f"🎯 الدور الآن على {mention}\n"
+        f"🎯 الدور الآن على {player.mention}\n"
         "اختر: تحدي أو صراحة 👇"
     )
 
@@ -422,105 +1114,84 @@ async def td_start_new_turn(chat_id: int, context: ContextTypes.DEFAULT_TYPE):
         ]
     ])
 
-    await context.bot.send_message(chat_id=chat_id, text=text, reply_markup=keyboard)
+    send(context.bot, chat_id, text, reply_markup=keyboard)
 
 
-async def td_close_join_phase(context: ContextTypes.DEFAULT_TYPE):
+async def td_close_join_phase(application, chat_id: int):
     """
     تُستدعى آلياً بعد دقيقة من بدء اللعبة لإغلاق الانضمام.
     """
-    job = context.job
-    chat_id = job.chat_id
-    chat_data = context.chat_data
-    game = chat_data.get("truth_dare_game")
+    # مع عدة workers: worker واحد فقط يغلق، وبآخر نسخة محفوظة من اللعبة
+    if STATE.shared:
+        if not await asyncio.to_thread(STATE.acquire_lease, f"td_join_{chat_id}", TD_JOIN_SECONDS):
+            return
+        await application.persistence.refresh_chat_data(chat_id, application.chat_data[chat_id])
+    chat_data = application.chat_data.get(chat_id)
+    game = peek_game(chat_data) if chat_data else None
 
-    if not game or game.get("status") != "collecting":
+    if not game or game.status != COLLECTING:
         return
 
-    participants = list(game.get("participants", {}).values())
-    if not participants:
-        await context.bot.send_message(
-            chat_id=chat_id,
-            text="⏰ انتهى وقت الانضمام ولم ينضم أحد للعبة."
-        )
-        game["status"] = "ended"
+    application.mark_data_for_update_persistence(chat_ids=chat_id)
+    finish_join_message(application, chat_id, game)
+    if not game.participants:
+        send(application.bot, chat_id, "⏰ انتهى وقت الانضمام ولم ينضم أحد للعبة.")
+        game.status = ENDED
         return
 
-    game["status"] = "waiting_start"
-    game["remaining_players"] = list(game["participants"].keys())
+    game.status = WAITING_START
 
     lines = ["⏰ انتهى وقت الانضمام!\n", "اللاعبون المشاركون:"]
-    for p in participants:
-        if p.get("username"):
-            lines.append(f"- @{p['username']}")
-        else:
-            lines.append(f"- {p['name']}")
+    lines.extend(f"- {p.mention}" for p in game.participants.values())
     text = "\n".join(lines)
 
     keyboard = InlineKeyboardMarkup([
         [InlineKeyboardButton("▶️ بدء اللعبة", callback_data="td_start")]
     ])
 
-    await context.bot.send_message(chat_id=chat_id, text=text, reply_markup=keyboard)
+    send(application.bot, chat_id, text, reply_markup=keyboard)
 
 
 async def td_join_callback(update: Update, context: ContextTypes.DEFAULT_TYPE):
     query = update.callback_query
     await query.answer()
     chat_data = context.chat_data
-    game = chat_data.get("truth_dare_game")
+    game = td_game(chat_data)
 
-    if not game or game.get("status") != "collecting":
+    if not game or game.status != COLLECTING:
         await query.answer("لا توجد لعبة مفتوحة للانضمام حالياً.", show_alert=True)
         return
 
     user = query.from_user
-    participants = game.setdefault("participants", {})
-
-    if user.id in participants:
+    if not game.join(user.id, user.full_name, user.username):
         await query.answer("أنت منضم للعبة بالفعل ✅", show_alert=False)
         return
 
-    participants[user.id] = {
-        "id": user.id,
-        "name": user.full_name,
-        "username": user.username,
-    }
-
     await query.answer("تم انضمامك للعبة 🎮", show_alert=False)
-
-    try:
-        count = len(participants)
-        await query.message.edit_text(
-            f"🕹 *جولة جديدة: تحدي أو صراحة*\n"
-            f"عدد اللاعبين المنضمين حتى الآن: {count}\n"
-            "اضغط على الزر بالأسفل للانضمام خلال دقيقة واحدة ⏱",
-            reply_markup=query.message.reply_markup,
-            parse_mode="Markdown",
-        )
-    except Exception:
-        pass
+    schedule_join_edit(context.application, query.message.chat.id)
 
 
 async def td_start_callback(update: Update, context: ContextTypes.DEFAULT_TYPE):
     query = update.callback_query
     await query.answer()
     chat_data = context.chat_data
-    game = chat_data.get("truth_dare_game")
+    game = td_game(chat_data)
 
-    if not game or game.get("status") not in ("waiting_start", "collecting"):
+    if not game or game.status not in (WAITING_START, COLLECTING):
         await query.answer("لا يمكن بدء اللعبة حالياً.", show_alert=True)
         return
 
-    participants = list(game.get("participants", {}).keys())
-    if len(participants) < 1:
+    if not game.participants:
         await query.answer("لا يوجد لاعبين كفاية لبدء اللعبة.", show_alert=True)
-        game["status"] = "ended"
+        game.status = ENDED
         return
 
-    game["status"] = "running"
+    if game.status == COLLECTING:
+        cancel_join_close(query.message.chat.id)
+        finish_join_message(context.application, query.message.chat.id, game)
+    game.status = RUNNING
 
-    await query.message.reply_text("✅ تم بدء لعبة تحدي/صراحة! لنبدأ 🔥")
+    reply(query.message, "✅ تم بدء لعبة تحدي/صراحة! لنبدأ 🔥")
     await td_start_new_turn(query.message.chat.id, context)
 
 
@@ -531,32 +1202,27 @@ async def td_choose_callback(update: Update, context: ContextTypes.DEFAULT_TYPE)
 
     _, choice = data.split(":", 1)  # "truth" أو "dare"
     chat_data = context.chat_data
-    game = chat_data.get("truth_dare_game")
+    game = td_game(chat_data)
 
-    if not game or game.get("status") != "running":
+    if not game or game.status != RUNNING:
         await query.answer("لا توجد لعبة نشطة حالياً.", show_alert=True)
         return
 
     user = query.from_user
-    current_player_id = game.get("current_player_id")
-    if user.id != current_player_id:
+    if user.id != game.current_player_id:
         await query.answer("هذا الدور ليس دورك 😅", show_alert=True)
         return
 
-    round_state = game.get("current_round") or {}
-    round_state["player_id"] = user.id
-    round_state["final_choice"] = choice  # "truth" أو "dare"
-    round_state["switched"] = False
-    game["current_round"] = round_state
+    game.choose(choice)
 
     player_display = display_name_from_user(user)
 
     if choice == "dare":
-        q = choose_unique_question(DARE_QUESTIONS, USED_DARE, "used_dare.txt")
+        q = choose_unique_question("dare", update)
         text = f"🔥 *تحدي لـ {player_display}:*\n{q}"
         switch_button = InlineKeyboardButton("↩️ تحويل إلى صراحة", callback_data="td_switch:truth")
     else:
-        q = choose_unique_question(TRUTH_QUESTIONS, USED_TRUTH, "used_truth.txt")
+        q = choose_unique_question("truth", update)
         text = f"💬 *صراحة لـ {player_display}:*\n{q}"
         switch_button = InlineKeyboardButton("↩️ تحويل إلى تحدي", callback_data="td_switch:dare")
 
@@ -567,7 +1233,7 @@ async def td_choose_callback(update: Update, context: ContextTypes.DEFAULT_TYPE)
         [next_button],
     ])
 
-    await query.message.reply_text(text, reply_markup=keyboard, parse_mode="Markdown")
+    reply(query.message, text, reply_markup=keyboard, parse_mode="Markdown")
 
 
 async def td_switch_callback(update: Update, context: ContextTypes.DEFAULT_TYPE):
@@ -577,36 +1243,31 @@ async def td_switch_callback(update: Update, context: ContextTypes.DEFAULT_TYPE)
 
     _, new_choice = data.split(":", 1)  # "truth" أو "dare"
     chat_data = context.chat_data
-    game = chat_data.get("truth_dare_game")
+    game = td_game(chat_data)
 
-    if not game or game.get("status") != "running":
+    if not game or game.status != RUNNING:
         await query.answer("لا توجد لعبة نشطة حالياً.", show_alert=True)
         return
 
     user = query.from_user
-    round_state = game.get("current_round")
-    if not round_state or round_state.get("player_id") != user.id:
+    if game.current_player_id != user.id:
         await query.answer("هذا الخيار ليس دورك 😅", show_alert=True)
         return
 
-    if round_state.get("switched"):
+    if not game.switch(new_choice):
         await query.answer("لا يمكنك التحويل أكثر من مرة في نفس الدور.", show_alert=True)
         return
 
-    round_state["final_choice"] = new_choice
-    round_state["switched"] = True
-    game["current_round"] = round_state
-
     player_display = display_name_from_user(user)
 
     if new_choice == "truth":
-        q = choose_unique_question(TRUTH_QUESTIONS, USED_TRUTH, "used_truth.txt")
+        q = choose_unique_question("truth", update)
         text = (
             f"🔄 تم التحويل إلى *صراحة* لـ {player_display}:\n"
             f"{q}"
         )
     else:
-        q = choose_unique_question(DARE_QUESTIONS, USED_DARE, "used_dare.txt")
+        q = choose_unique_question("dare", update)
         text = (
             f"🔄 تم التحويل إلى *تحدي* لـ {player_display}:\n"
             f"{q}"
@@ -615,7 +1276,7 @@ async def td_switch_callback(update: Update, context: ContextTypes.DEFAULT_TYPE)
     next_button = InlineKeyboardButton("🔁 لاعب جديد", callback_data="td_next")
     keyboard = InlineKeyboardMarkup([[next_button]])
 
-    await query.message.reply_text(text, reply_markup=keyboard, parse_mode="Markdown")
+    reply(query.message, text, reply_markup=keyboard, parse_mode="Markdown")
 
 
 async def td_next_callback(update: Update, context: ContextTypes.DEFAULT_TYPE):
@@ -623,202 +1284,228 @@ async def td_next_callback(update: Update, context: ContextTypes.DEFAULT_TYPE):
     await query.answer()
 
     chat_data = context.chat_data
-    game = chat_data.get("truth_dare_game")
+    game = td_game(chat_data)
 
-    if not game or game.get("status") != "running":
+    if not game or game.status != RUNNING:
         await query.answer("لا توجد لعبة نشطة حالياً.", show_alert=True)
         return
 
     await td_start_new_turn(query.message.chat.id, context)
 
 # =============================
-# Message Handler (games, stats, autoreplies)
+# Flood Control (قبل أي رد)
 # =============================
-async def handle_message(update: Update, context: ContextTypes.DEFAULT_TYPE):
-    global TOTAL_MESSAGES
+CHAT_LIMITER = KeyedRateLimiter(FLOOD_CHAT_RATE, FLOOD_CHAT_BURST)
+USER_LIMITER = KeyedRateLimiter(FLOOD_USER_RATE, FLOOD_USER_BURST)
+# عدد الطلبات التي تم تجاهلها بسبب الحد (تظهر في الداشبورد)
+FLOOD_SHED = {"chat": 0, "user": 0}
 
-    if not update.message or not update.message.text:
-        return
 
-    text = update.message.text.strip()
-    normalized = normalize_text(text)
+def allow_reply(update: Update, per_chat: bool = True) -> bool:
+    """
+    يرجع False إن تجاوز المستخدم أو القروب الحد؛ الطلب يُتجاهل بدون أي اتصال بتيليجرام.
+    المستخدم أولاً حتى لا يستهلك شخص واحد رصيد القروب كله.
+    per_chat=False: حد المستخدم فقط (لما لا يرسل رسالة في القروب).
+    """
+    user = update.effective_user
+    if user and not USER_LIMITER.try_acquire(user.id):
+        FLOOD_SHED["user"] += 1
+        return False
+    chat = update.effective_chat
+    if per_chat and chat and chat.type != "private" and not CHAT_LIMITER.try_acquire(chat.id):
+        FLOOD_SHED["chat"] += 1
+        return False
+    return True
 
-    # ===== Stats =====
+
+async def flood_guard(update: Update, context: ContextTypes.DEFAULT_TYPE):
+    """
+    يعمل قبل أزرار تحدي/صراحة (group=-1) ويوقف المعالجة عند تجاوز الحد.
+    زر الانضمام لا يرسل رسالة في القروب (التعديل مجمّع)، فلا يُحسب على حد القروب.
+    الضغطة المرفوضة يُرد عليها بإجابة فارغة (لا تُحسب على حد القروب) حتى
+    لا يبقى الزر في حالة تحميل عند المستخدم.
+    """
+    query = update.callback_query
+    if not allow_reply(update, per_chat=query.data != "td_join"):
+        try:
+            await query.answer()
+        except TelegramError:
+            pass
+        raise ApplicationHandlerStop
+
+# =============================
+# Message Routes (الكلمات والألعاب)
+# =============================
+ROUTER = MessageRouter(normalize_text, may_shrink)
+ROUTER.set_replies(AUTOREPLIES.exact)
+
+
+@ROUTER.route("تحدي", "صراحة", "تحدي او صراحة", "تحدي ولا صراحة", priority=PRIORITY_FIRST)
+@timed
+async def truth_dare_start(update: Update, context: ContextTypes.DEFAULT_TYPE):
+    """
+    لعبة تحدي/صراحة - إنشاء جلسة جديدة.
+    """
     user = update.message.from_user
     chat = update.message.chat
 
-    TOTAL_MESSAGES += 1
-    UNIQUE_USERS.add(user.id)
+    game = td_game(context.chat_data)
+    if game and game.status in (COLLECTING, RUNNING):
+        reply(update.message, "هناك لعبة تحدي/صراحة تعمل بالفعل في هذا القروب 🎮")
+        return
 
-    if chat.type in ("group", "supergroup"):
-        UNIQUE_GROUPS.add(chat.id)
-    else:
-        UNIQUE_PRIVATE_CHATS.add(chat.id)
+    game = context.chat_data["truth_dare_game"] = TruthDareGame(user.id, time.time() + TD_JOIN_SECONDS)
 
-    bucket = datetime.now(timezone.utc).strftime("%Y-%m-%d %H:00")
-    ACTIVITY_BUCKETS[bucket] = ACTIVITY_BUCKETS.get(bucket, 0) + 1
+    msg = await reply(
+        update.message,
+        "🕹 *جولة جديدة: تحدي أو صراحة*\n"
+        "اضغط على الزر بالأسفل للانضمام للعبة خلال دقيقة واحدة ⏱",
+        reply_markup=TD_JOIN_KEYBOARD,
+        parse_mode="Markdown",
+    )
 
-    # حفظ الإحصائيات بعد كل رسالة
-    save_stats()
+    game.join_message_id = msg.message_id
+    schedule_join_close(context.application, chat.id, game.join_deadline)
 
-    # ===== لعبة تحدي/صراحة - إنشاء جلسة جديدة =====
-    if normalized in ["تحدي", "صراحه", "تحدي او صراحه", "تحدي ولا صراحه"]:
-        game = context.chat_data.get("truth_dare_game")
-        if game and game.get("status") in ("collecting", "running"):
-            await update.message.reply_text("هناك لعبة تحدي/صراحة تعمل بالفعل في هذا القروب 🎮")
-            return
 
-        context.chat_data["truth_dare_game"] = {
-            "status": "collecting",
-            "starter_id": user.id,
-            "participants": {},
-            "remaining_players": [],
-            "current_player_id": None,
-            "current_round": None,
-        }
+@ROUTER.route("العاب", "الالعاب", priority=PRIORITY_FIRST)
+@timed
+async def games_text(update: Update, context: ContextTypes.DEFAULT_TYPE):
+    reply(update.message, GAMES_HELP_TEXT, parse_mode="Markdown")
 
-        keyboard = InlineKeyboardMarkup([
-            [InlineKeyboardButton("✅ انضمام للعبة", callback_data="td_join")]
-        ])
 
-        msg = await update.message.reply_text(
-            "🕹 *جولة جديدة: تحدي أو صراحة*\n"
-            "اضغط على الزر بالأسفل للانضمام للعبة خلال دقيقة واحدة ⏱",
-            reply_markup=keyboard,
-            parse_mode="Markdown",
-        )
+# ألعاب السؤال الواحد: الكلمة -> (القائمة، شكل الرد)
+# لإضافة لعبة جديدة من هذا النوع يكفي سطر هنا + ملفها في question_bank.DEFAULT_SOURCES
+SIMPLE_GAMES = {
+    "كتت": ("kt", "{q}"),
+    "لو": ("wyr", "{q}"),
+    "من": ("who", "{q}"),
+    "حقائق": ("facts", "🧠 حقيقة:\n{q}"),
+}
 
-        context.chat_data["truth_dare_game"]["join_message_id"] = msg.message_id
 
-        if context.job_queue:
-            context.job_queue.run_once(
-                td_close_join_phase,
-                when=60,
-                chat_id=chat.id,
-                name=f"td_join_{chat.id}",
-            )
+def simple_game(game: str, template: str):
+    async def handler(update: Update, context: ContextTypes.DEFAULT_TYPE):
+        q = choose_unique_question(game, update)
+        reply(update.message, template.format(q=q))
+    handler.__name__ = f"{game}_game"
+    return timed(handler)
 
-        return
 
-    # ===== نصوص معينة =====
-    if normalized in ["العاب", "الالعاب"]:
-        await update.message.reply_text(GAMES_HELP_TEXT, parse_mode="Markdown")
-        return
+for trigger, (game, template) in SIMPLE_GAMES.items():
+    ROUTER.add([trigger], simple_game(game, template))
 
-    # ===== ردود سريعة من ملف autoreplies =====
-    if AUTOREPLIES:
-        reply = AUTOREPLIES.get(normalized)
-        if reply:
-            await update.message.reply_text(reply)
-            return
 
-    # ===== الألعاب =====
+@ROUTER.route("عام")
+@timed
+async def general_game(update: Update, context: ContextTypes.DEFAULT_TYPE):
+    q, a = choose_unique_question("general", update)
+    context.user_data["last_q"] = q
+    context.user_data["last_a"] = a
+    context.user_data["answer_at"] = time.time()
+    reply(update.message, q)
 
-    # كتت
-    if text == "كتت":
-        pool = [q for q in KT_QUESTIONS if q not in USED_KT]
-        if not pool:
-            USED_KT.clear()
-            open("used_kt.txt", "w").close()
-            pool = KT_QUESTIONS
-        q = random.choice(pool)
-        save_used("used_kt.txt", q)
-        USED_KT.add(q)
-        await update.message.reply_text(q)
-        return
 
-    # عام
-    if text == "عام":
-        pool = [(q, a) for (q, a) in GENERAL_RIDDLES if q not in USED_GENERAL]
-        if not pool:
-            USED_GENERAL.clear()
-            open("used_general.txt", "w").close()
-            pool = GENERAL_RIDDLES
-        q, a = random.choice(pool)
-        save_used("used_general.txt", q)
-        USED_GENERAL.add(q)
-        context.user_data["last_q"] = q
-        context.user_data["last_a"] = a
-        await update.message.reply_text(q)
-        return
+@ROUTER.route(*ANSWER_WORDS)
+@timed
+async def general_answer(update: Update, context: ContextTypes.DEFAULT_TYPE):
+    """
+    طلب إجابة آخر سؤال عام.
+    """
+    if "last_q" in context.user_data:
+        reply(
+            update.message,
+            f"السؤال:\n{context.user_data['last_q']}\n\n"
+            f"الإجابة:\n{context.user_data['last_a']}"
+        )
+    else:
+        reply(update.message, "لا يوجد سؤال.")
+
+
+@ROUTER.route("جريمة")
+@timed
+async def crime_game(update: Update, context: ContextTypes.DEFAULT_TYPE):
+    c = choose_unique_question("crimes", update)
+    if "|" in c:
+        story, sol = c.split("|", 1)
+        context.user_data["crime_sol"] = sol.strip()
+        context.user_data["answer_at"] = time.time()
+        reply(update.message, story.strip())
+    else:
+        reply(update.message, c)
 
-    # طلب إجابة
-    if is_answer_word(text):
-        if "last_q" in context.user_data:
-            await update.message.reply_text(
-                f"السؤال:\n{context.user_data['last_q']}\n\n"
-                f"الإجابة:\n{context.user_data['last_a']}"
-            )
-        else:
-            await update.message.reply_text("لا يوجد سؤال.")
-        return
 
-    # لو
-    if text == "لو":
-        pool = [q for q in WOULD_YOU_RATHER if q not in USED_WYR]
-        if not pool:
-            USED_WYR.clear()
-            open("used_wyr.txt", "w").close()
-            pool = WOULD_YOU_RATHER
-        q = random.choice(pool)
-        save_used("used_wyr.txt", q)
-        USED_WYR.add(q)
-        await update.message.reply_text(q)
-        return
+@ROUTER.route("حل", "حل الجريمة")
+@timed
+async def crime_solution(update: Update, context: ContextTypes.DEFAULT_TYPE):
+    if "crime_sol" in context.user_data:
+        reply(
+            update.message,
+            f"🔍 حل الجريمة:\n{context.user_data['crime_sol']}"
+        )
+    else:
+        reply(update.message, "لا توجد جريمة حالياً.")
 
-    # من
-    if text == "من":
-        pool = [q for q in WHO_QUESTIONS if q not in USED_WHO]
-        if not pool:
-            USED_WHO.clear()
-            open("used_who.txt", "w").close()
-            pool = WHO_QUESTIONS
-        q = random.choice(pool)
-        save_used("used_who.txt", q)
-        USED_WHO.add(q)
-        await update.message.reply_text(q)
-        return
+# =============================
+# Message Handler (games, stats, autoreplies)
+# =============================
+async def handle_message(update: Update, context: ContextTypes.DEFAULT_TYPE):
+    global TOTAL_MESSAGES
 
-    # جريمة
-    if text == "جريمة":
-        pool = [c for c in CRIMES if c not in USED_CRIMES]
-        if not pool:
-            USED_CRIMES.clear()
-            open("used_crimes.txt", "w").close()
-            pool = CRIMES
-        c = random.choice(pool)
-        save_used("used_crimes.txt", c)
-        USED_CRIMES.add(c)
-        if "|" in c:
-            story, sol = c.split("|", 1)
-            context.user_data["crime_sol"] = sol.strip()
-            await update.message.reply_text(story.strip())
-        else:
-            await update.message.reply_text(c)
+    if not update.message or not update.message.text:
         return
 
-    # حل الجريمة
-    if normalized in ["حل", "حل الجريمة"]:
-        if "crime_sol" in context.user_data:
-            await update.message.reply_text(
-                f"🔍 حل الجريمة:\n{context.user_data['crime_sol']}"
-            )
-        else:
-            await update.message.reply_text("لا توجد جريمة حالياً.")
-        return
+    text = update.message.text.strip()
 
-    # حقائق
-    if text == "حقائق":
-        pool = [f for f in FACTS if f not in USED_FACTS]
-        if not pool:
-            USED_FACTS.clear()
-            open("used_facts.txt", "w").close()
-            pool = FACTS
-        f = random.choice(pool)
-        save_used("used_facts.txt", f)
-        USED_FACTS.add(f)
-        await update.message.reply_text("🧠 حقيقة:\n" + f)
+    # ===== Stats =====
+    user = update.message.from_user
+    chat = update.message.chat
+
+    hour = int(time.time()) // 3600
+    day = hour // 24
+
+    with STATS_LOCK:
+        TOTAL_MESSAGES += 1
+        STATS_DELTA.messages += 1
+
+        # add_new ترجع True فقط إن تغيّر العدّاد (ما عداها لا يُكتب في السجل)
+        if UNIQUE_USERS.add_new(user.id):
+            STATS_DELTA.users.append(user.id)
+        if ACTIVE_USERS.add_new(day, user.id):
+            STATS_DELTA.active.append((day, user.id))
+
+        if chat.type in ("group", "supergroup"):
+            if UNIQUE_GROUPS.add_new(chat.id):
+                STATS_DELTA.groups.append(chat.id)
+        elif UNIQUE_PRIVATE_CHATS.add_new(chat.id):
+            STATS_DELTA.private_chats.append(chat.id)
+
+        ACTIVITY.add(hour)
+        STATS_DELTA.buckets[hour] = STATS_DELTA.buckets.get(hour, 0) + 1
+
+    # الحفظ يتم في الخلفية (إضافة إلى stats.journal أو SQLite حسب STATE_BACKEND)
+    # (كل STATS_FLUSH_INTERVAL ثانية أو STATS_FLUSH_EVERY تحديث)
+    STATS_SAVER.mark_dirty()
+
+    # ===== التوجيه: بحث واحد في جدول الكلمات =====
+    target = ROUTER.match(text)
+    if target is None:
+        # ردود البداية/الاحتواء (Aho-Corasick) بعد كل الكلمات الكاملة
+        if AUTOREPLIES.patterns:
+            answer = AUTOREPLIES.match(normalize_text(text))
+            if answer and allow_reply(update):
+                TRIGGERS["autoreply"] += 1
+                reply(update.message, answer)
         return
+    if not allow_reply(update):
+        return
+    if isinstance(target, str):
+        # رد سريع من ملف autoreplies
+        TRIGGERS["quick_reply"] += 1
+        reply(update.message, target)
+        return
+    TRIGGERS[target.__name__] += 1
+    await target(update, context)
 
 # =============================
 # Dashboard (Professional UI)
@@ -942,24 +1629,34 @@ h1 {
     <div class="grid">
         <div class="card">
             <div class="card-title">إجمالي الرسائل المستلمة</div>
-            <div class="card-value">{{ messages }}</div>
+            <div class="card-value" id="messages">–</div>
         </div>
         <div class="card">
             <div class="card-title">عدد المستخدمين</div>
-            <div class="card-value">{{ unique_users }}</div>
+            <div class="card-value" id="unique_users">–</div>
         </div>
         <div class="card">
             <div class="card-title">عدد الجروبات</div>
-            <div class="card-value">{{ groups }}</div>
+            <div class="card-value" id="groups">–</div>
         </div>
         <div class="card">
             <div class="card-title">المحادثات الخاصة</div>
-            <div class="card-value">{{ private_chats }}</div>
+            <div class="card-value" id="private_chats">–</div>
+        </div>
+        <div class="card">
+            <div class="card-title">النشطون اليوم / آخر 30 يوماً</div>
+            <div class="card-value"><span id="dau">–</span> / <span id="mau">–</span></div>
         </div>
         <div class="card">
             <div class="card-title">مدة التشغيل الحالية</div>
-            <div class="card-value">{{ uptime }}</div>
+            <div class="card-value" id="uptime">–</div>
+        </div>
+        <div class="card">
+            <div class="card-title">طلبات متجاهلة (سبام)</div>
+            <div class="card-value" id="shed_total">–</div>
+            <div class="card-title" id="shed_detail"></div>
         </div>
+        <div id="pools" style="display:contents"></div>
     </div>
 
     <div class="chart-card">
@@ -972,16 +1669,19 @@ h1 {
 </div>
 
 <script>
-const labels = {{ labels | tojson }};
-const dataPoints = {{ data | tojson }};
+// الصفحة ثابتة؛ الأرقام تأتي من /api/stats كل POLL_MS (مع If-None-Match)
+const POLL_MS = {{ (poll_seconds * 1000) | int }};
+const KEY = new URLSearchParams(location.search).get("key") || "";
+let etag = null;
+let startedAt = null;
 
-new Chart(document.getElementById("chart"), {
+const chart = new Chart(document.getElementById("chart"), {
     type: 'line',
     data: {
-        labels: labels,
+        labels: [],
         datasets: [{
             label: 'النشاط (عدد الرسائل لكل ساعة)',
-            data: dataPoints,
+            data: [],
             borderColor: '#38bdf8',
             backgroundColor: 'rgba(56,189,248,0.18)',
             borderWidth: 2,
@@ -999,6 +1699,67 @@ new Chart(document.getElementById("chart"), {
         }
     }
 });
+
+function setText(id, value) {
+    document.getElementById(id).textContent = value;
+}
+
+function poolCard(name, pool) {
+    const card = document.createElement("div");
+    card.className = "card";
+    card.innerHTML = '<div class="card-title"></div><div class="card-value"></div><div class="card-title"></div>';
+    const [title, value, detail] = card.children;
+    title.textContent = `HTTP ${name} (p95)`;
+    value.textContent = `${pool.latency_p95_ms} ms`;
+    detail.textContent = `انتظار pool ${pool.wait_p95_ms} ms · ${pool.requests} طلب`;
+    return card;
+}
+
+function render(stats) {
+    // في وضع hll الأعداد تقريبية (±1%)
+    const approx = stats.approximate ? "≈ " : "";
+    setText("messages", stats.messages);
+    setText("unique_users", approx + stats.unique_users);
+    setText("groups", stats.groups);
+    setText("private_chats", approx + stats.private_chats);
+    setText("dau", "≈ " + stats.dau);
+    setText("mau", "≈ " + stats.mau);
+    setText("shed_total", stats.shed.chat + stats.shed.user);
+    setText("shed_detail", `قروبات ${stats.shed.chat} · مستخدمين ${stats.shed.user}`);
+    startedAt = stats.started_at;
+    tickUptime();
+
+    const pools = document.getElementById("pools");
+    pools.replaceChildren(...Object.entries(stats.http_pools).map(([name, pool]) => poolCard(name, pool)));
+
+    chart.data.labels = stats.activity.labels;
+    chart.data.datasets[0].data = stats.activity.data;
+    chart.update("none");
+}
+
+function tickUptime() {
+    if (startedAt === null) return;
+    const sec = Math.max(0, Math.floor(Date.now() / 1000 - startedAt));
+    setText("uptime", `${Math.floor(sec / 3600)}h ${Math.floor(sec % 3600 / 60)}m ${sec % 60}s`);
+}
+
+async function poll() {
+    // التبويب المخفي لا يطلب شيئاً
+    if (!document.hidden) {
+        try {
+            const headers = etag ? { "If-None-Match": etag } : {};
+            const res = await fetch("/api/stats?key=" + encodeURIComponent(KEY), { headers, cache: "no-store" });
+            if (res.status === 200) {
+                etag = res.headers.get("ETag");
+                render(await res.json());
+            }
+        } catch (e) {}
+    }
+    setTimeout(poll, POLL_MS);
+}
+
+poll();
+setInterval(tickUptime, 1000);
 </script>
 {% endif %}
 </body>
@@ -1010,82 +1771,282 @@ def home():
     return "Bot is running via Webhook!"
 
 
+# القالب يُترجم مرة واحدة، والصفحتان ثابتتان (لا render لكل طلب)
+DASHBOARD_PAGE = web_app.jinja_env.from_string(DASHBOARD_TEMPLATE)
+LOGIN_HTML = DASHBOARD_PAGE.render(authorized=False)
+DASHBOARD_HTML = DASHBOARD_PAGE.render(authorized=True, poll_seconds=DASHBOARD_POLL_SECONDS)
+
+
+def dashboard_stats() -> dict:
+    """
+    محتوى /api/stats. يُستدعى مرة كل DASHBOARD_SNAPSHOT_TTL ثانية على الأكثر (DASHBOARD_CACHE).
+    """
+    # في وضع عدة workers الأرقام تُقرأ من الـ backend المشترك
+    summary = STATE.stats_summary()
+    if summary is None:
+        with STATS_LOCK:
+            summary = {
+                "total_messages": TOTAL_MESSAGES,
+                "hours": ACTIVITY.last_hours(16),
+            }
+        # تقدير الـ sketches (بضع ms في وضع hll) خارج القفل حتى لا يؤخر handle_message
+        summary["unique_users"] = len(UNIQUE_USERS)
+        summary["unique_groups"] = len(UNIQUE_GROUPS)
+        summary["unique_private_chats"] = len(UNIQUE_PRIVATE_CHATS)
+        summary["active_users"] = ACTIVE_USERS
+    else:
+        summary["hours"] = summary["activity"].last_hours(16)
+
+    # آخر 16 ساعة من النشاط (بالترتيب من الـ ring مباشرة)
+    hours = summary["hours"]
+    today = int(time.time()) // 86400
+    return {
+        "messages": summary["total_messages"],
+        "unique_users": summary["unique_users"],
+        "groups": summary["unique_groups"],
+        "private_chats": summary["unique_private_chats"],
+        "dau": summary["active_users"].dau(today),
+        "mau": summary["active_users"].mau(today),
+        "approximate": STATS_CARDINALITY == "hll",
+        "started_at": int(BOT_START_TIME),
+        "shed": {"chat": FLOOD_SHED["chat"], "user": FLOOD_SHED["user"]},
+        "http_pools": {
+            name: {
+                "latency_p95_ms": round(pool["latency"]["p95"] * 1000),
+                "wait_p95_ms": round(pool["pool_wait"]["p95"] * 1000),
+                "requests": pool["latency"]["count"],
+            }
+            for name, pool in metrics_summary().items()
+        },
+        "activity": {
+            "labels": [f"{h % 24:02d}:00" for h, _ in hours],  # UTC
+            "data": [n for _, n in hours],
+        },
+    }
+
+
+DASHBOARD_CACHE = SnapshotCache(dashboard_stats, max_age=DASHBOARD_SNAPSHOT_TTL)
+
+
 @web_app.route("/dashboard")
 def dashboard():
-    key = request.args.get("key", "")
-    if key != DASHBOARD_PASS:
-        return render_template_string(DASHBOARD_TEMPLATE, authorized=False)
-
-    uptime_sec = int(time.time() - BOT_START_TIME)
-    hours, rem = divmod(uptime_sec, 3600)
-    mins, secs = divmod(rem, 60)
-    uptime = f"{hours}h {mins}m {secs}s"
-
-    # آخر 16 ساعة من النشاط
-    buckets = sorted(ACTIVITY_BUCKETS.items())[-16:]
-    labels = [b[0][-5:] for b in buckets]  # HH:00
-    data = [b[1] for b in buckets]
-
-    return render_template_string(
-        DASHBOARD_TEMPLATE,
-        authorized=True,
-        unique_users=len(UNIQUE_USERS),
-        groups=len(UNIQUE_GROUPS),
-        private_chats=len(UNIQUE_PRIVATE_CHATS),
-        messages=TOTAL_MESSAGES,
-        uptime=uptime,
-        labels=labels,
-        data=data,
+    if request.args.get("key", "") != DASHBOARD_PASS:
+        return LOGIN_HTML
+    return DASHBOARD_HTML
+
+
+@web_app.route("/api/stats")
+def api_stats():
+    if request.args.get("key", "") != DASHBOARD_PASS:
+        return {"error": "unauthorized"}, 403
+
+    snapshot = DASHBOARD_CACHE.get()
+    headers = {"ETag": snapshot.etag, "Cache-Control": "private, no-cache"}
+    if request.headers.get("If-None-Match") == snapshot.etag:
+        return Response(status=304, headers=headers)
+    return Response(snapshot.body, headers=headers, mimetype="application/json")
+
+
+def token_ok() -> bool:
+    """
+    ?key=<DASHBOARD_PASS> أو Authorization: Bearer <DASHBOARD_PASS> (لـ Prometheus و curl).
+    """
+    token = request.args.get("key") or request.headers.get("Authorization", "").removeprefix("Bearer ")
+    return token == DASHBOARD_PASS
+
+
+def text_response(text: str, status: int = 200, **kwargs) -> Response:
+    return Response(text if text.endswith("\n") else text + "\n", status=status, mimetype="text/plain", **kwargs)
+
+
+@web_app.route("/metrics")
+def metrics():
+    if not token_ok():
+        return text_response("unauthorized", 403)
+    return Response(prometheus_text(), mimetype="text/plain; version=0.0.4")
+
+
+# كل طلبات Flask تعمل في خيط واحد (WsgiToAsgi)، لذا لا شيء هنا ينتظر:
+# الـ profile يبدأ بطلب وتُقرأ نتيجته بطلب آخر بعد انتهائه
+@web_app.route("/debug/profile")
+def debug_profile():
+    """
+    ?action=start&seconds=N | ?action=stop | بدون action: النتيجة (collapsed stacks).
+    """
+    if not token_ok():
+        return text_response("unauthorized", 403)
+
+    action = request.args.get("action", "")
+    if action == "start":
+        try:
+            seconds = float(request.args.get("seconds", "10"))
+        except ValueError:
+            seconds = 10
+        if not PROFILER.start(seconds):
+            return text_response("profile already running", 409)
+        return text_response(f"profiling for {PROFILER.seconds:.0f}s", 202)
+    if action == "stop":
+        PROFILER.stop()
+        return text_response("stopping", 202)
+    if PROFILER.running:
+        left = PROFILER.started_at + PROFILER.seconds - time.time()
+        return text_response(f"running, {max(0, left):.0f}s left", 202)
+    if not PROFILER.samples:
+        return text_response("no profile yet (?action=start&seconds=N)", 404)
+    return text_response(
+        PROFILER.collapsed(),
+        headers={"Content-Disposition": f'attachment; filename="{profile_filename()}"'},
     )
 
+
+@web_app.route("/debug/memory")
+def debug_memory():
+    """
+    ?action=start | ?action=stop | بدون action: الفرق منذ اللقطة السابقة.
+    """
+    if not token_ok():
+        return text_response("unauthorized", 403)
+
+    action = request.args.get("action", "")
+    if action == "start":
+        return text_response("tracing" if MEMORY_TRACER.start() else "already tracing")
+    if action == "stop":
+        MEMORY_TRACER.stop()
+        return text_response("stopped")
+    diff = MEMORY_TRACER.diff()
+    if diff is None:
+        return text_response("not tracing (?action=start)", 409)
+    return text_response(diff)
+
+
+@web_app.route("/debug/topchats")
+def debug_topchats():
+    if not token_ok():
+        return {"error": "unauthorized"}, 403
+    n = request.args.get("n", "20")
+    return {
+        "since": int(CHAT_UPDATES.since),
+        "total": CHAT_UPDATES.total,
+        "chats": [
+            {"chat_id": chat_id, "updates": count}
+            for chat_id, count in CHAT_UPDATES.top(min(int(n) if n.isdigit() else 20, 1000))
+        ],
+    }
+
 # =============================
 # INIT BOT (مشترك بين الوضعين)
 # =============================
-request_httpx = HTTPXRequest(connect_timeout=30.0, read_timeout=30.0)
+# pools منفصلة (انظر bot_http): الردود، long polling، وإرسال /podcast
+request_httpx = build_request(
+    "interactive",
+    pool_size=HTTP_POOL_SIZE,
+    keepalive_expiry=HTTP_KEEPALIVE_EXPIRY,
+    http2=HTTP2,
+)
+get_updates_request = build_request(
+    "get_updates",
+    pool_size=1,
+    keepalive_expiry=HTTP_KEEPALIVE_EXPIRY,
+    read_timeout=30.0,
+    http2=HTTP2,
+)
+BULK_BOT = Bot(
+    BOT_TOKEN,
+    base_url=BOT_API_URL,
+    request=build_request(
+        "bulk",
+        pool_size=BROADCAST_CONCURRENCY + 2,
+        keepalive_expiry=HTTP_KEEPALIVE_EXPIRY,
+        read_timeout=30.0,
+        http2=HTTP2,
+    ),
+)
 
-app = (
+builder = (
     ApplicationBuilder()
     .token(BOT_TOKEN)
+    .base_url(BOT_API_URL)
     .request(request_httpx)
-    .build()
+    .get_updates_request(get_updates_request)
+    .concurrent_updates(ChatOrderedUpdateProcessor(MAX_CONCURRENT_UPDATES, on_chat_update=CHAT_UPDATES.add))
+    .post_init(start_services)
+    .post_shutdown(stop_services)
 )
 
+# بيانات المحادثات (لعبة تحدي/صراحة ...) تبقى بعد إعادة التشغيل
+# (chat_state.log أو SQLite، ومشتركة بين الـ workers في وضع sqlite)
+persistence = STATE.persistence()
+if persistence is not None:
+    builder = builder.persistence(persistence)
+
+app = builder.build()
+
 # Register Handlers
-app.add_handler(CommandHandler("start", start))
-app.add_handler(CommandHandler("help", help_cmd))
-app.add_handler(CommandHandler("developer", developer))
-app.add_handler(CommandHandler("games", games))
-app.add_handler(CommandHandler("podcast", podcast_broadcast))
-app.add_handler(MessageHandler(filters.TEXT & ~filters.COMMAND, handle_message))
+app.add_handler(CommandHandler("start", timed(start)))
+app.add_handler(CommandHandler("help", timed(help_cmd)))
+app.add_handler(CommandHandler("developer", timed(developer)))
+app.add_handler(CommandHandler("games", timed(games)))
+app.add_handler(CommandHandler("podcast", timed(podcast_broadcast)))
+app.add_handler(CommandHandler("podcast_stop", timed(podcast_stop)))
+app.add_handler(CommandHandler("reload", timed(reload_cmd)))
+app.add_handler(CommandHandler("profile", timed(profile_cmd)))
+app.add_handler(CommandHandler("memdiff", timed(memdiff_cmd)))
+app.add_handler(CommandHandler("topchats", timed(topchats_cmd)))
+app.add_handler(MessageHandler(filters.TEXT & ~filters.COMMAND, timed(handle_message)))
 
 # === Truth/Dare Callback Handlers (جديدة) ===
-app.add_handler(CallbackQueryHandler(td_join_callback, pattern="^td_join$"))
-app.add_handler(CallbackQueryHandler(td_start_callback, pattern="^td_start$"))
-app.add_handler(CallbackQueryHandler(td_choose_callback, pattern="^td_choose:"))
-app.add_handler(CallbackQueryHandler(td_switch_callback, pattern="^td_switch:"))
-app.add_handler(CallbackQueryHandler(td_next_callback, pattern="^td_next$"))
+app.add_handler(CallbackQueryHandler(timed(flood_guard), pattern="^td_"), group=-1)
+app.add_handler(CallbackQueryHandler(timed(td_join_callback), pattern="^td_join$"))
+app.add_handler(CallbackQueryHandler(timed(td_start_callback), pattern="^td_start$"))
+app.add_handler(CallbackQueryHandler(timed(td_choose_callback), pattern="^td_choose:"))
+app.add_handler(CallbackQueryHandler(timed(td_switch_callback), pattern="^td_switch:"))
+app.add_handler(CallbackQueryHandler(timed(td_next_callback), pattern="^td_next$"))
+
+# =============================
+# Metrics (/metrics): الطوابير والعدادات تُقرأ وقت الطلب فقط
+# =============================
+gauge("bot_messages_total", "Text messages seen by handle_message", lambda: TOTAL_MESSAGES, "counter")
+gauge("bot_outbox_pending", "Messages waiting in the outbox", lambda: OUTBOX.pending)
+gauge("bot_outbox_sent_total", "Messages sent by the outbox", lambda: OUTBOX.sent, "counter")
+gauge("bot_outbox_failed_total", "Messages the outbox gave up on", lambda: OUTBOX.failed, "counter")
+gauge("bot_outbox_retried_total", "Outbox retries after RetryAfter", lambda: OUTBOX.retried, "counter")
+gauge("bot_flood_shed_total", "Replies dropped by flood control", lambda: dict(FLOOD_SHED), "counter", label="scope")
+gauge("bot_update_queue", "Updates fetched but not yet dispatched", lambda: app.update_queue.qsize())
+gauge("bot_updates_in_progress", "Updates holding a concurrency slot", lambda: app.update_processor.current_concurrent_updates)
+gauge("bot_updates_chat_queued", "Updates running or waiting behind the same chat", lambda: app.update_processor.queued)
+gauge("bot_stats_unsaved", "Stats changes not yet written", lambda: STATS_SAVER.dirty)
+gauge("bot_join_timers", "Open truth/dare join phases", lambda: len(JOIN_TIMERS))
+gauge("bot_broadcast_running", "1 while /podcast is sending", lambda: int(BROADCASTS.running))
 
 # =====================================================
 # 🔵 Webhook Mode (للإنتاج على Render) - RUN_MODE=webhook
+# خادم ASGI واحد (uvicorn) يستقبل التحديثات ويعرض / و /dashboard
+# على نفس event loop الخاص بالبوت.
 # =====================================================
-if RUN_MODE == "webhook":
-    loop = asyncio.new_event_loop()
-    asyncio.set_event_loop(loop)
-
-    async def init_and_set_webhook():
-        await app.initialize()
-        await app.start()
-        await app.bot.delete_webhook()
+async def on_webhook_startup():
+    await start_services(app)
+
+    # كل worker يشغّل هذه الدالة، لكن التسجيل عند تيليجرام يتم مرة واحدة فقط
+    if not await asyncio.to_thread(STATE.acquire_lease, "set_webhook", 600):
+        return
+    info = await app.bot.get_webhook_info()
+    if info.url != WEBHOOK_URL:
         await app.bot.set_webhook(url=WEBHOOK_URL)
 
-    loop.run_until_complete(init_and_set_webhook())
 
-    @web_app.route("/webhook", methods=["POST"])
-    def webhook_receiver():
-        update_data = request.get_json(force=True)
-        update = Update.de_json(update_data, app.bot)
-        loop.run_until_complete(app.process_update(update))
-        return "OK", 200
+asgi_app = WebhookASGIApp(
+    app,
+    WsgiToAsgi(web_app),
+    webhook_path=WEBHOOK_PATH,
+    on_startup=on_webhook_startup,
+    on_shutdown=stop_services,
+)
+
+if __name__ == "__main__" and RUN_MODE == "webhook":
+    import uvicorn
+
+    print("▶️ Bot running with webhook on port", PORT)
+    uvicorn.run(asgi_app, host="0.0.0.0", port=PORT)
 
 # =====================================================
 # 🟢 Polling Mode (للتجربة محليًا) - RUN_MODE=polling
@@ -1093,4 +2054,3 @@ if RUN_MODE == "webhook":
 if __name__ == "__main__" and RUN_MODE == "polling":
     print("▶️ Test Bot running with polling...")
     app.run_polling()
-
@@ -0,0 +1,185 @@
+# ============================================
+# Metrics - قياسات البوت بصيغة Prometheus (GET /metrics)
+#
+# - timed(fn): histogram لزمن كل handler (وعدد الأخطاء)، async أو عادي.
+# - TRIGGERS: عدد مرات كل لعبة/رد من handle_message.
+# - watch_loop_lag: تأخر event loop (كم تأخر sleep عن موعده).
+# - gauge(name, help, fn): قيمة تُقرأ وقت الطلب فقط (طول الطوابير وغيرها).
+# - من bot_http: زمن كل pool وكل method في Bot API.
+#
+# الكلفة وقت التشغيل: perf_counter مرتين و bisect لكل استدعاء؛ النص
+# يُبنى فقط عند طلب /metrics.
+# ============================================
+
+from collections import Counter
+from typing import Callable, Dict, List, Tuple
+import asyncio
+import functools
+import inspect
+import time
+
+from telegram.ext import ApplicationHandlerStop
+
+from bot_http import LATENCY_BUCKETS, METHOD_LATENCY, METHOD_STATUS, POOL_METRICS, Histogram
+
+# حدود أصغر لتأخر event loop (الطبيعي أقل من 1ms)
+LAG_BUCKETS = (0.001, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 5.0)
+
+HANDLER_LATENCY: Dict[str, Histogram] = {}
+HANDLER_ERRORS: Counter = Counter()
+TRIGGERS: Counter = Counter()
+LOOP_LAG = Histogram(LAG_BUCKETS)
+LOOP_LAG_LAST = [0.0]
+
+_GAUGES: List[Tuple[str, str, str, str, Callable[[], object]]] = []
+
+
+def _histogram(name: str) -> Histogram:
+    histogram = HANDLER_LATENCY.get(name)
+    if histogram is None:
+        histogram = HANDLER_LATENCY[name] = Histogram(LATENCY_BUCKETS)
+    return histogram
+
+
+def timed(fn=None, *, name: str = None):
+    """
+    Decorator: @timed أو timed(fn) أو timed(fn, name="...").
+    ApplicationHandlerStop (من flood_guard) ليس خطأ.
+    """
+    if fn is None:
+        return lambda f: timed(f, name=name)
+    label = name or fn.__name__
+    histogram = _histogram(label)
+
+    if inspect.iscoroutinefunction(fn):
+        @functools.wraps(fn)
+        async def wrapper(*args, **kwargs):
+            started = time.perf_counter()
+            try:
+                return await fn(*args, **kwargs)
+            except ApplicationHandlerStop:
+                raise
+            except Exception:
+                HANDLER_ERRORS[label] += 1
+                raise
+            finally:
+                histogram.observe(time.perf_counter() - started)
+    else:
+        @functools.wraps(fn)
+        def wrapper(*args, **kwargs):
+            started = time.perf_counter()
+            try:
+                return fn(*args, **kwargs)
+            except Exception:
+                HANDLER_ERRORS[label] += 1
+                raise
+            finally:
+                histogram.observe(time.perf_counter() - started)
+    return wrapper
+
+
+def gauge(
+    name: str,
+    help_text: str,
+    fn: Callable[[], object],
+    kind: str = "gauge",
+    label: str = "key",
+) -> None:
+    """
+    fn ترجع رقماً، أو dict {قيمة label: رقم} لعدة سلاسل بنفس الاسم.
+    kind = "counter" للأعداد التي تزيد فقط (OUTBOX.sent مثلاً).
+    """
+    _GAUGES.append((name, help_text, kind, label, fn))
+
+
+async def watch_loop_lag(interval: float = 0.5) -> None:
+    """
+    تعمل كـ task طوال التشغيل. handler يحجز الـ loop (عمل CPU أو I/O متزامن)
+    يظهر هنا كتأخر.
+    """
+    loop = asyncio.get_running_loop()
+    while True:
+        expected = loop.time() + interval
+        await asyncio.sleep(interval)
+        lag = max(0.0, loop.time() - expected)
+        LOOP_LAG.observe(lag)
+        LOOP_LAG_LAST[0] = lag
+
+
+# =============================
+# Prometheus text format
+# =============================
+def _escape(value) -> str:
+    return str(value).replace("\\", "\\\\").replace("\n", "\\n").replace('"', '\\"')
+
+
+def _labels(labels: Dict[str, object]) -> str:
+    if not labels:
+        return ""
+    return "{" + ",".join(f'{k}="{_escape(v)}"' for k, v in labels.items()) + "}"
+
+
+def _histogram_lines(out: List[str], name: str, histogram: Histogram, labels: Dict[str, object]) -> None:
+    cumulative = 0
+    for bound, n in zip(histogram.bounds, histogram.counts):
+        cumulative += n
+        out.append(f"{name}_bucket{_labels({**labels, 'le': bound})} {cumulative}")
+    out.append(f"{name}_bucket{_labels({**labels, 'le': '+Inf'})} {histogram.count}")
+    out.append(f"{name}_sum{_labels(labels)} {histogram.total}")
+    out.append(f"{name}_count{_labels(labels)} {histogram.count}")
+
+
+def _family(out: List[str], name: str, kind: str, help_text: str) -> None:
+    out.append(f"# HELP {name} {help_text}")
+    out.append(f"# TYPE {name} {kind}")
+
+
+def prometheus_text() -> str:
+    out: List[str] = []
+
+    _family(out, "bot_handler_seconds", "histogram", "Handler run time")
+    for label, histogram in list(HANDLER_LATENCY.items()):
+        _histogram_lines(out, "bot_handler_seconds", histogram, {"handler": label})
+    _family(out, "bot_handler_errors_total", "counter", "Handler exceptions")
+    for label, n in list(HANDLER_ERRORS.items()):
+        out.append(f"bot_handler_errors_total{_labels({'handler': label})} {n}")
+
+    _family(out, "bot_trigger_total", "counter", "Messages routed to each game or reply")
+    for label, n in list(TRIGGERS.items()):
+        out.append(f"bot_trigger_total{_labels({'game': label})} {n}")
+
+    _family(out, "bot_api_request_seconds", "histogram", "Bot API request time by method")
+    for method, histogram in list(METHOD_LATENCY.items()):
+        _histogram_lines(out, "bot_api_request_seconds", histogram, {"method": method})
+    _family(out, "bot_api_responses_total", "counter", "Bot API responses by method and status")
+    for (method, status), n in list(METHOD_STATUS.items()):
+        out.append(f"bot_api_responses_total{_labels({'method': method, 'status': status})} {n}")
+
+    _family(out, "bot_http_pool_wait_seconds", "histogram", "Time waiting for a pooled connection")
+    for name, pool in list(POOL_METRICS.items()):
+        _histogram_lines(out, "bot_http_pool_wait_seconds", pool.pool_wait, {"pool": name})
+    _family(out, "bot_http_request_seconds", "histogram", "Bot API request time by pool")
+    for name, pool in list(POOL_METRICS.items()):
+        _histogram_lines(out, "bot_http_request_seconds", pool.latency, {"pool": name})
+    _family(out, "bot_http_errors_total", "counter", "Failed Bot API connections/requests by pool")
+    for name, pool in list(POOL_METRICS.items()):
+        out.append(f"bot_http_errors_total{_labels({'pool': name})} {pool.errors}")
+
+    _family(out, "bot_event_loop_lag_seconds", "histogram", "Event loop scheduling delay")
+    _histogram_lines(out, "bot_event_loop_lag_seconds", LOOP_LAG, {})
+    _family(out, "bot_event_loop_lag_last_seconds", "gauge", "Most recent event loop delay")
+    out.append(f"bot_event_loop_lag_last_seconds {LOOP_LAG_LAST[0]}")
+
+    for name, help_text, kind, label, fn in _GAUGES:
+        try:
+            value = fn()
+        except Exception:
+            continue
+        _family(out, name, kind, help_text)
+        if isinstance(value, dict):
+            for key, v in value.items():
+                out.append(f"{name}{_labels({label: key})} {v}")
+        else:
+            out.append(f"{name} {value}")
+
+    return "\n".join(out) + "\n"
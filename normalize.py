@@ -0,0 +1,60 @@
+# ============================================
+# Arabic Normalization - تطبيع النص في مكان واحد
+#
+# - أشكال الألف (أ إ آ ٱ) -> ا
+# - التاء المربوطة ة -> ه
+# - الألف المقصورة ى و الياء الفارسية ی -> ي
+# - حذف التطويل (ـ) والتشكيل (الحركات، التنوين، الشدة، السكون، الألف الخنجرية)
+#
+# ملاحظة أداء: str.translate على نص عربي (غير Latin-1) أبطأ في CPython
+# بعدة مرات من سلسلة replace قصيرة (كل replace بحث C سريع، ولا تنسخ
+# النص إن لم تجد الحرف)، لذلك الحروف تُستبدل بـ replace والتشكيل يُحذف
+# بـ regex فقط إن وُجد. النصوص القصيرة (بطول الأوامر) تُحفظ في LRU cache.
+# ============================================
+
+from functools import lru_cache
+import re
+
+ALEF_VARIANTS = "أإآٱ"
+YA_VARIANTS = "ىی"
+TATWEEL = "ـ"
+# الحركات والتنوين والشدة والسكون وما بعدها من علامات، والألف الخنجرية
+TASHKEEL = "".join(chr(c) for c in range(0x064B, 0x0660)) + "ٰ"
+
+LETTER_MAP = {
+    **{c: "ا" for c in ALEF_VARIANTS},
+    **{c: "ي" for c in YA_VARIANTS},
+    "ة": "ه",
+}
+_LETTERS = tuple(LETTER_MAP.items())
+_MARKS = re.compile(f"[{TATWEEL}{TASHKEEL}]")
+
+# النصوص القصيرة (بطول الكلمات والأوامر) تتكرر كثيراً فتُحفظ نتيجتها
+CACHE_MAX_LEN = 32
+CACHE_SIZE = 4096
+
+
+def _normalize(t: str) -> str:
+    t = t.strip().lower()
+    for src, dst in _LETTERS:
+        t = t.replace(src, dst)
+    if _MARKS.search(t) is not None:
+        t = _MARKS.sub("", t)
+    return t
+
+
+_normalize_cached = lru_cache(maxsize=CACHE_SIZE)(_normalize)
+
+
+def normalize_text(t: str) -> str:
+    if len(t) <= CACHE_MAX_LEN:
+        return _normalize_cached(t)
+    return _normalize(t)
+
+
+def may_shrink(t: str) -> bool:
+    """
+    هل قد يصبح النص أقصر بعد التطبيع (فيه تطويل أو تشكيل)؟
+    بحث regex يتوقف عند أول تطابق، وأغلب الرسائل ليس فيها تشكيل.
+    """
+    return _MARKS.search(t) is not None
@@ -0,0 +1,216 @@
+# ============================================
+# Outbox - طابور إرسال مركزي لكل رسائل البوت
+#
+# الـ handlers تضع الرسالة في الطابور وترجع فوراً (submit يرجع Future
+# لمن يحتاج النتيجة، مثل message_id). العمّال يرسلون مع:
+# - ترتيب FIFO لكل محادثة (رسالة واحدة قيد الإرسال لكل محادثة).
+# - حد عام (rate رسالة/ثانية) وحد لكل قروب (group_rate).
+# - مسارين: ردود المستخدمين (INTERACTIVE) قبل الإذاعة (BACKGROUND).
+# - RetryAfter: تأجيل المحادثة المدة المطلوبة وإيقاف مسار الإذاعة مؤقتاً.
+# - key: رسائل قابلة للدمج (تعديلات متكررة لنفس الرسالة) في طابور خاص بها
+#   خارج ترتيب المحادثة، والأحدث يحل محل ما لم يُرسل بعد.
+# ============================================
+
+from collections import deque
+from typing import Awaitable, Callable, Deque, Dict, Hashable, List, Optional
+import asyncio
+
+from telegram.error import RetryAfter
+
+from ratelimit import KeyedRateLimiter, TokenBucket, retry_after_seconds
+
+INTERACTIVE = 0
+BACKGROUND = 1
+
+
+class _Job:
+    __slots__ = ("chat_id", "factory", "future", "priority", "reserved", "attempts", "sending")
+
+    def __init__(self, chat_id: int, factory: Callable[[], Awaitable], future: asyncio.Future, priority: int):
+        self.chat_id = chat_id
+        self.factory = factory
+        self.future = future
+        self.priority = priority
+        self.reserved = False
+        self.attempts = 0
+        self.sending = False
+
+
+class Outbox:
+    def __init__(
+        self,
+        rate: float = 30.0,
+        group_rate: float = 20 / 60,
+        group_burst: float = 10,
+        workers: int = 8,
+        max_attempts: int = 3,
+    ):
+        self.bucket = TokenBucket(rate, capacity=rate)
+        self.group_limiter = KeyedRateLimiter(group_rate, group_burst)
+        self.workers = workers
+        self.max_attempts = max_attempts
+
+        self.sent = 0
+        self.failed = 0
+        self.retried = 0
+        self._loop: Optional[asyncio.AbstractEventLoop] = None
+        self._tasks: List[asyncio.Task] = []
+
+    def _reset(self, loop: asyncio.AbstractEventLoop) -> None:
+        self._loop = loop
+        # الطوابير: chat_id، أو (chat_id, key) للرسائل القابلة للدمج
+        self._chats: Dict[Hashable, Deque[_Job]] = {}
+        self._ready = (deque(), deque())  # محادثات جاهزة لكل مسار
+        self._wakeup = asyncio.Event()
+        self._background_until = 0.0
+        self._deferred: Dict[Hashable, asyncio.TimerHandle] = {}  # محادثات تنتظر RetryAfter أو حد القروب
+        self._tasks = [loop.create_task(self._worker()) for _ in range(self.workers)]
+
+    @property
+    def pending(self) -> int:
+        return sum(len(q) for q in self._chats.values()) if self._loop else 0
+
+    # ---------- الإضافة ----------
+    def submit(
+        self,
+        chat_id: int,
+        factory: Callable[[], Awaitable],
+        priority: int = INTERACTIVE,
+        key: Optional[Hashable] = None,
+    ) -> asyncio.Future:
+        """
+        factory: دالة بدون وسائط ترجع coroutine الإرسال، مثل
+            lambda: message.reply_text("...")
+        key: لرسائل يكفي إرسال آخرها (مثل تعديل نفس الرسالة): طابور مستقل
+            لا ينتظر رسائل المحادثة، ورسالة بنفس المفتاح لم يبدأ إرسالها
+            تُستبدل بالجديدة (ويُرجع نفس الـ Future، بأولويتها الأصلية).
+        """
+        loop = asyncio.get_running_loop()
+        if self._loop is not loop:
+            self._reset(loop)
+        queue_key = chat_id if key is None else (chat_id, key)
+        queue = self._chats.get(queue_key)
+        if queue is not None and key is not None:
+            for job in queue:
+                if not job.sending and not job.future.done():
+                    job.factory = factory
+                    return job.future
+        future = loop.create_future()
+        future.add_done_callback(self._log_failure)
+        job = _Job(chat_id, factory, future, priority)
+        if queue is None:
+            self._chats[queue_key] = deque((job,))
+            self._make_ready(queue_key)
+        else:
+            # المحادثة لها رسائل سابقة: تنتظر دورها بعدها
+            queue.append(job)
+        return future
+
+    async def stop(self) -> None:
+        """
+        يوقف العمّال ويلغي Future كل رسالة لم تُرسل، فمن ينتظرها يستلم
+        CancelledError بدل الانتظار للأبد.
+        """
+        for task in self._tasks:
+            task.cancel()
+        await asyncio.gather(*self._tasks, return_exceptions=True)
+        self._tasks = []
+        if self._loop is not None:
+            for handle in self._deferred.values():
+                handle.cancel()
+            self._deferred.clear()
+            for queue in self._chats.values():
+                for job in queue:
+                    job.future.cancel()
+            self._chats.clear()
+        self._loop = None
+
+    # ---------- الداخلي ----------
+    @staticmethod
+    def _log_failure(future: asyncio.Future) -> None:
+        if not future.cancelled() and future.exception() is not None:
+            print("⚠️ send failed:", future.exception())
+
+    def _make_ready(self, queue_key: Hashable) -> None:
+        queue = self._chats.get(queue_key)
+        if queue:
+            self._ready[queue[0].priority].append(queue_key)
+            self._wakeup.set()
+
+    def _defer(self, queue_key: Hashable, delay: float) -> None:
+        self._deferred[queue_key] = self._loop.call_later(delay, self._undefer, queue_key)
+
+    def _undefer(self, queue_key: Hashable) -> None:
+        del self._deferred[queue_key]
+        self._make_ready(queue_key)
+
+    def _finish(self, queue_key: Hashable, job: _Job, result=None, error: Optional[BaseException] = None) -> None:
+        queue = self._chats[queue_key]
+        queue.popleft()
+        if not job.future.done():
+            if error is None:
+                job.future.set_result(result)
+            else:
+                job.future.set_exception(error)
+        if queue:
+            self._make_ready(queue_key)
+        else:
+            del self._chats[queue_key]
+
+    async def _take(self) -> Hashable:
+        interactive, background = self._ready
+        while True:
+            if interactive:
+                return interactive.popleft()
+            wait = None
+            if background:
+                wait = self._background_until - self._loop.time()
+                if wait <= 0:
+                    return background.popleft()
+            self._wakeup.clear()
+            try:
+                await asyncio.wait_for(self._wakeup.wait(), wait)
+            except asyncio.TimeoutError:
+                pass
+
+    async def _worker(self) -> None:
+        while True:
+            queue_key = await self._take()
+            job = self._chats[queue_key][0]
+            chat_id = job.chat_id
+            if job.future.cancelled():
+                self._finish(queue_key, job)
+                continue
+
+            # حد القروب (معرّفات القروبات والقنوات سالبة في Bot API)
+            if chat_id < 0 and not job.reserved:
+                job.reserved = True
+                wait = self.group_limiter.reserve(chat_id)
+                if wait > 0:
+                    self._defer(queue_key, wait)
+                    continue
+
+            await self.bucket.acquire()
+            # من هنا لا تُستبدل الرسالة (submit بنفس المفتاح يضيف واحدة بعدها)
+            job.sending = True
+            try:
+                result = await job.factory()
+            except RetryAfter as e:
+                job.sending = False
+                job.attempts += 1
+                if job.attempts >= self.max_attempts:
+                    self.failed += 1
+                    self._finish(queue_key, job, error=e)
+                    continue
+                self.retried += 1
+                delay = retry_after_seconds(e) + 0.5
+                self._background_until = max(self._background_until, self._loop.time() + delay)
+                self._defer(queue_key, delay)
+            except asyncio.CancelledError:
+                raise
+            except Exception as e:
+                self.failed += 1
+                self._finish(queue_key, job, error=e)
+            else:
+                self.sent += 1
+                self._finish(queue_key, job, result)
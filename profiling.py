@@ -0,0 +1,219 @@
+# ============================================
+# Profiling - تشخيص البوت وهو يعمل (للمطور فقط، بدون إعادة تشغيل)
+#
+# - SamplingProfiler: خيط يأخذ stack كل الخيوط كل interval ثانية
+#   (sys._current_frames) لمدة محددة، والنتيجة بصيغة collapsed stacks
+#   (سطر لكل stack: "thread;file:func;... عدد") تُفتح مباشرة في
+#   flamegraph.pl أو speedscope. الكلفة ثابتة: عيّنة كل interval فقط،
+#   وعدد الـ stacks المختلفة محدود بـ max_stacks.
+# - MemoryTracer: tracemalloc مع فرق بين لقطتين (أكثر الأسطر زيادة).
+#   التتبع مكلف، لذا يتوقف تلقائياً بعد max_seconds.
+# - TopCounter: عدد التحديثات لكل محادثة بحجم محدود (يحذف الأقل عند
+#   امتلائه)، لمعرفة القروبات الأكثر ضغطاً.
+# ============================================
+
+from typing import Dict, List, Optional, Tuple
+import os
+import sys
+import threading
+import time
+import tracemalloc
+
+# أعلى stack لخيط ينتظر فقط (event loop بدون عمل، thread pool فارغ...):
+# يبقى في ملف الـ flamegraph لكن لا يُحسب في top_functions
+IDLE_FRAMES = frozenset((
+    "selectors.py:select",
+    "threading.py:wait",
+    "threading.py:_wait_for_tstate_lock",
+    "queue.py:get",
+    "thread.py:_worker",
+))
+
+
+# =============================
+# CPU: sampling profiler
+# =============================
+class SamplingProfiler:
+    def __init__(self, interval: float = 0.01, max_seconds: float = 120, max_stacks: int = 20000):
+        self.interval = interval
+        self.max_seconds = max_seconds
+        self.max_stacks = max_stacks
+        self._lock = threading.Lock()
+        self._stop = threading.Event()
+        self._thread: Optional[threading.Thread] = None
+        self._done = threading.Event()
+        self.stacks: Dict[str, int] = {}
+        self.samples = 0
+        self.dropped = 0
+        self.started_at = 0.0
+        self.seconds = 0.0
+
+    @property
+    def running(self) -> bool:
+        return self._thread is not None and self._thread.is_alive()
+
+    def start(self, seconds: float) -> bool:
+        """
+        يرجع False إن كان هناك profile يعمل بالفعل.
+        """
+        with self._lock:
+            if self.running:
+                return False
+            self.seconds = min(max(seconds, 1.0), self.max_seconds)
+            self.stacks = {}
+            self.samples = 0
+            self.dropped = 0
+            self.started_at = time.time()
+            self._stop.clear()
+            self._done.clear()
+            self._thread = threading.Thread(target=self._run, name="profiler", daemon=True)
+            self._thread.start()
+            return True
+
+    def stop(self) -> None:
+        self._stop.set()
+
+    def wait(self, timeout: Optional[float] = None) -> bool:
+        return self._done.wait(timeout)
+
+    def _run(self) -> None:
+        me = threading.get_ident()
+        deadline = time.monotonic() + self.seconds
+        try:
+            while not self._stop.is_set() and time.monotonic() < deadline:
+                names = {t.ident: t.name for t in threading.enumerate()}
+                for ident, frame in sys._current_frames().items():
+                    if ident == me:
+                        continue
+                    self._record(names.get(ident, str(ident)), frame)
+                self.samples += 1
+                self._stop.wait(self.interval)
+        finally:
+            self._done.set()
+
+    def _record(self, thread_name: str, frame) -> None:
+        parts = []
+        while frame is not None:
+            code = frame.f_code
+            parts.append(f"{os.path.basename(code.co_filename)}:{code.co_name}")
+            frame = frame.f_back
+        parts.append(thread_name)
+        key = ";".join(reversed(parts))
+        stacks = self.stacks
+        if key in stacks:
+            stacks[key] += 1
+        elif len(stacks) < self.max_stacks:
+            stacks[key] = 1
+        else:
+            self.dropped += 1
+
+    def collapsed(self) -> str:
+        return "".join(f"{stack} {n}\n" for stack, n in sorted(self.stacks.items()))
+
+    def top_functions(self, n: int = 10) -> List[Tuple[str, int]]:
+        """
+        الدوال التي ظهرت في أعلى الـ stack (self time) أكثر من غيرها، بدون الانتظار.
+        """
+        counts: Dict[str, int] = {}
+        for stack, k in self.stacks.items():
+            leaf = stack.rsplit(";", 1)[-1]
+            if leaf in IDLE_FRAMES:
+                continue
+            counts[leaf] = counts.get(leaf, 0) + k
+        return sorted(counts.items(), key=lambda kv: kv[1], reverse=True)[:n]
+
+
+# =============================
+# الذاكرة: tracemalloc
+# =============================
+class MemoryTracer:
+    def __init__(self, frames: int = 5, max_seconds: float = 1800):
+        self.frames = frames
+        self.max_seconds = max_seconds
+        self._lock = threading.Lock()
+        self._baseline: Optional[tracemalloc.Snapshot] = None
+        self._timer: Optional[threading.Timer] = None
+
+    @property
+    def running(self) -> bool:
+        return tracemalloc.is_tracing()
+
+    def start(self) -> bool:
+        with self._lock:
+            if tracemalloc.is_tracing():
+                return False
+            tracemalloc.start(self.frames)
+            self._baseline = self._snapshot()
+            self._timer = threading.Timer(self.max_seconds, self.stop)
+            self._timer.daemon = True
+            self._timer.start()
+            return True
+
+    def stop(self) -> None:
+        with self._lock:
+            if self._timer is not None:
+                self._timer.cancel()
+                self._timer = None
+            self._baseline = None
+            if tracemalloc.is_tracing():
+                tracemalloc.stop()
+
+    @staticmethod
+    def _snapshot() -> tracemalloc.Snapshot:
+        return tracemalloc.take_snapshot().filter_traces((
+            tracemalloc.Filter(False, tracemalloc.__file__),
+            tracemalloc.Filter(False, "<frozen importlib._bootstrap>"),
+        ))
+
+    def diff(self, limit: int = 15) -> Optional[str]:
+        """
+        أكثر الأسطر زيادة في الذاكرة منذ اللقطة السابقة (ثم تصبح الحالية هي الأساس).
+        None إن لم يكن التتبع شغالاً.
+        """
+        with self._lock:
+            if not tracemalloc.is_tracing() or self._baseline is None:
+                return None
+            current = self._snapshot()
+            stats = current.compare_to(self._baseline, "lineno")
+            self._baseline = current
+        traced, peak = tracemalloc.get_traced_memory()
+        lines = [f"traced {traced / 1e6:.1f} MB (peak {peak / 1e6:.1f} MB)"]
+        for stat in stats[:limit]:
+            frame = stat.traceback[0]
+            lines.append(
+                f"{stat.size_diff / 1024:+.1f} KB ({stat.count_diff:+d}) "
+                f"{os.path.basename(frame.filename)}:{frame.lineno} = {stat.size / 1024:.1f} KB"
+            )
+        return "\n".join(lines)
+
+
+# =============================
+# أكثر المحادثات تحديثات
+# =============================
+class TopCounter:
+    """
+    عدّاد لكل مفتاح بحد أقصى capacity مفتاح: عند الامتلاء يُحذف النصف
+    الأقل (O(1) مستهلك لكل إضافة)، فالمحادثات الكثيفة تبقى دائماً.
+    """
+
+    def __init__(self, capacity: int = 5000):
+        self.capacity = capacity
+        self.counts: Dict[int, int] = {}
+        self.total = 0
+        self.since = time.time()
+
+    def add(self, key: int) -> None:
+        counts = self.counts
+        counts[key] = counts.get(key, 0) + 1
+        self.total += 1
+        if len(counts) > self.capacity:
+            keep = sorted(counts.items(), key=lambda kv: kv[1], reverse=True)[: self.capacity // 2]
+            self.counts = dict(keep)
+
+    def top(self, n: int = 20) -> List[Tuple[int, int]]:
+        return sorted(self.counts.items(), key=lambda kv: kv[1], reverse=True)[:n]
+
+    def reset(self) -> None:
+        self.counts = {}
+        self.total = 0
+        self.since = time.time()
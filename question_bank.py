@@ -0,0 +1,291 @@
+# ============================================
+# Question Bank - ملف ثنائي واحد لكل قوائم الأسئلة (mmap)
+#
+# بدلاً من تحميل كل ملفات النص كقوائم str في كل worker، تُجمَّع مرة
+# واحدة في banks.bin:
+#   header | directory (قائمة لكل لعبة) | لكل قائمة: جدول offsets + نص UTF-8
+# الملف يُفتح بـ mmap للقراءة فقط، فالصفحات مشتركة بين الـ workers،
+# والسؤال لا يُفك ترميزه إلا عند سحبه.
+#
+# بناء يدوي (مثلاً في خطوة الـ build على Render):
+#   python question_bank.py
+# وإن لم يوجد الملف أو تغيّرت ملفات النص يُعاد بناؤه تلقائياً عند التشغيل.
+# ============================================
+
+from array import array
+from typing import Dict, Iterator, List, Optional, Tuple
+import fcntl
+import mmap
+import os
+import struct
+import sys
+import tempfile
+
+BANK_HEADER = struct.Struct("<4sHH")  # magic, version, count
+BANK_ENTRY = struct.Struct("<16sBxxxIQqQ")  # name, kind, count, table, src mtime_ns, src size
+BANK_MAGIC = b"QBNK"
+BANK_VERSION = 1
+OFFSET = struct.Struct("<I")
+PAIR = struct.Struct("<II")
+
+KIND_LIST = 0
+KIND_PAIRS = 1  # سؤال|جواب
+PAIR_SEPARATOR = "\x1f"
+
+DEFAULT_BANKS_FILE = "banks.bin"
+
+# اللعبة -> (ملف النص، النوع)
+DEFAULT_SOURCES: Dict[str, Tuple[str, int]] = {
+    "kt": ("questions.txt", KIND_LIST),
+    "general": ("general_riddles.txt", KIND_PAIRS),
+    "wyr": ("would_you_rather.txt", KIND_LIST),
+    "who": ("who.txt", KIND_LIST),
+    "crimes": ("crimes.txt", KIND_LIST),
+    "facts": ("facts.txt", KIND_LIST),
+    "truth": ("truth.txt", KIND_LIST),
+    "dare": ("dare.txt", KIND_LIST),
+}
+
+
+def iter_entries(filename: str, kind: int) -> Iterator[str]:
+    """
+    نفس قواعد القراءة القديمة: أسطر غير فارغة بعد strip،
+    وللأسئلة العامة الأسطر التي فيها | فقط.
+    """
+    with open(filename, "r", encoding="utf-8") as f:
+        for line in f:
+            line = line.strip()
+            if kind == KIND_PAIRS:
+                if "|" not in line:
+                    continue
+                q, a = line.split("|", 1)
+                yield q + PAIR_SEPARATOR + a
+            elif line:
+                yield line
+
+
+def _source_signature(filename: str) -> Tuple[int, int]:
+    try:
+        st = os.stat(filename)
+    except OSError:
+        return -1, 0
+    return st.st_mtime_ns, st.st_size
+
+
+def sources_signature(sources: Dict[str, Tuple[str, int]], directory: str = ".") -> tuple:
+    """
+    بصمة رخيصة (stat فقط) لمعرفة هل تغيّر أي ملف نص.
+    """
+    return tuple(_source_signature(os.path.join(directory, filename)) for filename, _ in sources.values())
+
+
+def build_banks(sources: Dict[str, Tuple[str, int]], path: str, directory: str = ".") -> Dict[str, int]:
+    """
+    يبني banks.bin من ملفات النص (كتابة ذرية) ويرجع عدد الأسئلة لكل قائمة.
+    """
+    names = list(sources)
+    tables = []
+    for name in names:
+        filename, kind = sources[name]
+        source = os.path.join(directory, filename)
+        mtime, size = _source_signature(source)
+        offsets = array("I", [0])
+        blob = bytearray()
+        if mtime >= 0:
+            for entry in iter_entries(source, kind):
+                blob += entry.encode("utf-8")
+                offsets.append(len(blob))
+        tables.append((name, kind, mtime, size, offsets, bytes(blob)))
+
+    pos = BANK_HEADER.size + BANK_ENTRY.size * len(names)
+    header = [BANK_HEADER.pack(BANK_MAGIC, BANK_VERSION, len(names))]
+    body = []
+    for name, kind, mtime, size, offsets, blob in tables:
+        header.append(BANK_ENTRY.pack(name.encode(), kind, len(offsets) - 1, pos, mtime, size))
+        if sys.byteorder != "little":
+            offsets.byteswap()
+        body.append(offsets.tobytes())
+        body.append(blob)
+        pos += OFFSET.size * len(offsets) + len(blob)
+
+    out = os.path.join(directory, path)
+    fd, tmp = tempfile.mkstemp(prefix=".banks-", suffix=".tmp", dir=os.path.dirname(os.path.abspath(out)))
+    try:
+        with os.fdopen(fd, "wb") as f:
+            f.writelines(header)
+            f.writelines(body)
+            f.flush()
+            os.fsync(f.fileno())
+        os.replace(tmp, out)
+    except BaseException:
+        try:
+            os.unlink(tmp)
+        except OSError:
+            pass
+        raise
+    return {name: len(offsets) - 1 for name, _, _, _, offsets, _ in tables}
+
+
+class MmapBank:
+    """
+    قائمة أسئلة للقراءة فقط فوق mmap: len() و bank[i] و random.choice تعمل
+    كالقائمة العادية، لكن النص يُقرأ من الملف عند الطلب فقط.
+    قائمة الأسئلة العامة ترجع (سؤال، جواب).
+    """
+
+    __slots__ = ("name", "kind", "_mm", "_table", "_blob", "_count")
+
+    def __init__(self, name: str, kind: int, mm: mmap.mmap, table: int, count: int):
+        self.name = name
+        self.kind = kind
+        self._mm = mm
+        self._table = table
+        self._blob = table + OFFSET.size * (count + 1)
+        self._count = count
+
+    def __len__(self) -> int:
+        return self._count
+
+    def __bool__(self) -> bool:
+        return self._count > 0
+
+    def text(self, index: int) -> str:
+        if index < 0:
+            index += self._count
+        if not 0 <= index < self._count:
+            raise IndexError("question index out of range")
+        start, end = PAIR.unpack_from(self._mm, self._table + OFFSET.size * index)
+        return self._mm[self._blob + start:self._blob + end].decode("utf-8")
+
+    def __getitem__(self, index: int):
+        text = self.text(index)
+        if self.kind == KIND_PAIRS:
+            q, a = text.split(PAIR_SEPARATOR, 1)
+            return q, a
+        return text
+
+    def __iter__(self):
+        for i in range(self._count):
+            yield self[i]
+
+    def questions(self):
+        """
+        نص السؤال فقط (بدون الجواب)، مثلاً لمطابقة used_*.txt القديمة.
+        """
+        return BankQuestions(self) if self.kind == KIND_PAIRS else self
+
+
+class BankQuestions:
+    __slots__ = ("bank",)
+
+    def __init__(self, bank: MmapBank):
+        self.bank = bank
+
+    def __len__(self) -> int:
+        return len(self.bank)
+
+    def __getitem__(self, index: int) -> str:
+        return self.bank.text(index).split(PAIR_SEPARATOR, 1)[0]
+
+
+def _read_directory(mm: mmap.mmap) -> Optional[dict]:
+    try:
+        magic, version, count = BANK_HEADER.unpack_from(mm, 0)
+    except struct.error:
+        return None
+    if magic != BANK_MAGIC or version != BANK_VERSION:
+        return None
+    entries = {}
+    for i in range(count):
+        raw_name, kind, n, table, mtime, size = BANK_ENTRY.unpack_from(mm, BANK_HEADER.size + BANK_ENTRY.size * i)
+        entries[raw_name.rstrip(b"\0").decode()] = (kind, n, table, mtime, size)
+    return entries
+
+
+def _is_current(entries: Optional[dict], sources: Dict[str, Tuple[str, int]], directory: str) -> bool:
+    if entries is None:
+        return False
+    for name, (filename, kind) in sources.items():
+        entry = entries.get(name)
+        if entry is None or entry[0] != kind:
+            return False
+        if entry[3:] != _source_signature(os.path.join(directory, filename)):
+            return False
+    return True
+
+
+def _map(path: str):
+    try:
+        with open(path, "rb") as f:
+            return mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+    except (OSError, ValueError):
+        # غير موجود أو فارغ
+        return None
+
+
+def refresh_banks(
+    sources: Dict[str, Tuple[str, int]] = DEFAULT_SOURCES,
+    path: str = DEFAULT_BANKS_FILE,
+    directory: str = ".",
+) -> bool:
+    """
+    يعيد بناء banks.bin إن كان غير موجود أو أقدم من ملفات النص.
+    البناء تحت flock، فعملية واحدة فقط تبنيه وترجع True، والباقي يجدونه محدّثاً.
+    """
+    full_path = os.path.join(directory, path)
+    with open(full_path + ".lock", "a") as lock:
+        fcntl.flock(lock, fcntl.LOCK_EX)
+        mm = _map(full_path)
+        try:
+            if _is_current(_read_directory(mm) if mm is not None else None, sources, directory):
+                return False
+        finally:
+            if mm is not None:
+                mm.close()
+        build_banks(sources, path, directory)
+        return True
+
+
+def open_banks(
+    sources: Dict[str, Tuple[str, int]] = DEFAULT_SOURCES,
+    path: str = DEFAULT_BANKS_FILE,
+    directory: str = ".",
+    refresh: bool = True,
+) -> Dict[str, MmapBank]:
+    """
+    يفتح banks.bin ويرجع MmapBank لكل لعبة (بعد refresh_banks إن لزم).
+    refresh=False لمن استدعى refresh_banks بنفسه (ليعرف هل أُعيد البناء).
+    """
+    if refresh:
+        refresh_banks(sources, path, directory)
+    mm = _map(os.path.join(directory, path))
+    entries = _read_directory(mm)
+
+    return {
+        name: MmapBank(name, entries[name][0], mm, entries[name][2], entries[name][1])
+        for name in sources
+    }
+
+
+def index_mapping(old, new) -> Optional[List[Optional[int]]]:
+    """
+    لكل مؤشر في القائمة القديمة: مؤشره في الجديدة حسب النص (أو None إن حُذف).
+    يرجع None إن لم تتغير القائمة.
+    """
+    old_items = list(old)
+    new_items = list(new)
+    if old_items == new_items:
+        return None
+    positions: Dict[object, List[int]] = {}
+    for i, item in enumerate(new_items):
+        positions.setdefault(item, []).append(i)
+    for indices in positions.values():
+        indices.reverse()
+    # الأسئلة المكررة تُطابق بالترتيب
+    return [positions[item].pop() if positions.get(item) else None for item in old_items]
+
+
+if __name__ == "__main__":
+    out = sys.argv[1] if len(sys.argv) > 1 else DEFAULT_BANKS_FILE
+    for name, count in build_banks(DEFAULT_SOURCES, out).items():
+        print(f"{name}: {count}")
@@ -0,0 +1,430 @@
+# ============================================
+# Question Deck - اختيار سؤال بدون تكرار بكلفة O(1)
+#
+# كل قائمة أسئلة لها "مجموعة ورق" (deck): ترتيب للمؤشرات + cursor.
+# كل سحب يختار مؤشراً عشوائياً من الجزء غير المسحوب ويبدّله مع موقع
+# الـ cursor (Fisher-Yates تدريجي)، فلا حاجة لبناء قائمة المتاح كل مرة.
+# المحفوظ هو أرقام المؤشرات فقط (4 بايت لكل سؤال) وليس نص الأسئلة.
+# ============================================
+
+from array import array
+from collections import OrderedDict
+from typing import Callable, Iterable, List, Optional
+import fcntl
+import math
+import mmap
+import os
+import random
+import struct
+import tempfile
+import threading
+import time
+
+HEADER = struct.Struct("<4sII")  # magic, size, cursor
+MAGIC = b"DECK"
+ITEM_SIZE = 4
+
+
+def initial_order(size: int, drawn: Iterable[int] = ()) -> List[int]:
+    """
+    ترتيب مبدئي: المؤشرات المستخدمة سابقاً أولاً (تُعتبر مسحوبة)، ثم الباقي.
+    """
+    drawn = [i for i in dict.fromkeys(drawn) if 0 <= i < size]
+    seen = set(drawn)
+    rest = [i for i in range(size) if i not in seen]
+    random.shuffle(rest)
+    return drawn + rest
+
+
+def resized_order(order: List[int], cursor: int, size: int, mapping: Optional[List[Optional[int]]] = None):
+    """
+    يطابق الـ deck مع حجم جديد للقائمة مع الحفاظ على ما سُحب:
+    - أسئلة جديدة (مؤشرات >= الحجم القديم) تُضاف للجزء غير المسحوب.
+    - مؤشرات لم تعد موجودة تُحذف.
+    mapping (من question_bank.index_mapping) ينقل كل مؤشر قديم لمكانه الجديد
+    عند تعديل القائمة، بدلاً من افتراض أن الأسئلة أُضيفت في آخرها فقط.
+    """
+    if mapping is None:
+        mapping = range(size)
+    old = [mapping[i] if i < len(mapping) else None for i in order]
+    drawn = [i for i in old[:cursor] if i is not None]
+    rest = [i for i in old[cursor:] if i is not None]
+    seen = set(drawn)
+    seen.update(rest)
+    rest.extend(i for i in range(size) if i not in seen)
+    return drawn + rest, len(drawn)
+
+
+def pick_position(cursor: int, size: int, rng=random) -> int:
+    """
+    الموقع الذي سيُبدَّل مع cursor. في بداية دورة جديدة نستثني آخر موقع
+    (آخر سؤال سُحب في الدورة السابقة) حتى لا يتكرر مباشرة.
+    """
+    if cursor == 0 and size > 1:
+        return rng.randrange(0, size - 1)
+    return rng.randrange(cursor, size)
+
+
+class MmapDeck:
+    """
+    Deck محفوظ في ملف ثنائي صغير يُقرأ عبر mmap:
+    [DECK][size][cursor][idx0][idx1]...
+
+    السحب يعدّل 12 بايت فقط داخل الصفحات المشتركة، فالحفظ O(1)،
+    وكل العمليات على نفس الجهاز تتشارك نفس الـ deck (مع flock أثناء السحب).
+    """
+
+    def __init__(self, path: str, size: int, drawn: Callable[[], Iterable[int]] = lambda: ()):
+        self.path = path
+        self._lock = threading.Lock()
+        self._fd = os.open(path, os.O_RDWR | os.O_CREAT, 0o644)
+        self._map: Optional[mmap.mmap] = None
+        fcntl.flock(self._fd, fcntl.LOCK_EX)
+        try:
+            self._open(size, drawn)
+        finally:
+            fcntl.flock(self._fd, fcntl.LOCK_UN)
+
+    def _open(self, size: int, drawn) -> None:
+        file_size = os.fstat(self._fd).st_size
+        if file_size >= HEADER.size:
+            self._map = mmap.mmap(self._fd, file_size)
+            magic, old_size, cursor = HEADER.unpack_from(self._map, 0)
+            if magic == MAGIC and file_size == HEADER.size + old_size * ITEM_SIZE:
+                if old_size == size:
+                    return
+                order = list(memoryview(self._map)[HEADER.size:].cast("I"))
+                self._map.close()
+                self._write(*resized_order(order, min(cursor, old_size), size))
+                return
+            self._map.close()
+        # أول مرة: ما سبق استخدامه (من ملفات used_*.txt) يُعتبر مسحوباً
+        used = list(dict.fromkeys(i for i in drawn() if 0 <= i < size))
+        self._write(initial_order(size, used), len(used))
+
+    def _write(self, order: List[int], cursor: int) -> None:
+        size = len(order)
+        data = HEADER.pack(MAGIC, size, cursor) + struct.pack(f"<{size}I", *order)
+        os.ftruncate(self._fd, len(data))
+        os.pwrite(self._fd, data, 0)
+        self._map = mmap.mmap(self._fd, len(data))
+
+    def _remap_if_resized(self, size: int) -> None:
+        # عملية أخرى غيّرت حجم الـ deck (قائمة أسئلة بحجم مختلف)
+        expected = HEADER.size + size * ITEM_SIZE
+        if len(self._map) != expected:
+            self._map.close()
+            self._map = mmap.mmap(self._fd, os.fstat(self._fd).st_size)
+
+    @property
+    def size(self) -> int:
+        return HEADER.unpack_from(self._map, 0)[1]
+
+    def remap(self, size: int, mapping: Optional[List[Optional[int]]]) -> None:
+        """
+        بعد إعادة تحميل القائمة: ينقل الـ deck للمؤشرات الجديدة مع الحفاظ على ما سُحب.
+        """
+        with self._lock:
+            fcntl.flock(self._fd, fcntl.LOCK_EX)
+            try:
+                _, old_size, cursor = HEADER.unpack_from(self._map, 0)
+                self._remap_if_resized(old_size)
+                order = list(memoryview(self._map)[HEADER.size:].cast("I"))
+                self._map.close()
+                self._write(*resized_order(order, min(cursor, old_size), size, mapping))
+            finally:
+                fcntl.flock(self._fd, fcntl.LOCK_UN)
+
+    def draw(self) -> int:
+        with self._lock:
+            fcntl.flock(self._fd, fcntl.LOCK_EX)
+            try:
+                magic, size, cursor = HEADER.unpack_from(self._map, 0)
+                self._remap_if_resized(size)
+                if cursor >= size:
+                    cursor = 0
+                j = pick_position(cursor, size)
+                items = memoryview(self._map)[HEADER.size:].cast("I")
+                try:
+                    items[cursor], items[j] = items[j], items[cursor]
+                    chosen = items[cursor]
+                finally:
+                    items.release()
+                HEADER.pack_into(self._map, 0, magic, size, cursor + 1)
+                return chosen
+            finally:
+                fcntl.flock(self._fd, fcntl.LOCK_UN)
+
+    def close(self) -> None:
+        with self._lock:
+            if self._map is not None:
+                self._map.flush()
+                self._map.close()
+                self._map = None
+            os.close(self._fd)
+
+
+class SQLiteDeck:
+    """
+    نفس الفكرة داخل SQLite (للـ workers على أكثر من عملية عبر قاعدة مشتركة):
+    السحب = قراءة cursor + تبديل صفّين + زيادة cursor في معاملة واحدة.
+    """
+
+    def __init__(self, transaction: Callable, name: str, size: int, drawn: Callable[[], Iterable[int]] = lambda: ()):
+        self.transaction = transaction
+        self.name = name
+        with self.transaction() as cur:
+            row = cur.execute(
+                "SELECT size, cursor FROM deck_meta WHERE pool=?", (name,)
+            ).fetchone()
+            if row and row[0] == size:
+                return
+            if row:
+                self._resize(cur, row, size, None)
+            else:
+                used = list(dict.fromkeys(i for i in drawn() if 0 <= i < size))
+                self._write(cur, initial_order(size, used), len(used))
+
+    def _resize(self, cur, row, size: int, mapping) -> None:
+        order = [r[0] for r in cur.execute(
+            "SELECT idx FROM deck_items WHERE pool=? ORDER BY pos", (self.name,)
+        )]
+        self._write(cur, *resized_order(order, min(row[1], row[0]), size, mapping))
+
+    def _write(self, cur, order: List[int], cursor: int) -> None:
+        cur.execute("DELETE FROM deck_items WHERE pool=?", (self.name,))
+        cur.executemany(
+            "INSERT INTO deck_items(pool, pos, idx) VALUES(?, ?, ?)",
+            ((self.name, pos, idx) for pos, idx in enumerate(order)),
+        )
+        cur.execute(
+            "INSERT INTO deck_meta(pool, size, cursor) VALUES(?, ?, ?) "
+            "ON CONFLICT(pool) DO UPDATE SET size = excluded.size, cursor = excluded.cursor",
+            (self.name, len(order), cursor),
+        )
+
+    def remap(self, size: int, mapping: Optional[List[Optional[int]]]) -> None:
+        with self.transaction() as cur:
+            row = cur.execute(
+                "SELECT size, cursor FROM deck_meta WHERE pool=?", (self.name,)
+            ).fetchone()
+            self._resize(cur, row, size, mapping)
+
+    def draw(self) -> int:
+        with self.transaction() as cur:
+            size, cursor = cur.execute(
+                "SELECT size, cursor FROM deck_meta WHERE pool=?", (self.name,)
+            ).fetchone()
+            if cursor >= size:
+                cursor = 0
+            j = pick_position(cursor, size)
+            a = cur.execute(
+                "SELECT idx FROM deck_items WHERE pool=? AND pos=?", (self.name, cursor)
+            ).fetchone()[0]
+            b = cur.execute(
+                "SELECT idx FROM deck_items WHERE pool=? AND pos=?", (self.name, j)
+            ).fetchone()[0]
+            cur.execute(
+                "UPDATE deck_items SET idx=? WHERE pool=? AND pos=?", (a, self.name, j)
+            )
+            cur.execute(
+                "UPDATE deck_items SET idx=? WHERE pool=? AND pos=?", (b, self.name, cursor)
+            )
+            cur.execute(
+                "UPDATE deck_meta SET cursor=? WHERE pool=?", (cursor + 1, self.name)
+            )
+            return b
+
+    def close(self) -> None:
+        pass
+
+
+# =============================
+# Per-chat Rotation
+# =============================
+# كل محادثة (أو مستخدم) لها دورتها الخاصة في كل لعبة، بدون نسخة من الـ deck:
+# ترتيب أساسي ثابت لكل قائمة base، والمحادثة تمشي عليه بخطوة stride
+# (أولية مع الحجم n) بدءاً من offset:
+#     السؤال رقم k = base[(offset + k * stride) % n]
+# فتمر على كل الأسئلة مرة واحدة قبل أي تكرار، والحالة 20 بايت فقط.
+ROTATION_RECORD = struct.Struct("<IIIII")  # offset, stride, k, n, last_seen
+ROTATION_FILE_HEADER = struct.Struct("<4sI")  # magic, count
+ROTATION_ITEM = struct.Struct("<q20s")  # key, record
+ROTATION_MAGIC = b"ROT1"
+
+# رقم اللعبة داخل المفتاح: key = (scope_id << 4) | game
+ROTATION_GAMES = {
+    "kt": 0, "general": 1, "wyr": 2, "who": 3,
+    "crimes": 4, "facts": 5, "truth": 6, "dare": 7,
+}
+
+
+def rotation_key(scope_id: int, game: str) -> int:
+    return (scope_id << 4) | ROTATION_GAMES[game]
+
+
+def new_cycle(n: int, avoid: Optional[int], base, rng=random):
+    offset = rng.randrange(n)
+    stride = 1
+    if n > 2:
+        while True:
+            stride = rng.randrange(1, n)
+            if math.gcd(stride, n) == 1:
+                break
+    if avoid is not None and n > 1 and base[offset] == avoid:
+        offset = (offset + 1) % n
+    return offset, stride
+
+
+class RotationStore:
+    """
+    المنطق المشترك. المخزن الفعلي (ذاكرة أو SQLite) يطبّق _get و _put.
+    """
+
+    def __init__(self):
+        self._bases = {}
+        self._carried = {}
+
+    def base(self, game: str, n: int):
+        """
+        الترتيب الأساسي ثابت لكل (لعبة، حجم)، ومشترك بين كل المحادثات والـ workers.
+        """
+        cached = self._bases.get((game, n))
+        if cached is None:
+            order = list(range(n))
+            random.Random(f"{game}:{n}").shuffle(order)
+            cached = self._bases[(game, n)] = array("I", order)
+        return cached
+
+    def carry_over(self, game: str, old_n: int) -> None:
+        """
+        بعد إعادة تحميل قائمة أُضيفت أسئلة في آخرها فقط (أول old_n بدون تغيير):
+        المحادثات في منتصف دورة بالحجم القديم تكملها ثم تبدأ دورة بالحجم الجديد.
+        أي تعديل آخر يبدأ دورة جديدة، لأن الحالة لا تحفظ قائمة ما سُحب.
+        """
+        self._carried.setdefault(game, set()).add(old_n)
+
+    def advance(self, record: Optional[bytes], game: str, n: int, now: int):
+        base = self.base(game, n)
+        if record is None:
+            (offset, stride), k, size = new_cycle(n, None, base), 0, n
+        else:
+            offset, stride, k, size, _ = ROTATION_RECORD.unpack(record)
+            if size != n and size not in self._carried.get(game, ()):
+                # تغيّر حجم القائمة: دورة جديدة
+                (offset, stride), k, size = new_cycle(n, None, base), 0, n
+            elif k >= size:
+                last = self.base(game, size)[(offset + (size - 1) * stride) % size]
+                (offset, stride), k, size = new_cycle(n, last, base), 0, n
+        index = self.base(game, size)[(offset + k * stride) % size]
+        return index, ROTATION_RECORD.pack(offset, stride, k + 1, size, now)
+
+
+class MemoryRotationStore(RotationStore):
+    """
+    الحالة في الذاكرة (OrderedDict بترتيب آخر استخدام) مع حد أقصى للعدد
+    وحذف المحادثات الخاملة، وتُحفظ كملف ثنائي واحد في الخلفية (snapshot/save).
+    """
+
+    def __init__(self, path: str, max_entries: int = 200_000, idle_ttl: float = 30 * 86400):
+        super().__init__()
+        self.path = path
+        self.max_entries = max_entries
+        self.idle_ttl = idle_ttl
+        self.lock = threading.Lock()
+        self._data: "OrderedDict[int, bytes]" = OrderedDict()
+        self.evicted = 0
+        self.load()
+
+    def __len__(self) -> int:
+        return len(self._data)
+
+    def draw(self, scope_id: int, game: str, n: int) -> int:
+        now = int(time.time())
+        key = rotation_key(scope_id, game)
+        with self.lock:
+            index, record = self.advance(self._data.pop(key, None), game, n, now)
+            self._data[key] = record
+            self._evict(now)
+        return index
+
+    def _evict(self, now: int) -> None:
+        data = self._data
+        while data:
+            key, record = next(iter(data.items()))
+            last_seen = ROTATION_RECORD.unpack(record)[4]
+            if len(data) > self.max_entries or now - last_seen > self.idle_ttl:
+                del data[key]
+                self.evicted += 1
+            else:
+                break
+
+    # ---------- حفظ ----------
+    def snapshot(self) -> bytes:
+        """
+        تُستدعى و self.lock مأخوذ (WriteBehindSaver).
+        """
+        parts = [ROTATION_FILE_HEADER.pack(ROTATION_MAGIC, len(self._data))]
+        parts.extend(ROTATION_ITEM.pack(k, r) for k, r in self._data.items())
+        return b"".join(parts)
+
+    def save(self, data: bytes) -> None:
+        directory = os.path.dirname(os.path.abspath(self.path))
+        fd, tmp = tempfile.mkstemp(prefix=".rotation-", suffix=".tmp", dir=directory)
+        try:
+            with os.fdopen(fd, "wb") as f:
+                f.write(data)
+            os.replace(tmp, self.path)
+        except BaseException:
+            try:
+                os.unlink(tmp)
+            except OSError:
+                pass
+            raise
+
+    def load(self) -> None:
+        try:
+            with open(self.path, "rb") as f:
+                raw = f.read()
+            magic, count = ROTATION_FILE_HEADER.unpack_from(raw, 0)
+        except (OSError, struct.error):
+            return
+        if magic != ROTATION_MAGIC:
+            return
+        offset = ROTATION_FILE_HEADER.size
+        # ملف مقطوع (توقف أثناء الكتابة): نقرأ العناصر الكاملة فقط
+        count = min(count, (len(raw) - offset) // ROTATION_ITEM.size)
+        for _ in range(count):
+            key, record = ROTATION_ITEM.unpack_from(raw, offset)
+            offset += ROTATION_ITEM.size
+            self._data[key] = record
+
+
+class SQLiteRotationStore(RotationStore):
+    """
+    الحالة في جدول rotation، والسحب معاملة واحدة، حتى لا تتكرر الأسئلة
+    عندما تصل تحديثات نفس المحادثة إلى workers مختلفة.
+    """
+
+    def __init__(self, transaction: Callable, idle_ttl: float = 30 * 86400, evict_every: int = 1000):
+        super().__init__()
+        self.transaction = transaction
+        self.idle_ttl = idle_ttl
+        self.evict_every = evict_every
+        self._draws = 0
+
+    def draw(self, scope_id: int, game: str, n: int) -> int:
+        now = int(time.time())
+        key = rotation_key(scope_id, game)
+        with self.transaction() as cur:
+            row = cur.execute("SELECT rec FROM rotation WHERE key=?", (key,)).fetchone()
+            index, record = self.advance(row[0] if row else None, game, n, now)
+            cur.execute(
+                "INSERT INTO rotation(key, rec, seen) VALUES(?, ?, ?) "
+                "ON CONFLICT(key) DO UPDATE SET rec = excluded.rec, seen = excluded.seen",
+                (key, record, now),
+            )
+            self._draws += 1
+            if self._draws % self.evict_every == 0:
+                cur.execute("DELETE FROM rotation WHERE seen < ?", (now - self.idle_ttl,))
+        return index
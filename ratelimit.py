@@ -0,0 +1,128 @@
+# ============================================
+# Rate Limiting - Token Bucket (عام + لكل محادثة/مستخدم)
+# ============================================
+
+from collections import OrderedDict
+from typing import Hashable, Optional
+import asyncio
+import time
+
+
+def retry_after_seconds(error) -> float:
+    """
+    مدة الانتظار من RetryAfter (رقم أو timedelta حسب نسخة المكتبة).
+    """
+    value = error.retry_after
+    if hasattr(value, "total_seconds"):
+        return value.total_seconds()
+    return float(value)
+
+
+class TokenBucket:
+    """
+    Token bucket بسيط: rate توكن في الثانية وحد أقصى capacity.
+    acquire() يحجز التوكن فوراً (الرصيد قد يصبح سالباً) ثم ينتظر المدة اللازمة،
+    فالمنتظرون يُخدمون بترتيب وصولهم بدون حلقات انتظار.
+    """
+
+    __slots__ = ("rate", "capacity", "tokens", "updated", "blocked_until")
+
+    def __init__(self, rate: float, capacity: Optional[float] = None):
+        self.rate = rate
+        self.capacity = capacity if capacity is not None else rate
+        self.tokens = self.capacity
+        self.updated = time.monotonic()
+        self.blocked_until = 0.0
+
+    def _refill(self, now: float) -> None:
+        self.tokens = min(self.capacity, self.tokens + (now - self.updated) * self.rate)
+        self.updated = now
+
+    def try_acquire(self, n: float = 1.0) -> bool:
+        now = time.monotonic()
+        if now < self.blocked_until:
+            return False
+        self._refill(now)
+        if self.tokens >= n:
+            self.tokens -= n
+            return True
+        return False
+
+    def reserve(self, n: float = 1.0) -> float:
+        """
+        يحجز n توكن ويرجع عدد الثواني التي يجب انتظارها قبل الاستخدام.
+        """
+        now = time.monotonic()
+        self._refill(now)
+        self.tokens -= n
+        wait = -self.tokens / self.rate if self.tokens < 0 else 0.0
+        return max(wait, self.blocked_until - now)
+
+    async def acquire(self, n: float = 1.0) -> None:
+        wait = self.reserve(n)
+        if wait > 0:
+            await asyncio.sleep(wait)
+
+    def pause(self, seconds: float) -> None:
+        """
+        يوقف الجميع لمدة seconds (مثلاً عند RetryAfter من تيليجرام).
+        """
+        self.blocked_until = max(self.blocked_until, time.monotonic() + seconds)
+
+
+class KeyedRateLimiter:
+    """
+    Token bucket لكل مفتاح (محادثة أو مستخدم) بذاكرة صغيرة:
+    لكل مفتاح tuple واحد (الرصيد، آخر تحديث).
+
+    المفتاح الذي لم يُستخدم منذ capacity/rate ثانية يكون رصيده ممتلئاً،
+    أي مطابق لمفتاح جديد، فيُحذف بدون أي أثر على السلوك. الحذف يتم من
+    أول OrderedDict (الأقدم استخداماً) فكلفته O(1) لكل عملية.
+    """
+
+    def __init__(self, rate: float, capacity: float, max_keys: int = 100_000):
+        self.rate = rate
+        self.capacity = capacity
+        self.max_keys = max_keys
+        self.idle_after = capacity / rate
+        self._buckets: "OrderedDict[Hashable, tuple]" = OrderedDict()
+
+    def __len__(self) -> int:
+        return len(self._buckets)
+
+    def _current(self, key: Hashable, now: float) -> float:
+        # pop ثم إعادة الإدخال تنقل المفتاح لآخر الترتيب (الأحدث استخداماً)
+        tokens, updated = self._buckets.pop(key, (self.capacity, now))
+        return min(self.capacity, tokens + (now - updated) * self.rate)
+
+    def try_acquire(self, key: Hashable, n: float = 1.0) -> bool:
+        now = time.monotonic()
+        self._evict(now)
+        tokens = self._current(key, now)
+        allowed = tokens >= n
+        if allowed:
+            tokens -= n
+        self._buckets[key] = (tokens, now)
+        return allowed
+
+    def reserve(self, key: Hashable, n: float = 1.0) -> float:
+        """
+        يحجز n توكن للمفتاح ويرجع مدة الانتظار اللازمة بالثواني.
+        """
+        now = time.monotonic()
+        self._evict(now)
+        tokens = self._current(key, now) - n
+        self._buckets[key] = (tokens, now)
+        return -tokens / self.rate if tokens < 0 else 0.0
+
+    def _evict(self, now: float) -> None:
+        buckets = self._buckets
+        while buckets:
+            key, (tokens, updated) = next(iter(buckets.items()))
+            idle = now - updated
+            if idle >= self.idle_after and tokens + idle * self.rate >= self.capacity:
+                del buckets[key]
+            elif len(buckets) > self.max_keys:
+                del buckets[key]
+            else:
+                break
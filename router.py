@@ -0,0 +1,70 @@
+# ============================================
+# Message Router - جدول توجيه بدل سلسلة if في handle_message
+#
+# كل الكلمات (الألعاب + الردود السريعة) في dict واحد مفتاحه النص بعد
+# normalize_text، فالرسالة العادية (أغلب رسائل القروبات) تكلف:
+#   مقارنة طول + (إن لزم) normalize + بحث واحد في dict.
+# ============================================
+
+from typing import Callable, Dict, Optional, Tuple
+
+# الأولوية عند تكرار نفس الكلمة (الأعلى يغلب)
+PRIORITY_FIRST = 2  # مثل بدء لعبة تحدي/صراحة
+PRIORITY_REPLIES = 1  # autoreplies.txt
+PRIORITY_GAMES = 0
+
+
+class MessageRouter:
+    """
+    route(...) تسجّل handler لكلمة أو أكثر، و set_replies تضيف الردود السريعة
+    (قيمتها نص الرد بدل handler). compile() يبني الجدول الجديد ثم يستبدله
+    دفعة واحدة، فالقراءة من handle_message لا ترى جدولاً نصف مبني.
+    """
+
+    def __init__(self, normalize: Callable[[str], str], may_shrink: Callable[[str], bool] = lambda t: False):
+        self.normalize = normalize
+        self.may_shrink = may_shrink
+        self._routes: Dict[str, Tuple[int, object]] = {}
+        self._replies: Dict[str, str] = {}
+        self.table: Dict[str, object] = {}
+        self.max_len = 0
+
+    def add(self, triggers, target, priority: int = PRIORITY_GAMES) -> None:
+        for trigger in triggers:
+            self._routes[self.normalize(trigger)] = (priority, target)
+        self.compile()
+
+    def route(self, *triggers: str, priority: int = PRIORITY_GAMES):
+        """
+        Decorator لتسجيل لعبة جديدة:
+            @ROUTER.route("كتت")
+            async def kt_game(update, context): ...
+        """
+        def decorator(handler):
+            self.add(triggers, handler, priority)
+            return handler
+        return decorator
+
+    def set_replies(self, replies: Dict[str, str]) -> None:
+        self._replies = {self.normalize(k): v for k, v in replies.items()}
+        self.compile()
+
+    def compile(self) -> None:
+        entries = {key: (PRIORITY_REPLIES, reply) for key, reply in self._replies.items()}
+        for key, (priority, target) in self._routes.items():
+            current = entries.get(key)
+            if current is None or priority > current[0]:
+                entries[key] = (priority, target)
+        table = {key: target for key, (_, target) in entries.items()}
+        self.max_len = max(map(len, table), default=0)
+        self.table = table
+
+    def match(self, text: str) -> Optional[object]:
+        """
+        يرجع handler أو نص رد سريع أو None. text بعد strip.
+        normalize لا يقصّر النص إلا بحذف التشكيل/التطويل، فالرسالة الأطول
+        من أطول كلمة وليس فيها تشكيل تُرفض مباشرة بدون تطبيع.
+        """
+        if len(text) > self.max_len and not self.may_shrink(text):
+            return None
+        return self.table.get(self.normalize(text))
@@ -0,0 +1,748 @@
+# ============================================
+# State Backend - مكان حفظ الحالة المشتركة بين الـ workers
+#   file   : ملفات محلية (stats.json + stats.journal + deck_*.bin + chat_state.log)
+#            مناسب لعملية واحدة (أو عدة عمليات على نفس الجهاز للأسئلة فقط).
+#   sqlite : قاعدة SQLite واحدة (WAL) يتشاركها أي عدد من الـ workers على
+#            نفس الجهاز، وتشمل أيضاً بيانات المحادثات (PTB persistence).
+# ============================================
+
+from abc import ABC, abstractmethod
+from typing import Callable, Dict, List, Optional, Tuple
+import asyncio
+import fcntl
+import os
+import sqlite3
+import threading
+import time
+
+from telegram.ext import BasePersistence, PersistenceInput
+
+from cardinality import (
+    ACTIVE_DAYS,
+    ACTIVE_PRECISION,
+    EXACT,
+    HLL,
+    UNIQUE_PRECISION,
+    ActiveUsers,
+    HyperLogLog,
+)
+from chat_state import KVLog, dumps, loads
+from question_deck import MemoryRotationStore, MmapDeck, SQLiteDeck, SQLiteRotationStore
+from stats_store import StatsDelta, StatsJournal, empty_stats
+from timeseries import TIER_SIZES, TIERS, ActivitySeries, tier_slots
+
+
+class StateBackend(ABC):
+    """
+    الواجهة المشتركة. shared=True يعني أن عدة عمليات تكتب في نفس المكان،
+    فالأرقام المعروضة يجب أن تُقرأ من الـ backend وليس من ذاكرة العملية.
+    backend ينقصه أحد الدوال المجردة يفشل عند إنشائه وليس عند أول استدعاء.
+    """
+
+    shared = False
+
+    # ---------- الإحصائيات ----------
+    @abstractmethod
+    def load_stats(self) -> dict:
+        ...
+
+    @abstractmethod
+    def save_stats(self, delta: StatsDelta, full: Optional[dict] = None) -> None:
+        """
+        لو فشل الحفظ (استثناء) تبقى delta معلّقة وتُحفظ مع الاستدعاء القادم.
+        """
+
+    def needs_compaction(self) -> bool:
+        return False
+
+    def stats_summary(self) -> Optional[dict]:
+        """
+        الأرقام الإجمالية من كل الـ workers (None = استخدم ذاكرة العملية).
+        """
+        return None
+
+    def group_ids(self) -> Optional[list]:
+        return None
+
+    # ---------- الأسئلة ----------
+    @abstractmethod
+    def deck(self, name: str, texts: List[str]):
+        """
+        Deck الأسئلة لقائمة name (انظر question_deck). texts تُستخدم لمعرفة
+        الحجم، ولأول مرة فقط لتحويل الأسئلة المستخدمة سابقاً إلى مؤشرات.
+        """
+
+    @abstractmethod
+    def rotation_store(self, max_entries: int, idle_ttl: float):
+        """
+        دورة الأسئلة لكل محادثة/مستخدم (انظر question_deck.RotationStore).
+        """
+
+    # ---------- أخرى ----------
+    def acquire_lease(self, name: str, ttl: float) -> bool:
+        """
+        يرجع True لعملية واحدة فقط خلال ttl ثانية (مثلاً لتسجيل الـ webhook مرة واحدة).
+        """
+        return True
+
+    def persistence(self) -> Optional[BasePersistence]:
+        return None
+
+    def close(self) -> None:
+        pass
+
+
+def used_indices(texts: List[str], used: set) -> List[int]:
+    return [i for i, text in enumerate(texts) if text in used]
+
+
+# =============================
+# File Backend (الافتراضي)
+# =============================
+class FileStateBackend(StateBackend):
+    def __init__(
+        self,
+        stats_file: str,
+        journal_file: str,
+        journal_max_bytes: int,
+        directory: str = ".",
+        cardinality: str = EXACT,
+    ):
+        self.directory = directory
+        self.journal = StatsJournal(
+            stats_file, journal_file, max_bytes=journal_max_bytes, cardinality=cardinality
+        )
+        self._kv: Optional[KVLog] = None
+
+    def load_stats(self) -> dict:
+        return self.journal.load()
+
+    def needs_compaction(self) -> bool:
+        return self.journal.needs_compaction()
+
+    def save_stats(self, delta: StatsDelta, full: Optional[dict] = None) -> None:
+        if full is not None:
+            self.journal.compact(full)
+        else:
+            self.journal.append(delta)
+
+    def load_used(self, name: str) -> set:
+        """
+        الأسئلة المستخدمة من ملفات used_*.txt القديمة (للترحيل إلى الـ deck فقط).
+        """
+        path = os.path.join(self.directory, f"used_{name}.txt")
+        if not os.path.exists(path):
+            return set()
+        with open(path, "r", encoding="utf-8") as f:
+            return set(line.strip() for line in f if line.strip())
+
+    def deck(self, name: str, texts: List[str]):
+        return MmapDeck(
+            os.path.join(self.directory, f"deck_{name}.bin"),
+            len(texts),
+            drawn=lambda: used_indices(texts, self.load_used(name)),
+        )
+
+    def rotation_store(self, max_entries: int, idle_ttl: float):
+        return MemoryRotationStore(
+            os.path.join(self.directory, "rotation.bin"),
+            max_entries=max_entries,
+            idle_ttl=idle_ttl,
+        )
+
+    def acquire_lease(self, name: str, ttl: float) -> bool:
+        path = os.path.join(self.directory, f".lease-{name}")
+        with open(path, "a+", encoding="utf-8") as f:
+            fcntl.flock(f, fcntl.LOCK_EX)
+            try:
+                f.seek(0)
+                try:
+                    expires = float(f.read().strip() or 0)
+                except ValueError:
+                    expires = 0.0
+                now = time.time()
+                if expires > now:
+                    return False
+                f.seek(0)
+                f.truncate()
+                f.write(str(now + ttl))
+                f.flush()
+                return True
+            finally:
+                fcntl.flock(f, fcntl.LOCK_UN)
+
+    # ---------- بيانات المحادثات ----------
+    @property
+    def kv(self) -> KVLog:
+        if self._kv is None:
+            self._kv = KVLog(os.path.join(self.directory, "chat_state.log"))
+        return self._kv
+
+    def kv_get_all(self, ns: str) -> Dict[str, bytes]:
+        return self.kv.kv_get_all(ns)
+
+    def kv_get(self, ns: str, key: str) -> Optional[bytes]:
+        return self.kv.kv_get(ns, key)
+
+    def kv_set(self, ns: str, key: str, value: bytes) -> None:
+        self.kv.kv_set(ns, key, value)
+
+    def kv_delete(self, ns: str, key: str) -> None:
+        self.kv.kv_delete(ns, key)
+
+    def kv_sync(self) -> None:
+        if self._kv is not None:
+            self._kv.sync()
+
+    def persistence(self) -> Optional[BasePersistence]:
+        return BackendPersistence(self)
+
+    def close(self) -> None:
+        if self._kv is not None:
+            self._kv.close()
+
+
+# =============================
+# SQLite Backend (عدة workers)
+# =============================
+SQLITE_SCHEMA = """
+CREATE TABLE IF NOT EXISTS meta (key TEXT PRIMARY KEY, value TEXT);
+CREATE TABLE IF NOT EXISTS counters (name TEXT PRIMARY KEY, value INTEGER NOT NULL);
+CREATE TABLE IF NOT EXISTS stat_ids (
+    kind TEXT NOT NULL, id INTEGER NOT NULL, PRIMARY KEY (kind, id)
+) WITHOUT ROWID;
+CREATE TABLE IF NOT EXISTS sketches (name TEXT PRIMARY KEY, registers BLOB NOT NULL);
+CREATE TABLE IF NOT EXISTS activity_series (
+    tier TEXT NOT NULL, slot INTEGER NOT NULL, count INTEGER NOT NULL, PRIMARY KEY (tier, slot)
+) WITHOUT ROWID;
+CREATE TABLE IF NOT EXISTS used (
+    seq INTEGER PRIMARY KEY AUTOINCREMENT,
+    pool TEXT NOT NULL, value TEXT NOT NULL, UNIQUE (pool, value)
+);
+CREATE TABLE IF NOT EXISTS deck_meta (
+    pool TEXT PRIMARY KEY, size INTEGER NOT NULL, cursor INTEGER NOT NULL
+);
+CREATE TABLE IF NOT EXISTS deck_items (
+    pool TEXT NOT NULL, pos INTEGER NOT NULL, idx INTEGER NOT NULL, PRIMARY KEY (pool, pos)
+) WITHOUT ROWID;
+CREATE TABLE IF NOT EXISTS rotation (
+    key INTEGER PRIMARY KEY, rec BLOB NOT NULL, seen INTEGER NOT NULL
+);
+CREATE TABLE IF NOT EXISTS kv (
+    ns TEXT NOT NULL, key TEXT NOT NULL, value BLOB, PRIMARY KEY (ns, key)
+) WITHOUT ROWID;
+CREATE TABLE IF NOT EXISTS leases (name TEXT PRIMARY KEY, expires REAL NOT NULL);
+"""
+
+# أنواع المعرّفات في جدول stat_ids (نفس رموز stats.journal)
+ID_KINDS = {"u": "unique_users", "g": "unique_groups", "p": "unique_private_chats"}
+# في وضع hll هذه الأنواع sketch في جدول sketches (بنفس الاسم) بدل stat_ids،
+# و DAU اسمه "a:<رقم اليوم>"
+SKETCH_KINDS = ("u", "p")
+
+
+class SQLiteStateBackend(StateBackend):
+    """
+    اتصالان بالقاعدة، كل واحد بقفله:
+    - conn (انتظار قفل الكتابة حتى 30 ثانية): الحفظ الخلفي والـ persistence
+      وباقي الاستدعاءات التي تعمل في خيط (asyncio.to_thread).
+    - draw_conn (انتظار busy_timeout فقط): سحب الأسئلة الذي يعمل على
+      event loop مباشرة، فلا يتوقف الـ loop طويلاً إن كان worker آخر يكتب،
+      ولا ينتظر خلف حفظ خلفي يملك قفل conn.
+    """
+
+    shared = True
+
+    def __init__(
+        self,
+        path: str,
+        migrate_from: Optional[FileStateBackend] = None,
+        cardinality: str = EXACT,
+        busy_timeout: float = 2.0,
+    ):
+        self.path = path
+        self.cardinality = cardinality
+        # تغييرات لم يُكمل حفظها (فشل الـ transaction): تُدمج مع الحفظ القادم
+        self._pending = StatsDelta()
+        self._lock = threading.RLock()
+        self.conn = self._connect(30)
+        self.conn.executescript(SQLITE_SCHEMA)
+        self._draw_lock = threading.RLock()
+        self.draw_conn = self._connect(busy_timeout)
+        self._migrate_activity()
+        if migrate_from is not None:
+            self._migrate(migrate_from)
+        if cardinality == HLL:
+            self._migrate_sketches()
+
+    def _connect(self, timeout: float) -> sqlite3.Connection:
+        conn = sqlite3.connect(self.path, timeout=timeout, check_same_thread=False, isolation_level=None)
+        conn.execute("PRAGMA journal_mode=WAL")
+        conn.execute("PRAGMA synchronous=NORMAL")
+        return conn
+
+    def _tx(self):
+        return _Transaction(self.conn, self._lock)
+
+    def _draw_tx(self):
+        return _Transaction(self.draw_conn, self._draw_lock)
+
+    def _migrate(self, old: FileStateBackend) -> None:
+        """
+        أول تشغيل فقط: ينقل الإحصائيات وملفات used_*.txt الحالية إلى القاعدة.
+        """
+        with self._tx() as cur:
+            row = cur.execute("SELECT value FROM meta WHERE key='migrated'").fetchone()
+            if row:
+                return
+            cur.execute("INSERT INTO meta(key, value) VALUES('migrated', ?)", (str(time.time()),))
+            data = old.load_stats()
+            self._write_full(cur, data)
+            for filename in os.listdir(old.directory):
+                if filename.startswith("used_") and filename.endswith(".txt"):
+                    name = filename[len("used_"):-len(".txt")]
+                    values = old.load_used(name)
+                    cur.executemany(
+                        "INSERT OR IGNORE INTO used(pool, value) VALUES(?, ?)",
+                        ((name, v) for v in values),
+                    )
+
+    def _migrate_activity(self) -> None:
+        """
+        جدول activity القديم (صف لكل ساعة منذ أول تشغيل) -> activity_series.
+        """
+        with self._tx() as cur:
+            row = cur.execute(
+                "SELECT 1 FROM sqlite_master WHERE type='table' AND name='activity'"
+            ).fetchone()
+            if not row:
+                return
+            buckets = dict(cur.execute("SELECT bucket, count FROM activity"))
+            self._add_activity(cur, ActivitySeries.from_buckets(buckets))
+            cur.execute("DROP TABLE activity")
+
+    def _migrate_sketches(self) -> None:
+        """
+        أول تشغيل بـ STATS_CARDINALITY=hll: معرّفات المستخدمين والخاص -> sketches.
+        """
+        with self._tx() as cur:
+            for kind in SKETCH_KINDS:
+                ids = [r[0] for r in cur.execute("SELECT id FROM stat_ids WHERE kind=?", (kind,))]
+                if ids:
+                    self._update_sketch(cur, kind, UNIQUE_PRECISION, ids=ids)
+                    cur.execute("DELETE FROM stat_ids WHERE kind=?", (kind,))
+
+    def _update_sketch(
+        self, cur, name: str, p: int, ids=(), sketch: Optional[HyperLogLog] = None
+    ) -> None:
+        """
+        max بين الـ registers المحفوظة والجديدة، فترتيب الكتابة بين الـ workers لا يهم.
+        """
+        row = cur.execute("SELECT registers FROM sketches WHERE name=?", (name,)).fetchone()
+        stored = HyperLogLog.from_bytes(row[0]) if row else HyperLogLog(p)
+        if sketch is not None:
+            stored.merge(sketch)
+        stored.update(ids)
+        cur.execute(
+            "INSERT OR REPLACE INTO sketches(name, registers) VALUES(?, ?)",
+            (name, stored.to_bytes()),
+        )
+
+    def _load_active_users(self) -> ActiveUsers:
+        active = ActiveUsers()
+        for name, blob in self.conn.execute(
+            "SELECT name, registers FROM sketches WHERE name LIKE 'a:%'"
+        ):
+            active.merge_day(int(name[2:]), HyperLogLog.from_bytes(blob))
+        return active
+
+    def _add_activity(self, cur, series: ActivitySeries) -> None:
+        for name in TIERS:
+            ring = series.tier(name)
+            cur.executemany(
+                "INSERT INTO activity_series(tier, slot, count) VALUES(?, ?, ?) "
+                "ON CONFLICT(tier, slot) DO UPDATE SET count = count + excluded.count",
+                ((name, slot, n) for slot, n in ring.last(ring.size) if n),
+            )
+
+    def _write_full(self, cur, data: dict) -> None:
+        cur.execute(
+            "INSERT INTO counters(name, value) VALUES('total_messages', ?) "
+            "ON CONFLICT(name) DO UPDATE SET value = value + excluded.value",
+            (data["total_messages"],),
+        )
+        for kind, field in ID_KINDS.items():
+            value = data[field]
+            if isinstance(value, HyperLogLog):
+                self._update_sketch(cur, kind, value.p, sketch=value)
+                continue
+            cur.executemany(
+                "INSERT OR IGNORE INTO stat_ids(kind, id) VALUES(?, ?)",
+                ((kind, i) for i in value),
+            )
+        self._add_activity(cur, data["activity"])
+        for day, sketch in data["active_users"].sketches.items():
+            self._update_sketch(cur, f"a:{day}", sketch.p, sketch=sketch)
+
+    # ---------- الإحصائيات ----------
+    def load_stats(self) -> dict:
+        state = empty_stats(self.cardinality)
+        with self._lock:
+            row = self.conn.execute(
+                "SELECT value FROM counters WHERE name='total_messages'"
+            ).fetchone()
+            state["total_messages"] = row[0] if row else 0
+            for kind, field in ID_KINDS.items():
+                state[field].update(
+                    r[0] for r in self.conn.execute("SELECT id FROM stat_ids WHERE kind=?", (kind,))
+                )
+            if self.cardinality == HLL:
+                for kind in SKETCH_KINDS:
+                    row = self.conn.execute(
+                        "SELECT registers FROM sketches WHERE name=?", (kind,)
+                    ).fetchone()
+                    if row:
+                        state[ID_KINDS[kind]].merge(HyperLogLog.from_bytes(row[0]))
+            state["activity"] = self._load_activity()
+            state["active_users"] = self._load_active_users()
+        return state
+
+    def save_stats(self, delta: StatsDelta, full: Optional[dict] = None) -> None:
+        self._pending.merge(delta)
+        delta = self._pending
+        if not delta:
+            return
+        with self._tx() as cur:
+            if delta.removed_groups:
+                cur.executemany(
+                    "DELETE FROM stat_ids WHERE kind='g' AND id=?",
+                    ((i,) for i in delta.removed_groups),
+                )
+            if delta.messages:
+                cur.execute(
+                    "INSERT INTO counters(name, value) VALUES('total_messages', ?) "
+                    "ON CONFLICT(name) DO UPDATE SET value = value + excluded.value",
+                    (delta.messages,),
+                )
+            for kind, ids in (("u", delta.users), ("g", delta.groups), ("p", delta.private_chats)):
+                if not ids:
+                    continue
+                if self.cardinality == HLL and kind in SKETCH_KINDS:
+                    self._update_sketch(cur, kind, UNIQUE_PRECISION, ids=ids)
+                else:
+                    cur.executemany(
+                        "INSERT OR IGNORE INTO stat_ids(kind, id) VALUES(?, ?)",
+                        ((kind, i) for i in ids),
+                    )
+            if delta.active:
+                by_day: Dict[int, list] = {}
+                for day, user_id in delta.active:
+                    by_day.setdefault(day, []).append(user_id)
+                for day, ids in by_day.items():
+                    self._update_sketch(cur, f"a:{day}", ACTIVE_PRECISION, ids=ids)
+                cur.execute(
+                    "DELETE FROM sketches WHERE name LIKE 'a:%' AND CAST(substr(name, 3) AS INTEGER) <= ?",
+                    (max(by_day) - ACTIVE_DAYS,),
+                )
+            if delta.buckets:
+                cur.executemany(
+                    "INSERT INTO activity_series(tier, slot, count) VALUES(?, ?, ?) "
+                    "ON CONFLICT(tier, slot) DO UPDATE SET count = count + excluded.count",
+                    (
+                        (name, slot, n)
+                        for hour, n in delta.buckets.items()
+                        for name, slot in zip(TIERS, tier_slots(hour))
+                    ),
+                )
+                # نفس حجم الـ ring في الذاكرة: الجدول لا يكبر مع مدة التشغيل
+                newest = tier_slots(max(delta.buckets))
+                cur.executemany(
+                    "DELETE FROM activity_series WHERE tier=? AND slot<=?",
+                    ((name, slot - TIER_SIZES[name]) for name, slot in zip(TIERS, newest)),
+                )
+        self._pending = StatsDelta()
+
+    def _load_activity(self) -> ActivitySeries:
+        return ActivitySeries.from_rows(
+            self.conn.execute("SELECT tier, slot, count FROM activity_series")
+        )
+
+    def stats_summary(self) -> Optional[dict]:
+        with self._lock:
+            row = self.conn.execute(
+                "SELECT value FROM counters WHERE name='total_messages'"
+            ).fetchone()
+            counts = dict(self.conn.execute("SELECT kind, COUNT(*) FROM stat_ids GROUP BY kind"))
+            if self.cardinality == HLL:
+                for kind in SKETCH_KINDS:
+                    sketch = self.conn.execute(
+                        "SELECT registers FROM sketches WHERE name=?", (kind,)
+                    ).fetchone()
+                    counts[kind] = HyperLogLog.from_bytes(sketch[0]).count() if sketch else 0
+            activity = self._load_activity()
+            active_users = self._load_active_users()
+        return {
+            "total_messages": row[0] if row else 0,
+            "unique_users": counts.get("u", 0),
+            "unique_groups": counts.get("g", 0),
+            "unique_private_chats": counts.get("p", 0),
+            "activity": activity,
+            "active_users": active_users,
+        }
+
+    def group_ids(self) -> Optional[list]:
+        with self._lock:
+            return [r[0] for r in self.conn.execute("SELECT id FROM stat_ids WHERE kind='g'")]
+
+    # ---------- الأسئلة ----------
+    def deck(self, name: str, texts: List[str]):
+        def drawn():
+            with self._lock:
+                rows = self.conn.execute("SELECT value FROM used WHERE pool=?", (name,))
+                return used_indices(texts, set(r[0] for r in rows))
+
+        return SQLiteDeck(self._draw_tx, name, len(texts), drawn=drawn)
+
+    def rotation_store(self, max_entries: int, idle_ttl: float):
+        # الحذف هنا حسب الخمول فقط؛ الحجم يبقى على القرص وليس في الذاكرة
+        return SQLiteRotationStore(self._draw_tx, idle_ttl=idle_ttl)
+
+    # ---------- أخرى ----------
+    def acquire_lease(self, name: str, ttl: float) -> bool:
+        now = time.time()
+        with self._tx() as cur:
+            row = cur.execute("SELECT expires FROM leases WHERE name=?", (name,)).fetchone()
+            if row and row[0] > now:
+                return False
+            cur.execute(
+                "INSERT INTO leases(name, expires) VALUES(?, ?) "
+                "ON CONFLICT(name) DO UPDATE SET expires = excluded.expires",
+                (name, now + ttl),
+            )
+            return True
+
+    def kv_get_all(self, ns: str) -> Dict[str, bytes]:
+        with self._lock:
+            return dict(self.conn.execute("SELECT key, value FROM kv WHERE ns=?", (ns,)))
+
+    def kv_get(self, ns: str, key: str) -> Optional[bytes]:
+        with self._lock:
+            row = self.conn.execute("SELECT value FROM kv WHERE ns=? AND key=?", (ns, key)).fetchone()
+        return row[0] if row else None
+
+    def kv_set(self, ns: str, key: str, value: bytes) -> None:
+        with self._lock:
+            self.conn.execute(
+                "INSERT INTO kv(ns, key, value) VALUES(?, ?, ?) "
+                "ON CONFLICT(ns, key) DO UPDATE SET value = excluded.value",
+                (ns, key, value),
+            )
+
+    def kv_delete(self, ns: str, key: str) -> None:
+        with self._lock:
+            self.conn.execute("DELETE FROM kv WHERE ns=? AND key=?", (ns, key))
+
+    def kv_delete_if(self, ns: str, key: str, check: Callable[[bytes], bool]) -> bool:
+        """
+        يحذف الصف فقط إن كانت قيمته الحالية (تُقرأ داخل نفس الـ transaction)
+        تحقق check. يرجع False إن غيّره worker آخر.
+        """
+        with self._tx() as cur:
+            row = cur.execute("SELECT value FROM kv WHERE ns=? AND key=?", (ns, key)).fetchone()
+            if row is None:
+                return True
+            if not check(row[0]):
+                return False
+            cur.execute("DELETE FROM kv WHERE ns=? AND key=?", (ns, key))
+            return True
+
+    def kv_sync(self) -> None:
+        pass
+
+    def persistence(self) -> Optional[BasePersistence]:
+        return BackendPersistence(self)
+
+    def close(self) -> None:
+        with self._draw_lock:
+            self.draw_conn.close()
+        with self._lock:
+            self.conn.close()
+
+
+class _Transaction:
+    """
+    BEGIN IMMEDIATE ... COMMIT مع قفل الخيط، لأن الاتصال مشترك بين
+    عدة خيوط (الحفظ الخلفي، asyncio.to_thread، event loop).
+    """
+
+    def __init__(self, conn: sqlite3.Connection, lock: threading.RLock):
+        self.conn = conn
+        self.lock = lock
+
+    def __enter__(self):
+        self.lock.acquire()
+        try:
+            self.cur = self.conn.cursor()
+            self.cur.execute("BEGIN IMMEDIATE")
+        except BaseException:
+            self.lock.release()
+            raise
+        return self.cur
+
+    def __exit__(self, exc_type, exc, tb):
+        try:
+            self.cur.execute("ROLLBACK" if exc_type else "COMMIT")
+        finally:
+            self.lock.release()
+        return False
+
+
+# =============================
+# PTB Persistence فوق SQLite
+# =============================
+class BackendPersistence(BasePersistence):
+    """
+    يحفظ chat_data و user_data و bot_data في kv الخاص بالـ backend
+    (chat_state.dumps لكل محادثة: pickle مضغوط).
+
+    PTB يرسل كل المحادثات التي وصلها تحديث، فلا يُكتب منها إلا ما تغيّر فعلاً
+    منذ آخر حفظ، والمحادثات الفارغة تُحذف بدل أن تُحفظ.
+
+    مع backend مشترك (SQLite) refresh_* يعيد قراءة بيانات المحادثة قبل كل تحديث،
+    فالـ worker الذي يستقبل التحديث يرى آخر ما كتبه أي worker آخر. لا تُستبدل
+    البيانات المحلية إلا إذا تغيّرت النسخة المحفوظة منذ آخر قراءة/كتابة من هذا
+    الـ worker (حتى لا تضيع تعديلات محلية لم تُحفظ بعد). وبنفس المنطق لا يُحذف
+    صف لأن نسخته المحلية فارغة إلا إن كان ما زال النسخة التي رآها هذا الـ worker.
+
+    استدعاءات backend المشترك تعمل في خيط (قد تنتظر قفل الكتابة عند worker آخر)،
+    أما dumps/loads وتعديل الـ dicts فتبقى على event loop.
+    """
+
+    def __init__(self, backend: StateBackend, update_interval: float = 1):
+        super().__init__(
+            store_data=PersistenceInput(bot_data=False, callback_data=False),
+            update_interval=update_interval,
+        )
+        self.backend = backend
+        self._seen: Dict[Tuple[str, int], int] = {}
+        self.writes = 0
+
+    async def _call(self, fn: Callable, *args):
+        if self.backend.shared:
+            return await asyncio.to_thread(fn, *args)
+        return fn(*args)
+
+    async def _load_ns(self, ns: str) -> dict:
+        out = {}
+        for key, blob in (await self._call(self.backend.kv_get_all, ns)).items():
+            try:
+                out[int(key)] = loads(blob)
+            except Exception:
+                continue
+            self._seen[(ns, int(key))] = hash(blob)
+        return out
+
+    async def _store(self, ns: str, key: int, data: dict) -> None:
+        if not data:
+            if (ns, key) in self._seen:
+                await self._drop(ns, key)
+            return
+        blob = dumps(data)
+        if self._seen.get((ns, key)) == hash(blob):
+            return
+        await self._call(self.backend.kv_set, ns, str(key), blob)
+        self._seen[(ns, key)] = hash(blob)
+        self.writes += 1
+
+    async def _drop(self, ns: str, key: int) -> None:
+        seen = self._seen.pop((ns, key), None)
+        if not self.backend.shared:
+            self.backend.kv_delete(ns, str(key))
+            return
+        # dict فارغ هنا قد يكون نسخة قديمة: لا نحذف إلا النسخة التي رآها هذا
+        # الـ worker، وليس لعبة بدأها worker آخر بعدها
+        if seen is not None:
+            await self._call(self.backend.kv_delete_if, ns, str(key), lambda blob: hash(blob) == seen)
+
+    async def _refresh(self, ns: str, key: int, data: dict) -> None:
+        if not self.backend.shared:
+            return
+        blob = await self._call(self.backend.kv_get, ns, str(key))
+        if blob is None or self._seen.get((ns, key)) == hash(blob):
+            return
+        self._seen[(ns, key)] = hash(blob)
+        try:
+            fresh = loads(blob)
+        except Exception:
+            return
+        data.clear()
+        data.update(fresh)
+
+    async def get_user_data(self):
+        return await self._load_ns("user_data")
+
+    async def get_chat_data(self):
+        return await self._load_ns("chat_data")
+
+    async def get_bot_data(self):
+        blob = await self._call(self.backend.kv_get, "bot_data", "0")
+        return loads(blob) if blob else {}
+
+    async def get_callback_data(self):
+        return None
+
+    async def get_conversations(self, name):
+        return {}
+
+    async def update_conversation(self, name, key, new_state) -> None:
+        pass
+
+    async def update_user_data(self, user_id, data) -> None:
+        await self._store("user_data", user_id, data)
+
+    async def update_chat_data(self, chat_id, data) -> None:
+        await self._store("chat_data", chat_id, data)
+
+    async def update_bot_data(self, data) -> None:
+        await self._store("bot_data", 0, data)
+
+    async def update_callback_data(self, data) -> None:
+        pass
+
+    async def drop_chat_data(self, chat_id) -> None:
+        await self._drop("chat_data", chat_id)
+
+    async def drop_user_data(self, user_id) -> None:
+        await self._drop("user_data", user_id)
+
+    async def refresh_user_data(self, user_id, user_data) -> None:
+        await self._refresh("user_data", user_id, user_data)
+
+    async def refresh_chat_data(self, chat_id, chat_data) -> None:
+        await self._refresh("chat_data", chat_id, chat_data)
+
+    async def refresh_bot_data(self, bot_data) -> None:
+        pass
+
+    async def flush(self) -> None:
+        await self._call(self.backend.kv_sync)
+
+
+def create_backend(
+    kind: str,
+    stats_file: str,
+    journal_file: str,
+    journal_max_bytes: int,
+    db_path: str,
+    cardinality: str = EXACT,
+    busy_timeout: float = 2.0,
+) -> StateBackend:
+    files = FileStateBackend(stats_file, journal_file, journal_max_bytes, cardinality=cardinality)
+    if kind == "sqlite":
+        return SQLiteStateBackend(
+            db_path,
+            migrate_from=files,
+            cardinality=cardinality,
+            busy_timeout=busy_timeout,
+        )
+    return files
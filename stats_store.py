@@ -0,0 +1,414 @@
+# ============================================
+# Stats Store - حفظ الإحصائيات في الخلفية (write-behind) + سجل إضافات
+# ============================================
+
+from typing import Callable, NamedTuple, Optional
+import hashlib
+import json
+import os
+import tempfile
+import threading
+import time
+
+from cardinality import EXACT, ActiveUsers, load_unique, new_unique
+from timeseries import ActivitySeries
+
+
+def atomic_write_json(path: str, data) -> None:
+    """
+    يكتب JSON في ملف مؤقت بجانب الملف الأصلي ثم يستبدله بعملية rename واحدة،
+    فلا يرى القارئ أبداً ملفاً نصف مكتوب حتى لو توقفت العملية أثناء الكتابة.
+    """
+    directory = os.path.dirname(os.path.abspath(path))
+    fd, tmp_path = tempfile.mkstemp(prefix=".stats-", suffix=".tmp", dir=directory)
+    try:
+        with os.fdopen(fd, "w", encoding="utf-8") as f:
+            json.dump(data, f, ensure_ascii=False, separators=(",", ":"))
+            f.flush()
+            os.fsync(f.fileno())
+        os.replace(tmp_path, path)
+    except BaseException:
+        try:
+            os.unlink(tmp_path)
+        except OSError:
+            pass
+        raise
+
+
+class WriteBehindSaver:
+    """
+    يجمع التحديثات في الذاكرة ويكتبها على القرص في خيط خلفي:
+    - كل flush_interval ثانية إذا وُجدت تغييرات، أو
+    - فوراً عند الوصول إلى max_dirty تحديث غير محفوظ.
+
+    أقصى ما يمكن فقدانه عند انهيار مفاجئ هو ما تراكم خلال flush_interval ثانية
+    أو max_dirty تحديث، أيهما أقل.
+
+    snapshot_fn تُستدعى والقفل `lock` مأخوذ، لذا يجب أن تكتفي بنسخ البيانات بسرعة؛
+    أما الترميز والكتابة فيتمان خارج القفل عبر write_fn.
+    """
+
+    def __init__(
+        self,
+        snapshot_fn: Callable[[], object],
+        write_fn: Callable[[object], None],
+        flush_interval: float = 5.0,
+        max_dirty: int = 500,
+        lock: Optional[threading.Lock] = None,
+    ):
+        self.snapshot_fn = snapshot_fn
+        self.write_fn = write_fn
+        self.flush_interval = flush_interval
+        self.max_dirty = max_dirty
+        self.lock = lock or threading.Lock()
+
+        self._dirty = 0
+        # يحمي _dirty وحده (mark_dirty من خيط الـ handlers و flush من الخيط الخلفي)،
+        # ولا يُنتظر عليه أثناء snapshot_fn أو الكتابة
+        self._dirty_lock = threading.Lock()
+        self._wakeup = threading.Event()
+        self._stopped = threading.Event()
+        self._flush_lock = threading.Lock()
+        self._thread: Optional[threading.Thread] = None
+        self.last_flush = 0.0
+        self.flush_count = 0
+        self.last_error: Optional[Exception] = None
+
+    @property
+    def dirty(self) -> int:
+        return self._dirty
+
+    def mark_dirty(self, n: int = 1) -> None:
+        """
+        تُستدعى بعد كل تعديل على البيانات. كلفتها O(1) ولا تلمس القرص.
+        """
+        with self._dirty_lock:
+            self._dirty += n
+            full = self._dirty >= self.max_dirty
+        if full:
+            self._wakeup.set()
+
+    def flush(self) -> bool:
+        """
+        يحفظ البيانات الآن إذا كان هناك تغييرات. يرجع True إذا تمت الكتابة.
+        """
+        with self._flush_lock:
+            with self.lock:
+                with self._dirty_lock:
+                    pending = self._dirty
+                    self._dirty = 0
+                if not pending:
+                    return False
+                data = self.snapshot_fn()
+            try:
+                self.write_fn(data)
+            except Exception as e:
+                # نعيد العدّاد حتى تُعاد المحاولة في الدورة القادمة
+                with self._dirty_lock:
+                    self._dirty += pending
+                self.last_error = e
+                return False
+            self.last_flush = time.time()
+            self.flush_count += 1
+            self.last_error = None
+            return True
+
+    def _run(self) -> None:
+        while not self._stopped.is_set():
+            self._wakeup.wait(self.flush_interval)
+            self._wakeup.clear()
+            self.flush()
+
+    def start(self) -> None:
+        if self._thread and self._thread.is_alive():
+            return
+        self._stopped.clear()
+        self._thread = threading.Thread(
+            target=self._run, name="stats-write-behind", daemon=True
+        )
+        self._thread.start()
+
+    def stop(self) -> None:
+        """
+        يوقف الخيط الخلفي ويكتب آخر التغييرات (يُستدعى عند الإغلاق).
+        """
+        self._stopped.set()
+        self._wakeup.set()
+        if self._thread and self._thread is not threading.current_thread():
+            self._thread.join(timeout=self.flush_interval + 5)
+        self._thread = None
+        self.flush()
+
+
+# =============================
+# لقطة جاهزة للداشبورد
+# =============================
+class Snapshot(NamedTuple):
+    data: dict
+    body: bytes  # JSON جاهز للإرسال
+    etag: str
+    built_at: float
+
+
+class SnapshotCache:
+    """
+    يبني اللقطة (build_fn) مرة كل max_age ثانية على الأكثر، مهما كان عدد الطلبات.
+
+    اللقطة لا تتغير بعد بنائها وتُستبدل كاملة، فالقراءة بدون قفل. لو كان
+    خيط آخر يبني لقطة جديدة الآن يُرجع اللقطة السابقة بدل الانتظار.
+    """
+
+    def __init__(self, build_fn: Callable[[], dict], max_age: float = 5.0):
+        self.build_fn = build_fn
+        self.max_age = max_age
+        self._lock = threading.Lock()
+        self._snapshot: Optional[Snapshot] = None
+        self.builds = 0
+
+    def get(self) -> Snapshot:
+        snapshot = self._snapshot
+        if snapshot is not None and time.monotonic() - snapshot.built_at < self.max_age:
+            return snapshot
+        if not self._lock.acquire(blocking=snapshot is None):
+            return snapshot
+        try:
+            if self._snapshot is not snapshot:
+                return self._snapshot
+            data = self.build_fn()
+            body = json.dumps(data, ensure_ascii=False, separators=(",", ":")).encode("utf-8")
+            etag = '"%s"' % hashlib.blake2b(body, digest_size=8).hexdigest()
+            self._snapshot = Snapshot(data, body, etag, time.monotonic())
+            self.builds += 1
+            return self._snapshot
+        finally:
+            self._lock.release()
+
+
+# =============================
+# Append-only Journal
+# =============================
+class StatsDelta:
+    """
+    التغييرات التي حدثت منذ آخر حفظ فقط (وليس الإحصائيات كاملة).
+    """
+
+    __slots__ = ("messages", "users", "groups", "private_chats", "buckets", "active", "removed_groups")
+
+    def __init__(self):
+        self.messages = 0
+        self.users: list = []
+        self.groups: list = []
+        self.private_chats: list = []
+        self.buckets: dict = {}  # رقم الساعة -> عدد الرسائل
+        self.active: list = []  # (رقم اليوم، المستخدم) لعدّادات DAU/MAU
+        self.removed_groups: list = []
+
+    def __bool__(self) -> bool:
+        return bool(
+            self.messages or self.users or self.groups
+            or self.private_chats or self.buckets or self.active or self.removed_groups
+        )
+
+    def remove_group(self, chat_id: int) -> None:
+        """
+        جروب ميت (البوت مطرود منه). لو أُضيف في نفس الدفعة نلغي الإضافة،
+        لأن الحذف يُكتب قبل الإضافات.
+        """
+        if chat_id in self.groups:
+            self.groups.remove(chat_id)
+        self.removed_groups.append(chat_id)
+
+    def merge(self, other: "StatsDelta") -> None:
+        self.messages += other.messages
+        self.users.extend(other.users)
+        for chat_id in other.removed_groups:
+            self.remove_group(chat_id)
+        self.groups.extend(other.groups)
+        self.private_chats.extend(other.private_chats)
+        for key, n in other.buckets.items():
+            self.buckets[key] = self.buckets.get(key, 0) + n
+        self.active.extend(other.active)
+
+    def to_records(self) -> str:
+        """
+        سطر لكل تغيير، مفصول بـ tab:
+        m <عدد>   |  u <id>  |  g <id>  |  p <id>  |  b <الساعة> <عدد>  |  a <اليوم> <id>
+        xg <id> (حذف جروب) تُكتب أولاً حتى لا تلغي إضافة جاءت بعدها.
+        """
+        out = [f"xg\t{i}\n" for i in self.removed_groups]
+        if self.messages:
+            out.append(f"m\t{self.messages}\n")
+        out.extend(f"u\t{i}\n" for i in self.users)
+        out.extend(f"g\t{i}\n" for i in self.groups)
+        out.extend(f"p\t{i}\n" for i in self.private_chats)
+        out.extend(f"b\t{k}\t{n}\n" for k, n in self.buckets.items())
+        out.extend(f"a\t{day}\t{i}\n" for day, i in self.active)
+        return "".join(out)
+
+
+def empty_stats(cardinality: str = EXACT) -> dict:
+    return {
+        "total_messages": 0,
+        "unique_users": new_unique(cardinality, "users"),
+        "unique_groups": new_unique(cardinality, "groups"),
+        "unique_private_chats": new_unique(cardinality, "private_chats"),
+        "activity": ActivitySeries(),
+        "active_users": ActiveUsers(),
+    }
+
+
+class StatsJournal:
+    """
+    الإحصائيات = لقطة كاملة (stats.json) + سجل إضافات (stats.journal).
+
+    كل حفظ يضيف أسطر التغييرات فقط إلى آخر السجل (O(التغييرات) وليس O(كل المستخدمين)).
+    عندما يتجاوز السجل max_bytes تُدمج البيانات في لقطة جديدة ويُفرَّغ السجل.
+
+    أول سطر في السجل هو رقم الجيل (#gen). اللقطة تحفظ رقم الجيل الذي يليها،
+    فلو انقطع التشغيل بين كتابة اللقطة وتفريغ السجل، يُتجاهل السجل القديم
+    عند التحميل ولا تُحسب العدادات مرتين.
+    """
+
+    def __init__(
+        self,
+        snapshot_path: str,
+        journal_path: str,
+        max_bytes: int = 4 * 1024 * 1024,
+        cardinality: str = EXACT,
+    ):
+        self.snapshot_path = snapshot_path
+        self.journal_path = journal_path
+        self.max_bytes = max_bytes
+        self.cardinality = cardinality
+        self.generation = 0
+        self.size = 0
+        self._pending = StatsDelta()
+
+    # ---------- تحميل ----------
+    def load(self) -> dict:
+        """
+        يقرأ اللقطة ثم يعيد تطبيق السجل عليها. يرجع dict بصيغة empty_stats().
+        """
+        state = empty_stats(self.cardinality)
+        snapshot_gen = 0
+
+        if os.path.exists(self.snapshot_path):
+            try:
+                with open(self.snapshot_path, "r", encoding="utf-8") as f:
+                    data = json.load(f)
+                state["total_messages"] = data.get("total_messages", 0)
+                for field in ("unique_users", "unique_groups", "unique_private_chats"):
+                    load_unique(state[field], data.get(field, []))
+                if "activity" in data:
+                    state["activity"] = ActivitySeries.from_dict(data["activity"])
+                else:
+                    # الصيغة القديمة: dict بكل الساعات منذ أول تشغيل
+                    state["activity"] = ActivitySeries.from_buckets(data.get("activity_buckets", {}))
+                state["active_users"].load_dict(data.get("active_users", {}))
+                snapshot_gen = data.get("journal_gen", 0)
+            except Exception:
+                pass
+
+        self.generation = snapshot_gen
+        self.size = 0
+        if os.path.exists(self.journal_path):
+            journal_gen = self._replay(state, snapshot_gen)
+            if journal_gen == snapshot_gen:
+                self.size = os.path.getsize(self.journal_path)
+            else:
+                # سجل من جيل قديم (سبق دمجه في اللقطة)
+                self._reset_journal()
+        return state
+
+    def _replay(self, state: dict, snapshot_gen: int) -> int:
+        users, privates = [], []
+        # الجروبات تُطبّق بالترتيب مباشرة لأن فيها حذف (xg) وليس إضافة فقط
+        groups = state["unique_groups"]
+        activity = state["activity"]
+        active_users = state["active_users"]
+        messages = 0
+        journal_gen = 0
+
+        with open(self.journal_path, "r", encoding="utf-8") as f:
+            first = f.readline()
+            if first.startswith("#gen\t"):
+                try:
+                    journal_gen = int(first[5:])
+                except ValueError:
+                    journal_gen = -1
+            else:
+                f.seek(0)
+            if journal_gen != snapshot_gen:
+                return journal_gen
+
+            for line in f:
+                parts = line.rstrip("\n").split("\t")
+                tag = parts[0]
+                try:
+                    if tag == "u":
+                        users.append(int(parts[1]))
+                    elif tag == "g":
+                        groups.add(int(parts[1]))
+                    elif tag == "xg":
+                        groups.discard(int(parts[1]))
+                    elif tag == "p":
+                        privates.append(int(parts[1]))
+                    elif tag == "m":
+                        messages += int(parts[1])
+                    elif tag == "b":
+                        activity.add_bucket(parts[1], int(parts[2]))
+                    elif tag == "a":
+                        active_users.add_new(int(parts[1]), int(parts[2]))
+                except (IndexError, ValueError):
+                    # سطر ناقص (انقطاع أثناء الكتابة) يُتجاهل
+                    continue
+
+        state["total_messages"] += messages
+        state["unique_users"].update(users)
+        state["unique_private_chats"].update(privates)
+        return journal_gen
+
+    # ---------- كتابة ----------
+    def needs_compaction(self) -> bool:
+        return self.size >= self.max_bytes
+
+    def append(self, delta: StatsDelta) -> None:
+        """
+        يضيف التغييرات إلى آخر السجل. لو فشلت الكتابة تبقى التغييرات معلّقة
+        وتُضاف مع الحفظ القادم.
+        """
+        self._pending.merge(delta)
+        if not self._pending:
+            return
+        payload = self._pending.to_records().encode("utf-8")
+        new_file = not os.path.exists(self.journal_path)
+        with open(self.journal_path, "ab") as f:
+            if new_file:
+                header = f"#gen\t{self.generation}\n".encode("utf-8")
+                f.write(header)
+                self.size = len(header)
+            f.write(payload)
+            f.flush()
+            os.fsync(f.fileno())
+        self.size += len(payload)
+        self._pending = StatsDelta()
+
+    def compact(self, snapshot: dict) -> None:
+        """
+        يكتب لقطة كاملة (تشمل كل ما في السجل) ثم يبدأ سجلاً جديداً فارغاً.
+        """
+        data = dict(snapshot)
+        data["journal_gen"] = self.generation + 1
+        atomic_write_json(self.snapshot_path, data)
+        self.generation += 1
+        self._pending = StatsDelta()
+        self._reset_journal()
+
+    def _reset_journal(self) -> None:
+        header = f"#gen\t{self.generation}\n"
+        directory = os.path.dirname(os.path.abspath(self.journal_path))
+        fd, tmp_path = tempfile.mkstemp(prefix=".journal-", suffix=".tmp", dir=directory)
+        with os.fdopen(fd, "w", encoding="utf-8") as f:
+            f.write(header)
+        os.replace(tmp_path, self.journal_path)
+        self.size = len(header.encode("utf-8"))
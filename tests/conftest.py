@@ -0,0 +1,5 @@
+# الاختبارات تستورد وحدات المشروع مباشرة (بدون main.py وتوكن البوت)
+import os
+import sys
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
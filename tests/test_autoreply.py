@@ -0,0 +1,113 @@
+import random
+
+import pytest
+
+from autoreply import CONTAINS, EXACT, KIND_PRIORITY, PREFIX, AutoReplyEngine, Rule, load_rules, parse_line
+from normalize import normalize_text
+
+
+def rules_from(lines):
+    rules = []
+    for line_no, line in enumerate(lines):
+        key, reply, kind = parse_line(line)
+        rules.append(Rule(key, reply, kind, (KIND_PRIORITY[kind], len(key), line_no)))
+    return rules
+
+
+@pytest.mark.parametrize("line, expected", [
+    ("hi|hello", ("hi", "hello", EXACT)),
+    ("hi = hello", ("hi", "hello", EXACT)),
+    ("good*|morning", ("good", "morning", PREFIX)),
+    ("*thanks*|welcome", ("thanks", "welcome", CONTAINS)),
+    ("a=b|c", ("a", "b|c", EXACT)),
+    ("*|x", ("*", "x", EXACT)),
+    ("# comment|x", None),
+    ("hi|", None),
+    ("no separator", None),
+])
+def test_parse_line(line, expected):
+    assert parse_line(line) == expected
+
+
+def test_exact_rules_go_to_the_router_table():
+    engine = AutoReplyEngine(rules_from(["hi|hello", "*hi*|contains"]))
+    assert engine.exact == {"hi": "hello"}
+    assert len(engine) == 2
+
+
+def test_prefix_beats_a_longer_contains():
+    engine = AutoReplyEngine(rules_from(["*good morning all*|contains", "good*|prefix"]))
+    assert engine.match("good morning all") == "prefix"
+
+
+def test_prefix_only_matches_at_the_start():
+    engine = AutoReplyEngine(rules_from(["good*|prefix"]))
+    assert engine.match("goodbye") == "prefix"
+    assert engine.match("very good") is None
+
+
+def test_contains_needs_word_boundaries():
+    engine = AutoReplyEngine(rules_from(["*hi*|hey"]))
+    assert engine.match("oh hi there") == "hey"
+    assert engine.match("hi") == "hey"
+    assert engine.match("this thing") is None
+
+
+def test_longer_contains_wins_then_later_line():
+    engine = AutoReplyEngine(rules_from(["*cat*|short", "*big cat*|long", "*dog*|first", "*dog*|second"]))
+    assert engine.match("a big cat") == "long"
+    assert engine.match("my dog") == "second"
+
+
+def test_overlapping_keys_found_through_fail_links():
+    engine = AutoReplyEngine(rules_from(["*she*|she", "*he*|he", "*hers*|hers", "*his*|his"]))
+    assert engine.match("ushers") is None
+    assert engine.match("us he rs") == "he"
+    assert engine.match("ok hers") == "hers"
+    assert engine.match("shis his") == "his"
+    # "a b" على طريق "a bc" وليس مفتاحاً: "b" تُوجد عبر fail link
+    engine = AutoReplyEngine(rules_from(["*a bc*|long", "*b*|b"]))
+    assert engine.match("a b") == "b"
+
+
+def brute_force(rules, text):
+    best = None
+    for rule in rules:
+        if rule.kind == EXACT:
+            continue
+        n = len(rule.trigger)
+        for start in range(len(text) - n + 1):
+            if text[start:start + n] != rule.trigger:
+                continue
+            if rule.kind == PREFIX:
+                ok = start == 0
+            else:
+                end = start + n
+                ok = (start == 0 or not text[start - 1].isalnum()) and (end == len(text) or not text[end].isalnum())
+            if ok and (best is None or rule.rank > best.rank):
+                best = rule
+    return best.reply if best else None
+
+
+def test_matches_brute_force_on_random_input():
+    rng = random.Random(7)
+    alphabet = "ab "
+    for _ in range(300):
+        lines = []
+        for i in range(rng.randint(1, 8)):
+            key = "".join(rng.choice("ab ") for _ in range(rng.randint(1, 5))).strip() or "a"
+            lines.append(rng.choice([f"*{key}*", f"{key}*", key]) + f"|r{i}")
+        rules = rules_from(lines)
+        engine = AutoReplyEngine(rules)
+        for _ in range(20):
+            text = "".join(rng.choice(alphabet) for _ in range(rng.randint(0, 12)))
+            assert engine.match(text) == brute_force(rules, text), (lines, text)
+
+
+def test_load_rules_normalizes_keys(tmp_path):
+    path = tmp_path / "autoreplies.txt"
+    path.write_text("مرحبا|اهلين\n*شكرا*|العفو\n", encoding="utf-8")
+    engine = AutoReplyEngine(load_rules(str(path), normalize_text))
+    assert engine.exact == {normalize_text("مرحبا"): "اهلين"}
+    assert engine.match(normalize_text("شكرا لك")) == "العفو"
+    assert load_rules(str(tmp_path / "missing.txt"), normalize_text) == []
@@ -0,0 +1,132 @@
+import asyncio
+import json
+
+from telegram.error import BadRequest, Forbidden, NetworkError, TimedOut
+
+from broadcast import BroadcastEngine, BroadcastProgress, classify_error
+
+
+class FakeBot:
+    """
+    يسجّل الرسائل المُرسلة؛ المحادثات في block تنتظر للأبد (إرسال عالق)،
+    وفي fail ترجع خطأ شبكة.
+    """
+
+    def __init__(self, block=(), fail=(), timeout=()):
+        self.block = set(block)
+        self.fail = set(fail)
+        self.timeout = set(timeout)
+        self.attempts = []
+        self.sent = []
+        self.edits = []
+
+    async def send_message(self, chat_id, text):
+        self.attempts.append(chat_id)
+        if chat_id in self.timeout:
+            raise TimedOut()
+        if chat_id in self.block:
+            await asyncio.Event().wait()
+        if chat_id in self.fail:
+            raise NetworkError("connection reset")
+        self.sent.append(chat_id)
+
+    async def edit_message_text(self, chat_id, message_id, text):
+        self.edits.append(text)
+
+
+def make_engine(tmp_path, **kwargs) -> BroadcastEngine:
+    kwargs.setdefault("concurrency", 1)
+    return BroadcastEngine(
+        str(tmp_path / "broadcast_job.json"),
+        str(tmp_path / "broadcast_progress.json"),
+        global_rate=1000,
+        per_chat_rate=1000,
+        **kwargs,
+    )
+
+
+def test_stop_saves_progress_and_resume_finishes_the_rest(tmp_path):
+    chat_ids = [-i for i in range(1, 11)]
+
+    async def first_run():
+        engine = make_engine(tmp_path)
+        bot = FakeBot(block=[chat_ids[4]])
+        engine.start(bot, asyncio.create_task, "hi", chat_ids, status_chat_id=1, status_message_id=2)
+        while len(bot.sent) < 4:
+            await asyncio.sleep(0)
+        await asyncio.sleep(0.01)
+        await engine.stop()
+        return engine, bot
+
+    engine, bot = asyncio.run(first_run())
+    assert bot.sent == chat_ids[:4]
+    assert not engine.running
+    assert engine.pending_job()["chat_ids"] == chat_ids
+    with open(tmp_path / "broadcast_progress.json", encoding="utf-8") as f:
+        saved = BroadcastProgress.from_dict(json.load(f))
+    assert (saved.next_index, saved.sent) == (4, 4)
+
+    async def second_run():
+        engine = make_engine(tmp_path)
+        bot = FakeBot()
+        assert engine.resume(bot, asyncio.create_task)
+        await engine.task
+        return engine, bot
+
+    engine, bot = asyncio.run(second_run())
+    # العالق لم يُسجَّل كمُرسل، فيُعاد؛ ما أُرسل قبل الإيقاف لا يُعاد
+    assert bot.sent == chat_ids[4:]
+    assert engine.progress.sent == 10
+    assert engine.pending_job() is None
+    assert not (tmp_path / "broadcast_progress.json").exists()
+    assert bot.edits[-1].startswith("✅")
+
+
+def test_stop_keeps_retry_pass_items(tmp_path):
+    chat_ids = [-1, -2, -3]
+
+    async def run():
+        engine = make_engine(tmp_path, retry_delays=(3600,))
+        bot = FakeBot(fail=[-2])
+        engine.start(bot, asyncio.create_task, "hi", chat_ids, status_chat_id=1, status_message_id=2)
+        await asyncio.sleep(0.01)
+        await engine.stop()
+
+    asyncio.run(run())
+    with open(tmp_path / "broadcast_progress.json", encoding="utf-8") as f:
+        saved = json.load(f)
+    assert saved["next_index"] == 3
+    assert saved["retry"] == [1]
+
+
+def test_stop_without_a_running_job_is_a_no_op(tmp_path):
+    engine = make_engine(tmp_path)
+    asyncio.run(engine.stop())
+    assert engine.pending_job() is None
+
+
+def test_classify_error():
+    assert classify_error(Forbidden("bot was kicked")) == "forbidden"
+    assert classify_error(BadRequest("Chat not found")) == "chat_not_found"
+    assert classify_error(BadRequest("Not enough rights to send text messages")) == "no_rights"
+    assert classify_error(BadRequest("Message is too long")) == "bad_request"
+    assert classify_error(TimedOut()) == "timed_out"
+    assert classify_error(NetworkError("connection reset")) == "transient"
+    assert classify_error(ValueError()) == "other"
+
+
+def test_timed_out_send_is_not_retried(tmp_path):
+    chat_ids = [-1, -2, -3]
+
+    async def run():
+        engine = make_engine(tmp_path, retry_delays=(0, 0))
+        bot = FakeBot(timeout=[-2], fail=[-3])
+        engine.start(bot, asyncio.create_task, "hi", chat_ids, status_chat_id=1, status_message_id=2)
+        await engine.task
+        return engine, bot
+
+    engine, bot = asyncio.run(run())
+    # خطأ الشبكة يُعاد في كل جولة، أما انتهاء المهلة فمرة واحدة فقط
+    assert bot.attempts.count(-2) == 1
+    assert bot.attempts.count(-3) == 3
+    assert engine.progress.errors == {"timed_out": 1, "transient": 1}
@@ -0,0 +1,148 @@
+import json
+import math
+
+import pytest
+
+from cardinality import (
+    EXACT,
+    HLL,
+    UNIQUE_PRECISION,
+    ActiveUsers,
+    HyperLogLog,
+    IdSet,
+    IntSet,
+    dump_unique,
+    load_unique,
+    new_unique,
+)
+from stats_store import StatsDelta, StatsJournal
+
+
+def relative_error(sketch: HyperLogLog, true_count: int) -> float:
+    return abs(sketch.count() - true_count) / true_count
+
+
+@pytest.mark.parametrize("n", [10, 1000, 50_000, 300_000])
+def test_hll_error_is_within_bounds(n):
+    sketch = HyperLogLog()
+    # معرّفات متتالية (مثل معرّفات تيليجرام) وليست عشوائية
+    sketch.update(range(10_000_000, 10_000_000 + n))
+    standard_error = 1.04 / math.sqrt(1 << UNIQUE_PRECISION)
+    assert relative_error(sketch, n) <= 4 * standard_error
+
+
+def test_hll_small_counts_are_almost_exact():
+    sketch = HyperLogLog()
+    sketch.update(range(1, 101))
+    assert abs(sketch.count() - 100) <= 1
+    assert HyperLogLog().count() == 0
+
+
+def test_hll_add_new_reports_register_changes_only():
+    sketch = HyperLogLog()
+    assert sketch.add_new(42)
+    assert not sketch.add_new(42)
+
+
+def test_hll_merge_is_union():
+    a, b, both = HyperLogLog(), HyperLogLog(), HyperLogLog()
+    a.update(range(0, 30_000))
+    b.update(range(20_000, 50_000))
+    both.update(range(0, 50_000))
+    a.merge(b)
+    assert a.registers == both.registers
+    with pytest.raises(ValueError):
+        a.merge(HyperLogLog(10))
+
+
+def test_hll_bytes_and_text_round_trip():
+    sketch = HyperLogLog()
+    sketch.update(range(5000))
+    assert HyperLogLog.from_bytes(sketch.to_bytes()).registers == sketch.registers
+    assert HyperLogLog.from_text(sketch.to_text()).registers == sketch.registers
+    with pytest.raises(ValueError):
+        HyperLogLog.from_bytes(sketch.to_bytes()[:1] + HyperLogLog(10).to_bytes()[1:])
+
+
+def test_intset_behaves_like_a_set():
+    ids = IntSet([5, -3, 5, 9])
+    assert list(ids) == [-3, 5, 9]
+    assert ids.add_new(0)
+    assert not ids.add_new(5)
+    ids.discard(9)
+    ids.discard(100)
+    ids.update([7, -3])
+    assert list(ids) == [-3, 0, 5, 7]
+    assert len(ids) == 4 and 7 in ids and 9 not in ids
+
+
+@pytest.mark.parametrize("mode, kind, expected", [
+    (EXACT, "users", IdSet),
+    (EXACT, "groups", IdSet),
+    (HLL, "users", HyperLogLog),
+    (HLL, "private_chats", HyperLogLog),
+    (HLL, "groups", IntSet),
+])
+def test_new_unique_types(mode, kind, expected):
+    assert type(new_unique(mode, kind)) is expected
+
+
+@pytest.mark.parametrize("mode", [EXACT, HLL])
+@pytest.mark.parametrize("kind", ["users", "groups"])
+def test_dump_load_round_trip_through_json(mode, kind):
+    original = new_unique(mode, kind)
+    for i in range(2000):
+        original.add_new(i * 7919)
+    restored = new_unique(mode, kind)
+    load_unique(restored, json.loads(json.dumps(dump_unique(original))))
+    assert len(restored) == len(original)
+    if not isinstance(original, HyperLogLog):
+        assert sorted(restored) == sorted(original)
+
+
+def test_exact_ids_load_into_a_sketch_but_not_back():
+    exact = new_unique(EXACT, "users")
+    exact.update(range(1000))
+    sketch = new_unique(HLL, "users")
+    load_unique(sketch, dump_unique(exact))
+    assert abs(sketch.count() - 1000) <= 10
+
+    # sketch -> exact غير ممكن: يبدأ العدّ من الصفر بدل أرقام خاطئة
+    back = new_unique(EXACT, "users")
+    load_unique(back, dump_unique(sketch))
+    assert len(back) == 0
+
+
+def test_active_users_dau_mau_and_window():
+    active = ActiveUsers(days=3)
+    for day, users in ((100, range(0, 50)), (101, range(25, 75)), (102, range(50, 60))):
+        for user_id in users:
+            active.add_new(day, user_id)
+    # 4096 register لكل يوم: الأعداد الصغيرة تقريباً دقيقة (linear counting)
+    assert abs(active.dau(101) - 50) <= 1
+    assert abs(active.mau(102) - 75) <= 1
+    # يوم بدون نشاط بعد: النافذة 101..103 فقط
+    assert abs(active.mau(103) - 50) <= 1
+
+    active.add_new(103, 1)  # اليوم 100 خرج من النافذة
+    assert 100 not in active.sketches
+    assert not active.add_new(100, 999)
+    assert abs(active.mau(103) - 51) <= 1
+
+    restored = ActiveUsers(days=3)
+    restored.load_dict(json.loads(json.dumps(active.to_dict())))
+    assert restored.to_dict() == active.to_dict()
+
+
+def test_hll_journal_replay_matches_the_live_sketch(tmp_path):
+    journal = StatsJournal(str(tmp_path / "stats.json"), str(tmp_path / "stats.journal"), cardinality=HLL)
+    live = journal.load()
+    for batch in range(5):
+        d = StatsDelta()
+        for user_id in range(batch * 1000, batch * 1000 + 1500):
+            if live["unique_users"].add_new(user_id):
+                d.users.append(user_id)
+        journal.append(d)
+
+    replayed = StatsJournal(str(tmp_path / "stats.json"), str(tmp_path / "stats.journal"), cardinality=HLL).load()
+    assert replayed["unique_users"].registers == live["unique_users"].registers
@@ -0,0 +1,76 @@
+import os
+import pickle
+
+from chat_state import COMPRESS_MIN_BYTES, KVLog, dumps, loads
+
+
+def test_dumps_compresses_only_large_data():
+    small = {"game": "td"}
+    large = {"players": list(range(COMPRESS_MIN_BYTES))}
+    assert dumps(small) == pickle.dumps(small, protocol=pickle.HIGHEST_PROTOCOL)
+    assert len(dumps(large)) < len(pickle.dumps(large, protocol=pickle.HIGHEST_PROTOCOL))
+    assert loads(dumps(small)) == small
+    assert loads(dumps(large)) == large
+
+
+def test_loads_reads_plain_pickles():
+    assert loads(pickle.dumps({"old": True})) == {"old": True}
+
+
+def test_log_replays_sets_and_deletes(tmp_path):
+    path = str(tmp_path / "chat_state.log")
+    log = KVLog(path)
+    log.kv_set("chat_data", "-1", b"one")
+    log.kv_set("chat_data", "-2", b"two")
+    log.kv_set("user_data", "-1", b"user")
+    log.kv_set("chat_data", "-1", b"one again")
+    log.kv_delete("chat_data", "-2")
+    log.close()
+
+    log = KVLog(path)
+    assert log.kv_get_all("chat_data") == {"-1": b"one again"}
+    assert log.kv_get("user_data", "-1") == b"user"
+    assert log.kv_get("chat_data", "-2") is None
+    log.close()
+
+
+def test_unchanged_values_and_missing_deletes_are_not_appended(tmp_path):
+    log = KVLog(str(tmp_path / "chat_state.log"))
+    log.kv_set("chat_data", "1", b"x")
+    size = log.size
+    log.kv_set("chat_data", "1", b"x")
+    log.kv_delete("chat_data", "2")
+    assert log.size == size
+    log.close()
+
+
+def test_truncated_tail_is_dropped(tmp_path):
+    path = str(tmp_path / "chat_state.log")
+    log = KVLog(path)
+    log.kv_set("chat_data", "1", b"kept")
+    log.close()
+    with open(path, "ab") as f:
+        f.write(b"\x00\x02")  # سجل ناقص (انقطاع أثناء الكتابة)
+
+    log = KVLog(path)
+    assert log.kv_get_all("chat_data") == {"1": b"kept"}
+    log.kv_set("chat_data", "2", b"after")
+    log.close()
+    assert KVLog(path).kv_get_all("chat_data") == {"1": b"kept", "2": b"after"}
+
+
+def test_compaction_keeps_live_data_only(tmp_path):
+    path = str(tmp_path / "chat_state.log")
+    log = KVLog(path, compact_min_bytes=0)
+    for n in range(50):
+        log.kv_set("chat_data", "1", b"v%d" % n)
+    log.kv_set("chat_data", "2", b"other")
+    assert log.size <= 2 * log.live_bytes
+    log.close()
+
+    log = KVLog(path)
+    assert log.kv_get_all("chat_data") == {"1": b"v49", "2": b"other"}
+    log.compact()
+    assert log.size == log.live_bytes == os.path.getsize(path)
+    log.close()
+    assert KVLog(path).kv_get_all("chat_data") == {"1": b"v49", "2": b"other"}
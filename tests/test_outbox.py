@@ -0,0 +1,208 @@
+import asyncio
+
+import pytest
+from telegram.error import RetryAfter
+
+from outbox import BACKGROUND, INTERACTIVE, Outbox
+
+
+def run(coro):
+    return asyncio.run(coro)
+
+
+def test_messages_to_one_chat_keep_their_order():
+    async def scenario():
+        outbox = Outbox(rate=1000, workers=4)
+        sent = []
+
+        def send(chat_id, n):
+            async def coro():
+                # أول رسالة أبطأ: لو أرسل عامل آخر الرسالة التالية بالتوازي لاختلف الترتيب
+                await asyncio.sleep(0.02 if n == 0 else 0)
+                sent.append((chat_id, n))
+                return n
+            return coro
+
+        futures = [outbox.submit(chat_id, send(chat_id, n)) for n in range(5) for chat_id in (1, 2)]
+        results = await asyncio.gather(*futures)
+        await outbox.stop()
+        return sent, results
+
+    sent, results = run(scenario())
+    for chat_id in (1, 2):
+        assert [n for c, n in sent if c == chat_id] == list(range(5))
+    assert results == [n for n in range(5) for _ in (1, 2)]
+
+
+def test_interactive_lane_goes_before_background():
+    async def scenario():
+        outbox = Outbox(rate=1000, workers=1)
+        sent = []
+
+        def send(name):
+            async def coro():
+                sent.append(name)
+            return coro
+
+        # العامل الوحيد لم يبدأ بعد: كل الرسائل جاهزة في نفس الوقت
+        futures = [outbox.submit(chat_id, send(f"bg{chat_id}"), BACKGROUND) for chat_id in (1, 2)]
+        futures.append(outbox.submit(3, send("reply"), INTERACTIVE))
+        await asyncio.gather(*futures)
+        await outbox.stop()
+        return sent
+
+    assert run(scenario())[0] == "reply"
+
+
+def test_retry_after_requeues_the_same_message_first():
+    async def scenario():
+        outbox = Outbox(rate=1000, workers=2)
+        sent = []
+        attempts = {"first": 0}
+
+        async def first():
+            attempts["first"] += 1
+            if attempts["first"] == 1:
+                raise RetryAfter(0)
+            sent.append("first")
+            return "ok"
+
+        async def second():
+            sent.append("second")
+
+        futures = [outbox.submit(1, first), outbox.submit(1, second)]
+        result = await futures[0]
+        await futures[1]
+        stats = (outbox.sent, outbox.retried, outbox.failed)
+        await outbox.stop()
+        return sent, result, stats
+
+    sent, result, stats = run(scenario())
+    assert sent == ["first", "second"]
+    assert result == "ok"
+    assert stats == (2, 1, 0)
+
+
+def test_retry_after_gives_up_after_max_attempts():
+    async def scenario():
+        outbox = Outbox(rate=1000, max_attempts=2)
+
+        async def flood():
+            raise RetryAfter(0)
+
+        future = outbox.submit(1, flood)
+        with pytest.raises(RetryAfter):
+            await future
+        await outbox.stop()
+        return outbox.retried, outbox.failed
+
+    assert run(scenario()) == (1, 1)
+
+
+def test_futures_pending_at_stop_are_cancelled():
+    async def scenario():
+        outbox = Outbox(rate=1000, workers=1)
+        started = asyncio.Event()
+
+        async def slow():
+            started.set()
+            await asyncio.sleep(3600)
+
+        async def deferred():
+            raise RetryAfter(3600)
+
+        async def quick():
+            return "never"
+
+        in_flight = outbox.submit(1, slow)
+        queued = outbox.submit(1, quick)
+        waiting = outbox.submit(2, deferred)  # بعد RetryAfter تنتظر المحادثة ساعة
+        await started.wait()
+        await asyncio.sleep(0)
+        await asyncio.wait_for(outbox.stop(), 1)
+
+        futures = (in_flight, queued, waiting)
+        await asyncio.wait_for(asyncio.gather(*futures, return_exceptions=True), 1)
+        return [f.cancelled() for f in futures], outbox.pending
+
+    cancelled, pending = run(scenario())
+    assert cancelled == [True, True, True]
+    assert pending == 0
+
+
+def test_submit_after_stop_starts_again():
+    async def scenario():
+        outbox = Outbox(rate=1000, workers=1)
+
+        async def send():
+            return "sent"
+
+        assert await outbox.submit(1, send) == "sent"
+        await outbox.stop()
+        result = await asyncio.wait_for(outbox.submit(1, send), 1)
+        await outbox.stop()
+        return result
+
+    assert run(scenario()) == "sent"
+
+
+def test_keyed_messages_coalesce_and_skip_the_chat_queue():
+    async def scenario():
+        outbox = Outbox(rate=1000, workers=2)
+        release = asyncio.Event()
+        sent = []
+
+        async def blocked():
+            await release.wait()
+            sent.append("reply")
+
+        def edit(n):
+            async def coro():
+                sent.append(f"edit{n}")
+                return n
+            return coro
+
+        reply = outbox.submit(-1, blocked)
+        # التعديلات لا تنتظر الرد العالق في طابور المحادثة، والأحدث يحل محل القديم
+        futures = [outbox.submit(-1, edit(n), BACKGROUND, key="join") for n in range(3)]
+        results = await asyncio.wait_for(asyncio.gather(*futures), 1)
+        release.set()
+        await reply
+        await outbox.stop()
+        return sent, results, futures
+
+    sent, results, futures = run(scenario())
+    assert sent == ["edit2", "reply"]
+    assert results == [2, 2, 2]
+    assert futures[0] is futures[2]
+
+
+def test_keyed_message_being_sent_is_not_replaced():
+    async def scenario():
+        outbox = Outbox(rate=1000, workers=2)
+        started = asyncio.Event()
+        release = asyncio.Event()
+        sent = []
+
+        async def first():
+            started.set()
+            await release.wait()
+            sent.append("first")
+
+        def later(name):
+            async def coro():
+                sent.append(name)
+            return coro
+
+        in_flight = outbox.submit(1, first, key="join")
+        await started.wait()
+        queued = [outbox.submit(1, later(name), key="join") for name in ("second", "third")]
+        release.set()
+        await asyncio.gather(in_flight, *queued)
+        await outbox.stop()
+        return sent, in_flight is queued[0], queued[0] is queued[1]
+
+    sent, same_as_in_flight, coalesced = run(scenario())
+    assert sent == ["first", "third"]
+    assert not same_as_in_flight
+    assert coalesced
@@ -0,0 +1,58 @@
+import os
+
+from question_bank import (
+    KIND_LIST,
+    KIND_PAIRS,
+    build_banks,
+    index_mapping,
+    open_banks,
+    refresh_banks,
+)
+
+SOURCES = {
+    "kt": ("questions.txt", KIND_LIST),
+    "general": ("general.txt", KIND_PAIRS),
+    "empty": ("missing.txt", KIND_LIST),
+}
+
+
+def write(tmp_path, name, text):
+    path = tmp_path / name
+    path.write_text(text, encoding="utf-8")
+    return path
+
+
+def test_banks_match_the_text_files(tmp_path):
+    write(tmp_path, "questions.txt", "سؤال أول\n\n  سؤال ثاني  \n")
+    write(tmp_path, "general.txt", "عاصمة مصر؟|القاهرة\nسطر بدون جواب\n2+2؟|4|أربعة\n")
+    counts = build_banks(SOURCES, "banks.bin", str(tmp_path))
+    assert counts == {"kt": 2, "general": 2, "empty": 0}
+
+    banks = open_banks(SOURCES, "banks.bin", str(tmp_path))
+    assert list(banks["kt"]) == ["سؤال أول", "سؤال ثاني"]
+    assert banks["kt"][-1] == "سؤال ثاني"
+    assert list(banks["general"]) == [("عاصمة مصر؟", "القاهرة"), ("2+2؟", "4|أربعة")]
+    assert banks["general"].questions()[1] == "2+2؟"
+    assert not banks["empty"]
+
+
+def test_refresh_rebuilds_only_when_a_source_changes(tmp_path):
+    source = write(tmp_path, "questions.txt", "أ\n")
+    write(tmp_path, "general.txt", "")
+    assert refresh_banks(SOURCES, "banks.bin", str(tmp_path))
+    assert not refresh_banks(SOURCES, "banks.bin", str(tmp_path))
+
+    source.write_text("أ\nب\n", encoding="utf-8")
+    stat = os.stat(source)
+    os.utime(source, ns=(stat.st_atime_ns, stat.st_mtime_ns + 1))
+    # بدون refresh يُفتح الملف القديم كما هو
+    assert len(open_banks(SOURCES, "banks.bin", str(tmp_path), refresh=False)["kt"]) == 1
+    assert refresh_banks(SOURCES, "banks.bin", str(tmp_path))
+    assert len(open_banks(SOURCES, "banks.bin", str(tmp_path), refresh=False)["kt"]) == 2
+
+
+def test_index_mapping_follows_questions_by_text():
+    assert index_mapping(["a", "b"], ["a", "b"]) is None
+    assert index_mapping(["a", "b", "c"], ["c", "a"]) == [1, None, 0]
+    # المكررات تُطابق بالترتيب
+    assert index_mapping(["x", "x", "y"], ["y", "x", "x"]) == [1, 2, 0]
@@ -0,0 +1,149 @@
+import pytest
+
+from question_deck import MemoryRotationStore, MmapDeck
+from state_backend import SQLiteStateBackend
+
+
+@pytest.fixture(params=["mmap", "sqlite"])
+def open_deck(request, tmp_path):
+    """
+    open_deck(size) -> deck على نفس الملف/القاعدة (الاستدعاء الثاني = إعادة فتح).
+    """
+    opened = []
+
+    def factory(size):
+        if request.param == "mmap":
+            deck = MmapDeck(str(tmp_path / "deck.bin"), size)
+        else:
+            backend = SQLiteStateBackend(str(tmp_path / "state.db"))
+            opened.append(backend)
+            deck = backend.deck("kt", [f"q{i}" for i in range(size)])
+        opened.append(deck)
+        return deck
+
+    yield factory
+    for item in reversed(opened):
+        item.close()
+
+
+def test_cycle_is_a_permutation(open_deck):
+    deck = open_deck(50)
+    for _ in range(3):
+        assert sorted(deck.draw() for _ in range(50)) == list(range(50))
+
+
+@pytest.mark.parametrize("size", [2, 3, 7])
+def test_new_cycle_never_starts_with_previous_last(open_deck, size):
+    deck = open_deck(size)
+    last = None
+    for _ in range(200):
+        cycle = [deck.draw() for _ in range(size)]
+        assert sorted(cycle) == list(range(size))
+        assert cycle[0] != last
+        last = cycle[-1]
+
+
+def test_single_question_deck_repeats_it(open_deck):
+    deck = open_deck(1)
+    assert [deck.draw() for _ in range(3)] == [0, 0, 0]
+
+
+def test_previously_used_questions_count_as_drawn(tmp_path):
+    deck = MmapDeck(str(tmp_path / "deck.bin"), 10, drawn=lambda: [2, 5, 5, 99])
+    try:
+        assert sorted(deck.draw() for _ in range(8)) == [0, 1, 3, 4, 6, 7, 8, 9]
+    finally:
+        deck.close()
+
+
+def test_reopening_continues_the_cycle(open_deck):
+    deck = open_deck(20)
+    first = [deck.draw() for _ in range(7)]
+    rest = [open_deck(20).draw() for _ in range(13)]
+    assert sorted(first + rest) == list(range(20))
+
+
+def test_growing_the_pool_keeps_what_was_drawn(open_deck):
+    deck = open_deck(10)
+    first = [deck.draw() for _ in range(6)]
+    deck.remap(15, None)
+    rest = [deck.draw() for _ in range(9)]
+    assert sorted(first + rest) == list(range(15))
+
+
+def test_remap_follows_moved_questions(open_deck):
+    deck = open_deck(4)
+    first = [deck.draw() for _ in range(2)]
+    # السؤال 0 حُذف، والباقي تحرّك مكاناً للخلف
+    deck.remap(3, [None, 0, 1, 2])
+    rest = [deck.draw() for _ in range(3 - len([i for i in first if i != 0]))]
+    moved = [i - 1 for i in first if i != 0]
+    assert sorted(moved + rest) == [0, 1, 2]
+
+
+# =============================
+# Per-chat Rotation
+# =============================
+@pytest.fixture(params=["memory", "sqlite"])
+def open_rotation(request, tmp_path):
+    opened = []
+
+    def factory():
+        if request.param == "memory":
+            return MemoryRotationStore(str(tmp_path / "rotation.bin"))
+        backend = SQLiteStateBackend(str(tmp_path / "state.db"))
+        opened.append(backend)
+        return backend.rotation_store(max_entries=1000, idle_ttl=86400)
+
+    yield factory
+    for backend in opened:
+        backend.close()
+
+
+@pytest.mark.parametrize("size", [2, 3, 10, 97])
+def test_rotation_covers_pool_and_never_repeats_across_cycles(open_rotation, size):
+    store = open_rotation()
+    last = None
+    for _ in range(60):
+        cycle = [store.draw(42, "kt", size) for _ in range(size)]
+        assert sorted(cycle) == list(range(size))
+        assert cycle[0] != last
+        last = cycle[-1]
+
+
+def test_rotation_is_independent_per_chat_and_game(open_rotation):
+    store = open_rotation()
+    draws = {(scope, game): [] for scope in (1, -100, 7) for game in ("kt", "wyr")}
+    for _ in range(12):
+        for (scope, game), seen in draws.items():
+            seen.append(store.draw(scope, game, 12))
+    for seen in draws.values():
+        assert sorted(seen) == list(range(12))
+
+
+def test_rotation_survives_a_restart(open_rotation):
+    store = open_rotation()
+    first = [store.draw(5, "who", 30) for _ in range(11)]
+    if isinstance(store, MemoryRotationStore):
+        store.save(store.snapshot())
+    reopened = open_rotation()
+    rest = [reopened.draw(5, "who", 30) for _ in range(19)]
+    assert sorted(first + rest) == list(range(30))
+
+
+def test_carry_over_finishes_the_old_cycle_first(open_rotation):
+    store = open_rotation()
+    first = [store.draw(5, "facts", 10) for _ in range(4)]
+    # أُضيفت 5 أسئلة في آخر القائمة
+    store.carry_over("facts", 10)
+    rest = [store.draw(5, "facts", 15) for _ in range(6)]
+    assert sorted(first + rest) == list(range(10))
+    assert sorted(store.draw(5, "facts", 15) for _ in range(15)) == list(range(15))
+
+
+def test_memory_rotation_evicts_least_recent_chats(tmp_path):
+    store = MemoryRotationStore(str(tmp_path / "rotation.bin"), max_entries=3)
+    for scope in range(5):
+        store.draw(scope, "kt", 10)
+    assert len(store) == 3
+    assert store.evicted == 2
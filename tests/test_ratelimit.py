@@ -0,0 +1,73 @@
+import pytest
+
+import ratelimit
+from ratelimit import KeyedRateLimiter, TokenBucket, retry_after_seconds
+
+
+@pytest.fixture
+def clock(monkeypatch):
+    now = [1000.0]
+    monkeypatch.setattr(ratelimit.time, "monotonic", lambda: now[0])
+    return now
+
+
+def test_bucket_allows_a_burst_then_refills(clock):
+    bucket = TokenBucket(2, capacity=3)
+    assert [bucket.try_acquire() for _ in range(4)] == [True, True, True, False]
+    clock[0] += 0.5
+    assert bucket.try_acquire()
+    assert not bucket.try_acquire()
+
+
+def test_bucket_reserve_returns_the_wait_in_arrival_order(clock):
+    bucket = TokenBucket(10, capacity=1)
+    assert bucket.reserve() == 0
+    assert bucket.reserve() == pytest.approx(0.1)
+    assert bucket.reserve() == pytest.approx(0.2)
+
+
+def test_bucket_pause_blocks_everyone(clock):
+    bucket = TokenBucket(10, capacity=10)
+    bucket.pause(5)
+    assert not bucket.try_acquire()
+    assert bucket.reserve() == pytest.approx(5)
+    clock[0] += 5
+    assert bucket.try_acquire()
+
+
+def test_keyed_limiter_keeps_keys_apart(clock):
+    limiter = KeyedRateLimiter(1, capacity=2)
+    assert [limiter.try_acquire("a") for _ in range(3)] == [True, True, False]
+    assert limiter.try_acquire("b")
+    assert limiter.reserve("a") == pytest.approx(1)
+
+
+def test_keyed_limiter_forgets_idle_full_keys(clock):
+    limiter = KeyedRateLimiter(1, capacity=2)
+    limiter.try_acquire("a")
+    limiter.try_acquire("b")
+    assert len(limiter) == 2
+    clock[0] += 2
+    limiter.try_acquire("c")
+    assert len(limiter) == 1
+    # مفتاح حُذف يعود برصيد ممتلئ، تماماً كما لو بقي
+    assert [limiter.try_acquire("a") for _ in range(3)] == [True, True, False]
+
+
+def test_keyed_limiter_caps_the_number_of_keys(clock):
+    limiter = KeyedRateLimiter(1, capacity=2, max_keys=3)
+    for key in range(10):
+        limiter.try_acquire(key)
+    assert len(limiter) <= 4
+
+
+class FakeRetryAfter:
+    def __init__(self, value):
+        self.retry_after = value
+
+
+def test_retry_after_seconds_accepts_numbers_and_timedeltas():
+    from datetime import timedelta
+
+    assert retry_after_seconds(FakeRetryAfter(3)) == 3.0
+    assert retry_after_seconds(FakeRetryAfter(timedelta(seconds=1.5))) == 1.5
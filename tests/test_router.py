@@ -0,0 +1,52 @@
+from normalize import may_shrink, normalize_text
+from router import PRIORITY_FIRST, MessageRouter
+
+
+def make_router() -> MessageRouter:
+    return MessageRouter(normalize_text, may_shrink)
+
+
+def test_route_matches_after_normalization():
+    router = make_router()
+
+    @router.route("تحدي", "صراحة")
+    async def truth_dare(update, context):
+        pass
+
+    assert router.match("تحدي") is truth_dare
+    assert router.match("صراحه") is truth_dare
+    assert router.match("تَحَدّي") is truth_dare
+    assert router.match("تحدي الآن") is None
+
+
+def test_replies_and_priorities():
+    router = make_router()
+    game = object()
+    first = object()
+    router.set_replies({"العاب": "رد سريع", "هلا": "هلا بك"})
+    router.add(["هلا"], game)
+    router.add(["العاب"], first, priority=PRIORITY_FIRST)
+
+    # الرد السريع يغلب اللعبة العادية، وPRIORITY_FIRST يغلب الرد السريع
+    assert router.match("هلا") == "هلا بك"
+    assert router.match("العاب") is first
+
+    router.set_replies({})
+    assert router.match("هلا") is game
+    assert router.match("العاب") is first
+
+
+def test_long_messages_are_rejected_without_normalizing():
+    calls = []
+
+    def normalize(text):
+        calls.append(text)
+        return normalize_text(text)
+
+    router = MessageRouter(normalize, may_shrink)
+    router.add(["كتت"], "kt")
+    calls.clear()
+    assert router.match("رسالة عادية أطول من كل الكلمات") is None
+    assert calls == []
+    # التشكيل قد يقصّر النص إلى طول الكلمة، فيُطبَّع
+    assert router.match("كـــتـــت") == "kt"
@@ -0,0 +1,59 @@
+import asyncio
+import sqlite3
+import time
+
+import pytest
+
+from state_backend import SQLiteStateBackend
+
+
+@pytest.fixture
+def backend(tmp_path):
+    backend = SQLiteStateBackend(str(tmp_path / "state.db"), busy_timeout=0.1)
+    yield backend
+    backend.close()
+
+
+def test_draw_gives_up_quickly_while_another_worker_writes(backend, tmp_path):
+    deck = backend.deck("kt", [f"q{i}" for i in range(5)])
+    other = sqlite3.connect(str(tmp_path / "state.db"), isolation_level=None)
+    other.execute("BEGIN IMMEDIATE")
+    try:
+        started = time.monotonic()
+        with pytest.raises(sqlite3.OperationalError):
+            deck.draw()
+        assert time.monotonic() - started < 1
+    finally:
+        other.execute("ROLLBACK")
+        other.close()
+    # الفشل لا يترك قفل الخيط محجوزاً
+    assert 0 <= deck.draw() < 5
+
+
+def test_persistence_shares_chat_data_between_workers(backend, tmp_path):
+    second = SQLiteStateBackend(str(tmp_path / "state.db"))
+    a, b = backend.persistence(), second.persistence()
+
+    async def scenario():
+        await a.update_chat_data(-1, {"game": "td"})
+        data = {}
+        await b.refresh_chat_data(-1, data)
+        stale = await a.get_chat_data()
+
+        # worker ب يبدأ لعبة جديدة، ثم worker أ يحفظ نسخته الفارغة القديمة
+        await b.update_chat_data(-1, {"game": "new"})
+        await a.update_chat_data(-1, {})
+        after = await b.get_chat_data()
+
+        await b.update_chat_data(-1, {})
+        gone = await a.get_chat_data()
+        return data, stale, after, gone
+
+    try:
+        data, stale, after, gone = asyncio.run(scenario())
+    finally:
+        second.close()
+    assert data == {"game": "td"}
+    assert stale == {-1: {"game": "td"}}
+    assert after == {-1: {"game": "new"}}
+    assert gone == {}
@@ -0,0 +1,122 @@
+import shutil
+
+from stats_store import StatsDelta, StatsJournal
+from timeseries import current_hour
+
+
+def make_journal(tmp_path, **kwargs) -> StatsJournal:
+    return StatsJournal(str(tmp_path / "stats.json"), str(tmp_path / "stats.journal"), **kwargs)
+
+
+def delta(messages=0, users=(), groups=(), removed=(), buckets=None, active=()) -> StatsDelta:
+    d = StatsDelta()
+    d.messages = messages
+    d.users.extend(users)
+    d.groups.extend(groups)
+    for chat_id in removed:
+        d.remove_group(chat_id)
+    d.buckets.update(buckets or {})
+    d.active.extend(active)
+    return d
+
+
+def snapshot_of(state: dict) -> dict:
+    return {
+        "total_messages": state["total_messages"],
+        "unique_users": list(state["unique_users"]),
+        "unique_groups": list(state["unique_groups"]),
+        "unique_private_chats": list(state["unique_private_chats"]),
+        "activity": state["activity"].to_dict(),
+        "active_users": state["active_users"].to_dict(),
+    }
+
+
+def test_replay_applies_every_record(tmp_path):
+    hour = current_hour()
+    journal = make_journal(tmp_path)
+    journal.load()
+    journal.append(delta(messages=3, users=[1, 2], groups=[-10, -11], buckets={hour: 3}, active=[(hour // 24, 1)]))
+    journal.append(delta(messages=2, users=[2, 3], removed=[-10], buckets={hour: 2}))
+
+    state = make_journal(tmp_path).load()
+    assert state["total_messages"] == 5
+    assert sorted(state["unique_users"]) == [1, 2, 3]
+    assert sorted(state["unique_groups"]) == [-11]
+    assert state["activity"].hours.get(hour) == 5
+    assert state["active_users"].dau(hour // 24) == 1
+
+
+def test_removal_is_written_before_additions_in_the_same_batch(tmp_path):
+    journal = make_journal(tmp_path)
+    journal.load()
+    journal.append(delta(groups=[-10]))
+    # حذف ثم إضافة من جديد (البوت أُضيف للجروب مرة أخرى)
+    d = delta(removed=[-10])
+    d.merge(delta(groups=[-10]))
+    journal.append(d)
+    assert sorted(make_journal(tmp_path).load()["unique_groups"]) == [-10]
+
+
+def test_torn_last_line_is_ignored(tmp_path):
+    journal = make_journal(tmp_path)
+    journal.load()
+    journal.append(delta(messages=4, users=[1]))
+    with open(journal.journal_path, "a", encoding="utf-8") as f:
+        f.write("u\t")  # انقطاع أثناء الكتابة
+
+    state = make_journal(tmp_path).load()
+    assert state["total_messages"] == 4
+    assert list(state["unique_users"]) == [1]
+
+
+def test_compaction_resets_journal_and_keeps_totals(tmp_path):
+    journal = make_journal(tmp_path, max_bytes=16)
+    journal.load()
+    journal.append(delta(messages=7, users=[1, 2]))
+    assert journal.needs_compaction()
+
+    journal.compact(snapshot_of(make_journal(tmp_path).load()))
+    assert journal.generation == 1
+    assert not journal.needs_compaction()
+    journal.append(delta(messages=1, users=[3]))
+
+    state = make_journal(tmp_path).load()
+    assert state["total_messages"] == 8
+    assert sorted(state["unique_users"]) == [1, 2, 3]
+
+
+def test_stale_generation_journal_is_not_counted_twice(tmp_path):
+    journal = make_journal(tmp_path)
+    journal.load()
+    journal.append(delta(messages=7, users=[1]))
+    # انقطاع بين كتابة اللقطة وتفريغ السجل: يبقى سجل الجيل القديم بجانب لقطة الجيل الجديد
+    shutil.copy(journal.journal_path, tmp_path / "old.journal")
+    journal.compact(snapshot_of(make_journal(tmp_path).load()))
+    shutil.copy(tmp_path / "old.journal", journal.journal_path)
+
+    reloaded = make_journal(tmp_path)
+    state = reloaded.load()
+    assert state["total_messages"] == 7
+    assert reloaded.generation == 1
+    with open(journal.journal_path, encoding="utf-8") as f:
+        assert f.read() == "#gen\t1\n"
+
+    # السجل الجديد يُطبّق بعد ذلك بشكل عادي
+    reloaded.append(delta(messages=1))
+    assert make_journal(tmp_path).load()["total_messages"] == 8
+
+
+def test_failed_append_is_kept_for_the_next_save(tmp_path):
+    journal = make_journal(tmp_path)
+    journal.load()
+    journal.journal_path = str(tmp_path / "missing" / "stats.journal")
+    try:
+        journal.append(delta(messages=2, users=[1]))
+    except OSError:
+        pass
+    journal.journal_path = str(tmp_path / "stats.journal")
+    journal.append(delta(messages=1, users=[2]))
+
+    state = make_journal(tmp_path).load()
+    assert state["total_messages"] == 3
+    assert sorted(state["unique_users"]) == [1, 2]
@@ -0,0 +1,111 @@
+import calendar
+import json
+
+from stats_store import StatsJournal
+from timeseries import TIER_SIZES, ActivitySeries, Ring, hour_of_bucket, tier_slots
+
+
+def test_ring_keeps_only_the_last_size_slots():
+    ring = Ring(4)
+    for slot in range(10, 14):
+        ring.add(slot, slot)
+    assert ring.last(4) == [(10, 10), (11, 11), (12, 12), (13, 13)]
+
+    # التقدم خانتين يصفّر الخانتين اللتين يُعاد استخدامهما فقط
+    ring.add(15)
+    assert ring.last(4) == [(12, 12), (13, 13), (14, 0), (15, 1)]
+    assert ring.get(11) == 0
+
+
+def test_ring_jump_past_its_size_clears_everything():
+    ring = Ring(4)
+    ring.add(10, 5)
+    ring.add(100, 1)
+    assert ring.last(4) == [(97, 0), (98, 0), (99, 0), (100, 1)]
+
+
+def test_ring_rejects_slots_older_than_the_window():
+    ring = Ring(4)
+    ring.add(10)
+    assert ring.add(8, 2)
+    assert not ring.add(6, 2)
+    assert ring.get(8) == 2
+    assert ring.get(6) == 0
+
+
+def test_ring_list_round_trip_drops_leading_zeros():
+    ring = Ring(6)
+    ring.add(20, 3)
+    ring.add(22, 4)
+    data = ring.to_list()
+    assert data == [22, 3, 0, 4]
+
+    loaded = Ring(6)
+    loaded.load_list(data)
+    assert loaded.last(6) == ring.last(6)
+    assert Ring(6).to_list() == []
+
+
+def test_hours_older_than_the_ring_stay_in_day_and_week_totals():
+    series = ActivitySeries()
+    start = hour_of_bucket("2024-01-01 00:00")
+    series.add(start, 5)
+    series.add(start + TIER_SIZES["h"] + 1, 1)  # الساعة الأولى خرجت من ring الساعات
+
+    assert series.hours.get(start) == 0
+    assert series.days.get(start // 24) == 5
+    assert series.weeks.get(tier_slots(start)[2]) == 5
+
+
+def test_weeks_start_on_monday():
+    sunday = hour_of_bucket("2023-12-31 23:00")
+    monday = hour_of_bucket("2024-01-01 00:00")
+    assert calendar.weekday(2024, 1, 1) == 0
+    assert tier_slots(monday)[2] == tier_slots(sunday)[2] + 1
+    assert tier_slots(monday + 6 * 24 + 23)[2] == tier_slots(monday)[2]
+
+
+def test_legacy_bucket_keys_migrate():
+    series = ActivitySeries.from_buckets({
+        "2024-01-01 10:00": 2,
+        "2024-01-01 11:00": 3,
+        "not a date": 9,
+    })
+    hour = hour_of_bucket("2024-01-01 10:00")
+    assert series.hours.get(hour) == 2
+    assert series.hours.get(hour + 1) == 3
+    assert series.days.get(hour // 24) == 5
+
+    # مفتاح رقمي (السجلات الجديدة) والقديم يصلان لنفس الخانة
+    series.add_bucket(str(hour), 1)
+    series.add_bucket("2024-01-01 10:00", 1)
+    assert series.hours.get(hour) == 4
+
+
+def test_series_round_trips_and_merges():
+    series = ActivitySeries()
+    hour = hour_of_bucket("2024-03-05 07:00")
+    for h in range(hour - 30, hour + 1):
+        series.add(h, h % 7)
+
+    loaded = ActivitySeries.from_dict(json.loads(json.dumps(series.to_dict())))
+    assert loaded.to_dict() == series.to_dict()
+
+    loaded.merge(series)
+    assert loaded.hours.get(hour) == 2 * series.hours.get(hour)
+    assert loaded.days.get(hour // 24) == 2 * series.days.get(hour // 24)
+
+
+def test_legacy_snapshot_and_journal_migrate_on_load(tmp_path):
+    snapshot = tmp_path / "stats.json"
+    journal = tmp_path / "stats.journal"
+    snapshot.write_text(json.dumps({
+        "total_messages": 3,
+        "activity_buckets": {"2024-01-01 10:00": 3},
+    }), encoding="utf-8")
+    journal.write_text("m\t1\nb\t2024-01-01 10:00\t1\n", encoding="utf-8")
+
+    state = StatsJournal(str(snapshot), str(journal)).load()
+    hour = hour_of_bucket("2024-01-01 10:00")
+    assert state["total_messages"] == 4
+    assert state["activity"].hours.get(hour) == 4
@@ -0,0 +1,127 @@
+import asyncio
+from types import SimpleNamespace
+
+from webhook_server import ChatOrderedUpdateProcessor, WebhookASGIApp
+
+
+def update_for(chat_id):
+    chat = SimpleNamespace(id=chat_id) if chat_id is not None else None
+    return SimpleNamespace(effective_chat=chat)
+
+
+def test_updates_of_one_chat_run_one_at_a_time_in_order():
+    async def scenario():
+        processor = ChatOrderedUpdateProcessor(8)
+        events = []
+
+        async def handle(name, delay):
+            events.append(("start", name))
+            await asyncio.sleep(delay)
+            events.append(("end", name))
+
+        # الأول أبطأ: لو تداخلت تحديثات المحادثة لبدأ الثاني قبل انتهاء الأول
+        await asyncio.gather(*(
+            processor.process_update(update_for(-1), handle(n, 0.03 if n == 0 else 0))
+            for n in range(4)
+        ))
+        return events, processor.queued
+
+    events, queued = asyncio.run(scenario())
+    assert events == [(kind, n) for n in range(4) for kind in ("start", "end")]
+    assert queued == 0
+
+
+def test_a_busy_chat_does_not_hold_slots_of_other_chats():
+    async def scenario():
+        processor = ChatOrderedUpdateProcessor(2)
+        release = asyncio.Event()
+        finished = []
+
+        async def blocked():
+            await release.wait()
+
+        async def instant(name):
+            finished.append(name)
+
+        busy = [
+            asyncio.ensure_future(processor.process_update(update_for(-1), blocked()))
+            for _ in range(5)
+        ]
+        await asyncio.sleep(0)
+        # قروب مزدحم بخمس تحديثات ومكانان فقط: باقي المحادثات تُعالج فوراً
+        await asyncio.wait_for(asyncio.gather(
+            processor.process_update(update_for(-2), instant("other group")),
+            processor.process_update(update_for(None), instant("no chat")),
+        ), 1)
+        waiting = processor.queued
+        release.set()
+        await asyncio.gather(*busy)
+        return finished, waiting, processor.queued
+
+    finished, waiting, queued = asyncio.run(scenario())
+    assert sorted(finished) == ["no chat", "other group"]
+    assert waiting == 5
+    assert queued == 0
+
+
+def test_on_chat_update_counts_each_update():
+    async def scenario():
+        seen = []
+        processor = ChatOrderedUpdateProcessor(4, on_chat_update=seen.append)
+
+        async def noop():
+            pass
+
+        for chat_id in (-1, 5, -1, None):
+            await processor.process_update(update_for(chat_id), noop())
+        return seen
+
+    assert asyncio.run(scenario()) == [-1, 5, -1]
+
+
+class FakeApplication:
+    def __init__(self, calls):
+        self.calls = calls
+        self.running = False
+
+    async def initialize(self):
+        self.calls.append("initialize")
+
+    async def start(self):
+        self.running = True
+        self.calls.append("start")
+
+    async def stop(self):
+        self.running = False
+        self.calls.append("stop")
+
+    async def shutdown(self):
+        self.calls.append("shutdown")
+
+
+def test_lifespan_stops_the_application_before_on_shutdown():
+    async def scenario():
+        calls = []
+
+        async def on_startup():
+            calls.append("on_startup")
+
+        async def on_shutdown():
+            calls.append("on_shutdown")
+
+        app = WebhookASGIApp(FakeApplication(calls), None, on_startup=on_startup, on_shutdown=on_shutdown)
+        messages = iter([{"type": "lifespan.startup"}, {"type": "lifespan.shutdown"}])
+        sent = []
+
+        async def receive():
+            return next(messages)
+
+        async def send(message):
+            sent.append(message["type"])
+
+        await app({"type": "lifespan"}, receive, send)
+        return calls, sent
+
+    calls, sent = asyncio.run(scenario())
+    assert calls == ["initialize", "start", "on_startup", "stop", "shutdown", "on_shutdown"]
+    assert sent == ["lifespan.startup.complete", "lifespan.shutdown.complete"]
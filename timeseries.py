@@ -0,0 +1,183 @@
+# ============================================
+# Time Series - عدّاد النشاط بحجم ثابت (ring buffers)
+#
+# ثلاث طبقات: ساعات (آخر أسبوع)، أيام (آخر 90 يوماً)، أسابيع (آخر سنتين).
+# كل رسالة تزيد خانة واحدة في كل ring: O(1) بدون strftime، ورقم الساعة
+# هو int(time.time()) // 3600 (UTC). الساعات الأقدم من الـ ring تبقى في
+# مجموع اليوم والأسبوع فقط (rollup)، فالذاكرة وحجم ملف الإحصائيات ثابتان
+# مهما طال التشغيل.
+# ============================================
+
+from array import array
+from typing import List, Optional, Tuple
+import calendar
+import time
+
+HOURS_PER_DAY = 24
+HOURS_PER_WEEK = 24 * 7
+# 1970-01-01 كان خميساً: إزاحة 3 أيام تجعل الأسبوع يبدأ من الاثنين
+WEEK_OFFSET_HOURS = 3 * 24
+
+LEGACY_BUCKET_FORMAT = "%Y-%m-%d %H:00"
+
+# اسم كل طبقة (في الملفات وفي SQLite) وعدد خاناتها
+TIERS = ("h", "d", "w")
+TIER_SIZES = {"h": 24 * 7, "d": 90, "w": 104}
+
+
+def current_hour() -> int:
+    return int(time.time()) // 3600
+
+
+def tier_slots(hour: int) -> Tuple[int, int, int]:
+    """
+    رقم الساعة -> (ساعة، يوم، أسبوع) بنفس ترتيب TIERS.
+    """
+    return hour, hour // HOURS_PER_DAY, (hour + WEEK_OFFSET_HOURS) // HOURS_PER_WEEK
+
+
+def hour_of_bucket(key: str) -> Optional[int]:
+    """
+    مفتاح الصيغة القديمة "YYYY-MM-DD HH:00" -> رقم الساعة.
+    """
+    try:
+        return calendar.timegm(time.strptime(key, LEGACY_BUCKET_FORMAT)) // 3600
+    except (TypeError, ValueError):
+        return None
+
+
+class Ring:
+    """
+    عدّادات آخر size خانة. head = رقم آخر خانة (-1 = فارغ).
+    """
+
+    __slots__ = ("size", "counts", "head")
+
+    def __init__(self, size: int):
+        self.size = size
+        self.counts = array("q", bytes(8 * size))
+        self.head = -1
+
+    def add(self, slot: int, n: int = 1) -> bool:
+        size = self.size
+        head = self.head
+        if slot > head:
+            if head < 0 or slot - head >= size:
+                self.counts = array("q", bytes(8 * size))
+            else:
+                counts = self.counts
+                for s in range(head + 1, slot + 1):
+                    counts[s % size] = 0
+            self.head = slot
+        elif slot <= head - size:
+            return False  # أقدم من الـ ring
+        self.counts[slot % self.size] += n
+        return True
+
+    def get(self, slot: int) -> int:
+        if slot > self.head or slot <= self.head - self.size:
+            return 0
+        return self.counts[slot % self.size]
+
+    def last(self, n: int, end: Optional[int] = None) -> List[Tuple[int, int]]:
+        """
+        آخر n خانة بالترتيب (الأقدم أولاً) حتى end (الافتراضي head).
+        """
+        if end is None:
+            end = self.head
+        return [(s, self.get(s)) for s in range(end - n + 1, end + 1)]
+
+    def to_list(self) -> list:
+        """
+        [head, عدّادات من الأقدم للأحدث] مع حذف الأصفار من البداية.
+        """
+        if self.head < 0:
+            return []
+        values = [c for _, c in self.last(self.size)]
+        first = next((i for i, c in enumerate(values) if c), len(values))
+        return [self.head] + values[first:]
+
+    def load_list(self, data: list) -> None:
+        if not data:
+            return
+        head, values = data[0], data[1:]
+        for i, count in enumerate(values):
+            if count:
+                self.add(head - len(values) + 1 + i, count)
+        self.add(head, 0)
+
+
+class ActivitySeries:
+    __slots__ = ("hours", "days", "weeks")
+
+    def __init__(self):
+        self.hours = Ring(TIER_SIZES["h"])
+        self.days = Ring(TIER_SIZES["d"])
+        self.weeks = Ring(TIER_SIZES["w"])
+
+    def tier(self, name: str) -> Ring:
+        return {"h": self.hours, "d": self.days, "w": self.weeks}[name]
+
+    def add(self, hour: int, n: int = 1) -> None:
+        self.hours.add(hour, n)
+        self.days.add(hour // HOURS_PER_DAY, n)
+        self.weeks.add((hour + WEEK_OFFSET_HOURS) // HOURS_PER_WEEK, n)
+
+    def add_bucket(self, key, n: int) -> None:
+        """
+        key: رقم ساعة (أو نصه)، أو مفتاح الصيغة القديمة (سجلات/ملفات سابقة).
+        """
+        try:
+            hour = int(key)
+        except ValueError:
+            hour = hour_of_bucket(key)
+            if hour is None:
+                return
+        self.add(hour, n)
+
+    def last_hours(self, n: int) -> List[Tuple[int, int]]:
+        return self.hours.last(n, max(self.hours.head, current_hour()))
+
+    def last_days(self, n: int) -> List[Tuple[int, int]]:
+        return self.days.last(n, max(self.days.head, current_hour() // HOURS_PER_DAY))
+
+    def merge(self, other: "ActivitySeries") -> None:
+        """
+        يضيف عدّادات other (للدمج بين الـ workers أو عند التحميل).
+        """
+        for name in TIERS:
+            mine, theirs = self.tier(name), other.tier(name)
+            for slot, count in theirs.last(theirs.size):
+                if count:
+                    mine.add(slot, count)
+
+    def to_dict(self) -> dict:
+        return {name: self.tier(name).to_list() for name in TIERS}
+
+    @classmethod
+    def from_dict(cls, data: dict) -> "ActivitySeries":
+        series = cls()
+        for name in TIERS:
+            series.tier(name).load_list(data.get(name, []))
+        return series
+
+    @classmethod
+    def from_rows(cls, rows) -> "ActivitySeries":
+        """
+        من صفوف (طبقة، خانة، عدد) كما في جدول SQLite.
+        """
+        series = cls()
+        for name, slot, count in sorted(rows, key=lambda r: r[1]):
+            if name in TIER_SIZES:
+                series.tier(name).add(slot, count)
+        return series
+
+    @classmethod
+    def from_buckets(cls, buckets: dict) -> "ActivitySeries":
+        """
+        من dict الصيغة القديمة {"YYYY-MM-DD HH:00": count}.
+        """
+        series = cls()
+        for key in sorted(buckets):
+            series.add_bucket(key, buckets[key])
+        return series
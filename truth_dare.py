@@ -0,0 +1,168 @@
+# ============================================
+# Truth/Dare Model - حالة جلسة تحدي/صراحة في القروب
+#
+# كل عمليات اللعبة O(1):
+# - الانضمام: إضافة إلى dict (بترتيب الانضمام).
+# - الدور: اللاعب التالي من deque؛ عند انتهاء الدورة تُخلط قائمة
+#   اللاعبين مرة واحدة (O(n) كل n دور، أي O(1) لكل دور).
+# - التحويل: تعديل حقلين.
+#
+# الحفظ (pickle عبر chat_state) يستخدم to_state: tuple مسطحة بدون أسماء
+# الحقول، والصيغة القديمة (dict of dicts) تُحوَّل بـ from_legacy.
+# ============================================
+
+from collections import deque
+from typing import Deque, Dict, Optional
+import random
+import time
+
+COLLECTING = "collecting"
+WAITING_START = "waiting_start"
+RUNNING = "running"
+ENDED = "ended"
+
+# الترتيب هنا هو الرمز المحفوظ، فلا يُغيَّر (الإضافة في الآخر فقط)
+STATUSES = (COLLECTING, WAITING_START, RUNNING, ENDED)
+CHOICES = (None, "truth", "dare")
+
+STATE_VERSION = 1
+
+
+class Participant:
+    __slots__ = ("id", "name", "username")
+
+    def __init__(self, id: int, name: str, username: Optional[str] = None):
+        self.id = id
+        self.name = name
+        self.username = username
+
+    @property
+    def mention(self) -> str:
+        return f"@{self.username}" if self.username else self.name
+
+
+class TruthDareGame:
+    __slots__ = (
+        "status",
+        "starter_id",
+        "participants",
+        "queue",
+        "current_player_id",
+        "final_choice",
+        "switched",
+        "join_message_id",
+        "join_deadline",
+        "updated",
+    )
+
+    def __init__(self, starter_id: int, join_deadline: float = 0.0):
+        self.status = COLLECTING
+        self.starter_id = starter_id
+        self.participants: Dict[int, Participant] = {}
+        self.queue: Deque[int] = deque()  # من بقي عليهم الدور في الدورة الحالية
+        self.current_player_id: Optional[int] = None
+        self.final_choice: Optional[str] = None
+        self.switched = False
+        self.join_message_id: Optional[int] = None
+        self.join_deadline = join_deadline
+        self.updated = time.time()
+
+    def touch(self) -> "TruthDareGame":
+        self.updated = time.time()
+        return self
+
+    # ---------- اللعب ----------
+    def join(self, user_id: int, name: str, username: Optional[str] = None) -> bool:
+        """
+        يرجع False إن كان المستخدم منضماً بالفعل.
+        """
+        if user_id in self.participants:
+            return False
+        self.participants[user_id] = Participant(user_id, name, username)
+        return True
+
+    def next_player(self) -> Optional[Participant]:
+        """
+        لاعب عشوائي بدون تكرار حتى يمر الدور على الجميع، ثم دورة جديدة.
+        """
+        if not self.participants:
+            return None
+        if not self.queue:
+            order = list(self.participants)
+            random.shuffle(order)
+            self.queue.extend(order)
+        player_id = self.queue.popleft()
+        self.current_player_id = player_id
+        self.final_choice = None
+        self.switched = False
+        return self.participants[player_id]
+
+    def choose(self, choice: str) -> None:
+        self.final_choice = choice
+        self.switched = False
+
+    def switch(self, choice: str) -> bool:
+        """
+        تحويل واحد فقط لكل دور. يرجع False إن سبق التحويل.
+        """
+        if self.switched:
+            return False
+        self.final_choice = choice
+        self.switched = True
+        return True
+
+    # ---------- الحفظ ----------
+    def to_state(self) -> tuple:
+        people = []
+        for p in self.participants.values():
+            people.extend((p.id, p.name, p.username))
+        return (
+            STATE_VERSION,
+            STATUSES.index(self.status),
+            self.starter_id,
+            tuple(people),
+            tuple(self.queue),
+            self.current_player_id,
+            CHOICES.index(self.final_choice),
+            self.switched,
+            self.join_message_id,
+            self.join_deadline,
+            self.updated,
+        )
+
+    @classmethod
+    def from_state(cls, state: tuple) -> "TruthDareGame":
+        (_, status, starter_id, people, queue, current, choice,
+         switched, join_message_id, join_deadline, updated) = state
+        game = cls(starter_id, join_deadline)
+        game.status = STATUSES[status]
+        for i in range(0, len(people), 3):
+            game.join(*people[i:i + 3])
+        game.queue.extend(queue)
+        game.current_player_id = current
+        game.final_choice = CHOICES[choice]
+        game.switched = switched
+        game.join_message_id = join_message_id
+        game.updated = updated
+        return game
+
+    def __reduce__(self):
+        return (TruthDareGame.from_state, (self.to_state(),))
+
+    @classmethod
+    def from_legacy(cls, data: dict) -> "TruthDareGame":
+        """
+        الصيغة القديمة المحفوظة قبل هذا الـ model (dict فيه participants كـ dict of dicts).
+        """
+        game = cls(data.get("starter_id"), data.get("join_deadline", 0.0))
+        game.status = data.get("status", ENDED)
+        for p in data.get("participants", {}).values():
+            game.join(p["id"], p.get("name") or str(p["id"]), p.get("username"))
+        game.queue.extend(i for i in data.get("remaining_players") or () if i in game.participants)
+        game.current_player_id = data.get("current_player_id")
+        round_state = data.get("current_round") or {}
+        game.final_choice = round_state.get("final_choice")
+        game.switched = round_state.get("switched", False)
+        game.join_message_id = data.get("join_message_id")
+        game.updated = data.get("updated", time.time())
+        return game
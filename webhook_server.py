@@ -0,0 +1,177 @@
+# ============================================
+# Async Webhook Server (ASGI) - بديل Flask + run_until_complete
+# تشغيل: uvicorn main:asgi_app
+#   أو: gunicorn main:asgi_app -k uvicorn.workers.UvicornWorker
+# ============================================
+
+from typing import Awaitable, Callable, Dict, Optional
+import asyncio
+import json
+
+from telegram import Update
+from telegram.ext import Application, BaseUpdateProcessor
+
+
+class ChatOrderedUpdateProcessor(BaseUpdateProcessor):
+    """
+    يعالج التحديثات بالتوازي (حتى max_concurrent_updates في نفس الوقت)،
+    لكن تحديثات المحادثة الواحدة تُعالج بالترتيب واحدة تلو الأخرى،
+    حتى لا تتداخل خطوات لعبة تحدي/صراحة داخل نفس القروب.
+    """
+
+    def __init__(
+        self,
+        max_concurrent_updates: int,
+        on_chat_update: Optional[Callable[[int], None]] = None,
+    ):
+        super().__init__(max_concurrent_updates)
+        self._chat_locks: Dict[int, asyncio.Lock] = {}
+        self._chat_waiters: Dict[int, int] = {}
+        # يُستدعى بمعرّف المحادثة لكل تحديث (عدّاد المحادثات الأكثر نشاطاً)
+        self.on_chat_update = on_chat_update
+
+    @property
+    def queued(self) -> int:
+        """
+        التحديثات قيد المعالجة أو المنتظرة خلف تحديث من نفس المحادثة.
+        """
+        return sum(self._chat_waiters.values())
+
+    @staticmethod
+    def _chat_key(update: object) -> Optional[int]:
+        chat = getattr(update, "effective_chat", None)
+        return chat.id if chat else None
+
+    async def process_update(self, update: object, coroutine: Awaitable) -> None:
+        """
+        نأخذ قفل المحادثة قبل مكان التوازي (الـ semaphore): تحديثات قروب
+        مزدحم تنتظر دورها بدون أن تحجز أماكن باقي المحادثات.
+        (BaseUpdateProcessor.process_update يأخذ الـ semaphore أولاً ثم
+        يستدعي do_process_update، فكانت المنتظرة تحجز أماكنها.)
+        """
+        chat_id = self._chat_key(update)
+        if chat_id is None:
+            async with self._semaphore:
+                await self.do_process_update(update, coroutine)
+            return
+        if self.on_chat_update is not None:
+            self.on_chat_update(chat_id)
+
+        lock = self._chat_locks.get(chat_id)
+        if lock is None:
+            lock = self._chat_locks[chat_id] = asyncio.Lock()
+        self._chat_waiters[chat_id] = self._chat_waiters.get(chat_id, 0) + 1
+        try:
+            async with lock:
+                async with self._semaphore:
+                    await self.do_process_update(update, coroutine)
+        finally:
+            # نحذف القفل عند انتهاء آخر تحديث للمحادثة حتى لا تكبر الذاكرة
+            left = self._chat_waiters[chat_id] - 1
+            if left:
+                self._chat_waiters[chat_id] = left
+            else:
+                del self._chat_waiters[chat_id]
+                del self._chat_locks[chat_id]
+
+    async def do_process_update(self, update: object, coroutine: Awaitable) -> None:
+        await coroutine
+
+    async def initialize(self) -> None:
+        pass
+
+    async def shutdown(self) -> None:
+        pass
+
+
+async def _read_body(receive) -> bytes:
+    chunks = []
+    while True:
+        message = await receive()
+        chunks.append(message.get("body", b""))
+        if not message.get("more_body"):
+            return b"".join(chunks)
+
+
+async def _respond(send, status: int, body: bytes = b"OK") -> None:
+    await send({
+        "type": "http.response.start",
+        "status": status,
+        "headers": [
+            (b"content-type", b"text/plain; charset=utf-8"),
+            (b"content-length", str(len(body)).encode()),
+        ],
+    })
+    await send({"type": "http.response.body", "body": body})
+
+
+class WebhookASGIApp:
+    """
+    تطبيق ASGI واحد يعمل على نفس event loop الخاص بالبوت:
+    - POST {webhook_path}: يحوّل الطلب إلى Update ويضعه في app.update_queue
+      ويرجع 200 فوراً؛ المعالجة الفعلية تتم في الخلفية عبر update_processor.
+    - أي مسار آخر (/ و /dashboard ...) يُمرَّر إلى fallback (تطبيق Flask).
+    """
+
+    def __init__(
+        self,
+        application: Application,
+        fallback,
+        webhook_path: str = "/webhook",
+        on_startup: Optional[Callable[[], Awaitable[None]]] = None,
+        on_shutdown: Optional[Callable[[], Awaitable[None]]] = None,
+    ):
+        self.application = application
+        self.fallback = fallback
+        self.webhook_path = webhook_path
+        self.on_startup = on_startup
+        self.on_shutdown = on_shutdown
+
+    async def _lifespan(self, receive, send) -> None:
+        while True:
+            message = await receive()
+            if message["type"] == "lifespan.startup":
+                try:
+                    await self.application.initialize()
+                    await self.application.start()
+                    if self.on_startup:
+                        await self.on_startup()
+                except Exception as e:
+                    await send({"type": "lifespan.startup.failed", "message": str(e)})
+                    return
+                await send({"type": "lifespan.startup.complete"})
+            elif message["type"] == "lifespan.shutdown":
+                # نفس ترتيب وضع polling (post_shutdown بعد stop و shutdown):
+                # stop ينتظر الـ handlers الجارية، وقد تنتظر رسائل في طابور
+                # الإرسال، فلا يُوقَف الطابور (on_shutdown) قبلها
+                try:
+                    if self.application.running:
+                        await self.application.stop()
+                    await self.application.shutdown()
+                    if self.on_shutdown:
+                        await self.on_shutdown()
+                finally:
+                    await send({"type": "lifespan.shutdown.complete"})
+                return
+
+    async def _webhook(self, scope, receive, send) -> None:
+        if scope["method"] != "POST":
+            await _respond(send, 405, b"Method Not Allowed")
+            return
+        body = await _read_body(receive)
+        try:
+            update = Update.de_json(json.loads(body), self.application.bot)
+        except Exception:
+            await _respond(send, 400, b"Bad Request")
+            return
+        await self.application.update_queue.put(update)
+        await _respond(send, 200)
+
+    async def __call__(self, scope, receive, send) -> None:
+        if scope["type"] == "lifespan":
+            await self._lifespan(receive, send)
+            return
+        if scope["type"] == "http" and scope["path"] == self.webhook_path:
+            await self._webhook(scope, receive, send)
+            return
+        await self.fallback(scope, receive, send)